@@ -30,16 +30,27 @@ class ASTVisitor:
     def visit_ifexpr(self, env: Env, node: IfExpr):
         pass
 
+    def visit_load(self, env: Env, node: Load):
+        pass
+
 
-# Element interface
+# Element interface. Nodes declare __slots__: large programs have millions
+# of them, and a slotted object is about half the size of one with a __dict__.
 class ASTNode:
+    __slots__ = ()
+
     def accept(self, env: Env, visitor: ASTVisitor):
         pass
 
+    def children(self) -> list[ASTNode]:
+        return []
+
 
 # AST nodes (call the specific visitor method)
 
 class Program(ASTNode):
+    __slots__ = ('exprs',)
+
     def __init__(self):
         self.exprs: list[ASTNode] = []
 
@@ -49,8 +60,13 @@ class Program(ASTNode):
     def accept(self, env: Env, visitor: ASTVisitor):
         return visitor.visit_program(env, self)
 
+    def children(self):
+        return self.exprs
+
 
 class Number(ASTNode):
+    __slots__ = ('value',)
+
     def __init__(self, value: int | float):
         self.value = value
 
@@ -59,33 +75,53 @@ class Number(ASTNode):
 
 
 class Var(ASTNode):
+    __slots__ = ('name', 'depth', 'slot')
+
     def __init__(self, name: str):
         self.name = name
+        # Lexical address, assigned by the Resolver (None for builtins)
+        self.depth: int | None = None
+        self.slot: int | None = None
 
     def accept(self, env: Env, visitor: ASTVisitor):
         return visitor.visit_var(env, self)
 
 
 class Binding(ASTNode):
+    __slots__ = ('name', 'expr', 'slot', 'redeclared')
+
     def __init__(self, name: str, expr: ASTNode):
         self.name = name
         self.expr = expr
+        # Assigned by the Resolver: global slot if this binding extends the environment
+        self.slot: int | None = None
+        self.redeclared = False
 
     def accept(self, env: Env, visitor: ASTVisitor):
         return visitor.visit_binding(env, self)
 
+    def children(self):
+        return [self.expr]
+
 
 class FunctionDef_(ASTNode):
-    def __init__(self, param: str, body: ASTNode):
+    __slots__ = ('param', 'body', 'name')
+
+    def __init__(self, param: str, body: ASTNode, name: str = '<lambda>'):
         self.param = param
         self.body = body
-        self.local_env = Env()
+        self.name = name
 
     def accept(self, env: Env, visitor: ASTVisitor):
         return visitor.visit_functiondef(env, self)
 
+    def children(self):
+        return [self.body]
+
 
 class FunctionCall(ASTNode):
+    __slots__ = ('func', 'arg')
+
     def __init__(self, func: ASTNode, arg: ASTNode):
         self.func = func
         self.arg = arg
@@ -93,27 +129,46 @@ class FunctionCall(ASTNode):
     def accept(self, env: Env, visitor: ASTVisitor):
         return visitor.visit_functioncall(env, self)
 
+    def children(self):
+        return [self.func, self.arg]
+
 
 class BinaryOp(ASTNode):
+    __slots__ = ('left', 'op', 'right', 'numeric', 'kernel')
+
     def __init__(self, left: ASTNode, op: str, right: ASTNode):
         self.left = left
         self.op = op
         self.right = right
+        self.numeric = False  # Both operands are numbers, set by the TypeChecker
+        self.kernel = None    # Compiled form of the tree below, set by the Specialiser
 
     def accept(self, env: Env, visitor: ASTVisitor):
         return visitor.visit_binaryop(env, self)
 
+    def children(self):
+        return [self.left, self.right]
+
 
 class UnaryOp(ASTNode):
+    __slots__ = ('op', 'right', 'numeric', 'kernel')
+
     def __init__(self, op: str, right: ASTNode):
         self.op = op
         self.right = right
-        
+        self.numeric = False
+        self.kernel = None
+
     def accept(self, env: Env, visitor: ASTVisitor):
         return visitor.visit_unaryop(env, self)
 
+    def children(self):
+        return [self.right]
+
 
 class IfExpr(ASTNode):
+    __slots__ = ('cond', 'then_expr', 'else_expr')
+
     def __init__(self, cond: ASTNode, then_expr: ASTNode, else_expr: ASTNode):
         self.cond = cond
         self.then_expr = then_expr
@@ -121,3 +176,18 @@ class IfExpr(ASTNode):
 
     def accept(self, env: Env, visitor: ASTVisitor):
         return visitor.visit_ifexpr(env, self)
+
+    def children(self):
+        return [self.cond, self.then_expr, self.else_expr]
+
+
+class Load(ASTNode):
+    # The vector in a data file, read each time it is evaluated: what
+    # `!load(name, file)` binds `name` to
+    __slots__ = ('path',)
+
+    def __init__(self, path: str):
+        self.path = path  # Absolute
+
+    def accept(self, env: Env, visitor: ASTVisitor):
+        return visitor.visit_load(env, self)
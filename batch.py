@@ -0,0 +1,85 @@
+import io
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stderr, redirect_stdout
+
+
+class FileResult:
+    def __init__(self, path: str, output: str, errors: str, ok: bool, seconds: float):
+        self.path = path
+        self.output = output    # Everything the program printed
+        self.errors = errors    # Diagnostics and the traceback, if it raised
+        self.ok = ok
+        self.seconds = seconds
+
+
+def collect_sources(paths: list[str]) -> list[str]:
+    """Expands directories into the .mfp files below them, in sorted order."""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for directory, subdirectories, files in os.walk(path):
+                subdirectories[:] = sorted(d for d in subdirectories if not d.startswith('__'))
+                found.extend(os.path.join(directory, name) for name in files if name.endswith('.mfp'))
+            sources.extend(sorted(found))
+        else:
+            sources.append(path)
+    return sources
+
+
+def run_captured(path: str, backend: str, optimise: bool, use_cache: bool) -> FileResult:
+    # Runs in a worker process. Workers are reused between files, so imports,
+    # builtins and the Preprocessor's include cache stay warm.
+    from mfp import run_file
+
+    output, errors = io.StringIO(), io.StringIO()
+    start = time.perf_counter()
+    ok = True
+    with redirect_stdout(output), redirect_stderr(errors):
+        try:
+            run_file(path, backend, optimise, use_cache)
+        except Exception:
+            traceback.print_exc()
+            ok = False
+    return FileResult(path, output.getvalue(), errors.getvalue(), ok, time.perf_counter() - start)
+
+
+def report(result: FileResult):
+    print(f"==> {result.path} <==", flush=True)
+    sys.stdout.write(result.output)
+    sys.stdout.flush()
+    if result.errors:
+        print(f"==> {result.path} (stderr) <==", file=sys.stderr)
+        sys.stderr.write(result.errors)
+        sys.stderr.flush()
+
+
+def run_batch(paths: list[str], jobs: int | None = None, backend: str = 'vm', optimise: bool = False,
+              use_cache: bool = True, ordered: bool = False):
+    """Runs every file on a pool of `jobs` worker processes and reports each
+    file's output as soon as it finishes (in input order with `ordered`).
+    Returns the number of files that failed."""
+    sources = collect_sources(paths)
+    start = time.perf_counter()
+    failed = 0
+
+    if jobs == 1:
+        results = (run_captured(path, backend, optimise, use_cache) for path in sources)
+        for result in results:
+            report(result)
+            failed += not result.ok
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(run_captured, path, backend, optimise, use_cache) for path in sources]
+            for future in (futures if ordered else as_completed(futures)):
+                result = future.result()
+                report(result)
+                failed += not result.ok
+
+    print(f"[mfp] {len(sources)} files, {failed} failed, {time.perf_counter() - start:.2f}s",
+          file=sys.stderr)
+    return failed
@@ -0,0 +1,69 @@
+"""Memory taken by tokens and by the resolved AST, per token, per node and
+relative to the size of the source.
+
+Usage: python bench/ast_memory.py [MEGABYTES]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from optimiser import count_nodes
+from parser import Parser
+from resolver import Resolver
+from tokeniser import Tokeniser
+
+
+def generated_source(megabytes: float):
+    # Many small functions and bindings, as produced by our scenario generators
+    size, lines, i = int(megabytes * 1024 * 1024), [], 0
+    while size > 0:
+        line = (f'g{i} := x |-> if x > {i} then 2*x*x + 3.5*x - {i} else g{i}(x - 1)\n'
+                f'v{i} := add(v{i // 2})(x{i % 50})\n')
+        lines.append(line)
+        size -= len(line)
+        i += 1
+    return ''.join(lines)
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, used
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+    source = generated_source(megabytes)
+
+    def tokenise():
+        tokeniser = Tokeniser(source)
+        tokeniser.tokenise()
+        return tokeniser.tokens
+
+    tokens, token_bytes = measure(tokenise)
+
+    def parse():
+        parser = Parser(tokens)
+        parser.parse()
+        Resolver().resolve(parser.ast)
+        return parser.ast
+
+    program, ast_bytes = measure(parse)
+    nodes = count_nodes(program)
+
+    print(f"source: {len(source) / 1024 / 1024:.1f} MB, {len(tokens):,} tokens, {nodes:,} nodes")
+    print(f"tokens: {token_bytes / 1024 / 1024:>7.1f} MB  {token_bytes / len(tokens):>6.1f} bytes/token  "
+          f"{token_bytes / len(source):>5.1f}x source")
+    print(f"AST:    {ast_bytes / 1024 / 1024:>7.1f} MB  {ast_bytes / nodes:>6.1f} bytes/node   "
+          f"{ast_bytes / len(source):>5.1f}x source")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Many small scenario files: one `mfp.py FILE` process each versus a single
+`mfp.py DIR -j N` batch run.
+
+Usage: python bench/batch_runner.py [FILES] [JOBS]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MFP = os.path.join(ROOT, 'mfp.py')
+
+
+def write_scenarios(directory: str, count: int):
+    with open(os.path.join(directory, 'lib.mfp.inc'), 'w') as f:
+        f.write(''.join(f'l{j} := x |-> x*x + {j}\n' for j in range(500)))
+        f.write('fib := n |-> if 2 > n then n else fib(n-1) + fib(n-2)\n')
+    for i in range(count):
+        with open(os.path.join(directory, f'scenario{i:04}.mfp'), 'w') as f:
+            f.write(f'!include(lib.mfp.inc)\nprint(l7({i}) + fib({12 + i % 6}))\n')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_scenarios(directory, count)
+        files = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.mfp'))
+
+        start = time.perf_counter()
+        for path in files:
+            subprocess.run([sys.executable, MFP, '--no-cache', path], check=True, stdout=subprocess.DEVNULL)
+        separate = time.perf_counter() - start
+
+        start = time.perf_counter()
+        subprocess.run([sys.executable, MFP, '--no-cache', '-j', str(jobs), directory],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        batch = time.perf_counter() - start
+
+    print(f"{count} files")
+    print(f"  one process per file: {separate:.2f}s")
+    print(f"  batch, -j {jobs}:{' ' * (10 - len(str(jobs)))}{batch:.2f}s  ({separate / batch:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Call-heavy programs on the tree, vm and py backends.
+
+Usage: python bench/codegen.py [N]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from codegen import CompilingEvaluator
+from env import Env
+from eval import Evaluator
+from parser import Parser
+from resolver import Resolver
+from specialise import Specialiser
+from tokeniser import Tokeniser
+from typecheck import TypeChecker
+from vm import VM
+
+
+WORKLOADS = {
+    'fib': lambda n: f'fib := n |-> if 2 > n then n else fib(n-1) + fib(n-2)\nfib({n.bit_length() + 9})\n',
+    'tail loop': lambda n: f'sum := n |-> acc |-> if n > 0 then sum(n - 1)(acc + n*n) else acc\nsum({n * 10})(0)\n',
+    'polynomial': lambda n: (f'f := x |-> x*x*x - 2*x*x + 3*x - 1\n'
+                             f'loop := n |-> if n > 0 then loop(n - 1 + 0*f(n)) else f(3)\nloop({n * 5})\n'),
+    'higher order': lambda n: (f'twice := f |-> x |-> f(f(x))\ninc := x |-> x + 1\n'
+                               f'loop := n |-> acc |-> if n > 0 then loop(n - 1)(twice(inc)(acc)) else acc\n'
+                               f'loop({n * 5})(0)\n'),
+}
+
+BACKENDS = {
+    'tree': Evaluator,
+    'vm': VM,
+    'py': CompilingEvaluator,
+}
+
+
+def run(source: str, interpreter):
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+    TypeChecker().check(parser.ast)
+    Specialiser().specialise(parser.ast)
+    start = time.perf_counter()
+    result = interpreter.execute(parser.ast, Env())[1]
+    return time.perf_counter() - start, result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    print(f"{'workload':<14}" + ''.join(f"{backend:>10}" for backend in BACKENDS) + f"{'py vs tree':>12}")
+    for name, workload in WORKLOADS.items():
+        source = workload(n)
+        times, expected = {}, None
+        for backend, interpreter_class in BACKENDS.items():
+            times[backend], result = run(source, interpreter_class())
+            assert expected is None or result == expected, f"{name} on {backend}: {result} != {expected}"
+            expected = result
+        print(f"{name:<14}" + ''.join(f"{elapsed:>9.3f}s" for elapsed in times.values())
+              + f"{times['tree'] / times['py']:>11.1f}x")
+
+
+if __name__ == '__main__':
+    main()
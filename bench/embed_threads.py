@@ -0,0 +1,68 @@
+"""Stress test for the embedding API: one compiled Program called from many
+threads at once must give exactly what calling it serially gives.
+
+Usage: python bench/embed_threads.py [THREADS] [ROUNDS]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import embed
+
+
+SOURCE = (
+    'poly := x |-> x*x*x - 2*x*x + 3.5*x - 1\n'
+    'fib := memo(n |-> if 2 > n then n else fib(n-1) + fib(n-2))\n'
+    'small := memo_lru(8)(n |-> n*n + 1)\n'
+    'add := x |-> y |-> x + y\n'
+    'count := n |-> acc |-> if n > 0 then count(n - 1)(acc + n) else acc\n'
+    'twice := f |-> x |-> f(f(x))\n'
+    'curve := x |-> sin(x)*exp(0 - x/10)\n'
+)
+
+
+def calls(program):
+    # (description, thunk) pairs covering each kind of function
+    poly, fib, small = program.get('poly'), program.get('fib'), program.get('small')
+    add, count, twice, curve = program.get('add'), program.get('count'), program.get('twice'), program.get('curve')
+    work = []
+    for i in range(40):
+        work.append((f'poly({i})', lambda i=i: poly(i)))
+        work.append((f'poly({i / 3})', lambda i=i: poly(i / 3)))
+        work.append((f'fib({i * 2})', lambda i=i: fib(i * 2)))
+        work.append((f'small({i % 20})', lambda i=i: small(i % 20)))
+        work.append((f'add({i})({-i * 2})', lambda i=i: add(i, -i * 2)))
+        work.append((f'add({i}) partially', lambda i=i: add(i)(100)))
+        work.append((f'count({i * 25})(0)', lambda i=i: count(i * 25, 0)))
+        work.append((f'twice(python)({i})', lambda i=i: twice(lambda x: x * 3 + 1)(i)))
+        work.append((f'twice(poly)({i})', lambda i=i: twice(poly)(i % 5)))
+        work.append((f'curve({i})', lambda i=i: curve(i)))
+    return work
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    for backend in ('vm', 'tree', 'py'):
+        # The expected results come from a separate program, so its memo caches start cold too
+        expected = [thunk() for _, thunk in calls(embed.compile(SOURCE, backend=backend))]
+        program = embed.compile(SOURCE, backend=backend)
+        work = calls(program) * rounds
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            results = list(pool.map(lambda call: call[1](), work))
+        elapsed = time.perf_counter() - start
+
+        for i, ((name, _), result) in enumerate(zip(work, results)):
+            want = expected[i % len(expected)]
+            assert result == want and type(result) is type(want), f"{backend}: {name} gave {result!r}, expected {want!r}"
+        print(f"{backend:<5} {len(work):,} calls on {threads} threads in {elapsed:.2f}s, all match serial results")
+
+
+if __name__ == '__main__':
+    main()
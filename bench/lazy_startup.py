@@ -0,0 +1,65 @@
+"""Startup of mfp.py with and without --lazy, for a script that includes a
+library of BINDINGS functions and tables but uses only one function.
+
+Cold runs delete __mfpcache__ first; warm runs load it.
+
+Usage: python bench/lazy_startup.py [BINDINGS] [RUNS]
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mfpc import CACHE_DIR
+
+
+def write_sources(directory: str, bindings: int):
+    # Every tenth binding is a table entry computed from the function before it
+    with open(os.path.join(directory, 'lib.mfp'), 'w') as f:
+        for i in range(bindings):
+            if i % 10 == 9:
+                f.write(f't{i} := f{i - 1}(12)\n')
+            else:
+                f.write(f'f{i} := x |-> if x > 1 then f{i}(x - 1) + f{i}(x - 2) + {i} else x\n')
+    entry = os.path.join(directory, 'main.mfp')
+    with open(entry, 'w') as f:
+        f.write('!include(lib.mfp)\nprint(f7(10))\n')
+    return entry
+
+
+def time_run(entry: str, cold: bool, lazy: bool):
+    if cold:
+        shutil.rmtree(os.path.join(os.path.dirname(entry), CACHE_DIR), ignore_errors=True)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, os.path.join(ROOT, 'mfp.py'), *(['--lazy'] if lazy else []), entry],
+                            check=True, capture_output=True, text=True).stdout
+    return time.perf_counter() - start, output
+
+
+def main():
+    bindings = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    print(f"{bindings} bindings, best of {runs}")
+    with tempfile.TemporaryDirectory() as directory:
+        entry = write_sources(directory, bindings)
+        expected = None
+        for cold in (True, False):
+            times = {}
+            for lazy in (False, True):
+                results = [time_run(entry, cold, lazy) for _ in range(runs)]
+                times[lazy] = min(seconds for seconds, _ in results)
+                assert all(output == (expected or output) for _, output in results)
+                expected = results[0][1]
+            label = 'cold' if cold else 'warm'
+            print(f"  {label}: {times[False]:.3f}s in order, {times[True]:.3f}s lazily "
+                  f"({times[False] / times[True]:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Independent expensive top-level bindings, run in order and with
+evaluate_parallel on 1, 2, 4, ... worker processes.
+
+Usage: python bench/parallel_bindings.py [BINDINGS] [FIB_N]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from env import Env
+from parallel import evaluate_parallel
+from parser import Parser
+from resolver import Resolver
+from tokeniser import Tokeniser
+from vm import VM
+
+
+def scenario(bindings: int, n: int):
+    lines = ['fib := n |-> if 2 > n then n else fib(n-1) + fib(n-2)']
+    for i in range(bindings):
+        lines.append(f'r{i} := fib({n} + {i % 2})')
+        lines.append(f'print(r{i})')
+    lines.append('print(' + ' + '.join(f'r{i}' for i in range(bindings)) + ')')
+    return '\n'.join(lines) + '\n'
+
+
+def parse(source: str):
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+    return parser.ast
+
+
+def timed(run):
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        run()
+    return time.perf_counter() - start, output.getvalue()
+
+
+def main():
+    bindings = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 22
+    program = parse(scenario(bindings, n))
+
+    sequential, expected = timed(lambda: VM().execute(program, Env()))
+    print(f"{bindings} bindings of fib({n}), {os.cpu_count()} CPUs")
+    print(f"  in order:   {sequential:.2f}s")
+    jobs = 1
+    while jobs <= max(os.cpu_count(), 1):
+        seconds, output = timed(lambda: evaluate_parallel(program, VM, jobs))
+        assert output == expected, "output differs from the sequential run"
+        print(f"  -j {jobs:<7} {seconds:.2f}s  ({sequential / seconds:.1f}x)")
+        jobs *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Sums over lazy sequences on the tree, vm and py backends, with the NumPy
+fast path and element by element, against a tail-recursive loop.
+
+Usage: python bench/sequences.py [N]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sequence
+from codegen import CompilingEvaluator
+from env import Env
+from eval import Evaluator
+from parser import Parser
+from resolver import Resolver
+from specialise import Specialiser
+from tokeniser import Tokeniser
+from typecheck import TypeChecker
+from vm import VM
+
+
+# Workload: source for N, and whether it can take the NumPy fast path
+WORKLOADS = {
+    'basel': (lambda n: f'sum(map(k |-> 1/(k*k))(range(1)({n + 1})))\n', True),
+    'basel (loop)': (lambda n: f'basel := k |-> acc |-> if k > 0 then basel(k - 1)(acc + 1/(k*k)) else acc\n'
+                               f'basel({n})(0)\n', False),
+    'filter, map': (lambda n: f'sum(map(k |-> k*k - 3*k)(filter(k |-> k*k > {n})(range(0)({n}))))\n', True),
+    'fold': (lambda n: f'fold(acc |-> k |-> acc + k*k)(0)(range(0)({n}))\n', False),
+}
+
+BACKENDS = {
+    'tree': Evaluator,
+    'vm': VM,
+    'py': CompilingEvaluator,
+}
+
+
+def run(source: str, interpreter):
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+    TypeChecker().check(parser.ast)
+    Specialiser().specialise(parser.ast)
+    start = time.perf_counter()
+    result = interpreter.execute(parser.ast, Env())[1]
+    return time.perf_counter() - start, result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with_numpy = sequence.numpy
+    with_numpy()  # Not timing the import
+
+    print(f"N = {n:,}")
+    print(f"{'workload':<28}" + ''.join(f"{backend:>10}" for backend in BACKENDS))
+    for name, (workload, vectorisable) in WORKLOADS.items():
+        source = workload(n)
+        expected = None
+        for mode in ('numpy', 'per element') if vectorisable else ('',):
+            sequence.numpy = with_numpy if mode == 'numpy' else lambda: None
+            times = {}
+            for backend, interpreter_class in BACKENDS.items():
+                times[backend], result = run(source, interpreter_class())
+                # The fast path gives exactly the per-element results
+                assert expected is None or result == expected, f"{name} on {backend}, {mode}: {result} != {expected}"
+                expected = result
+            label = f"{name}, {mode}" if mode else name
+            print(f"{label:<28}" + ''.join(f"{elapsed:>9.3f}s" for elapsed in times.values()))
+    sequence.numpy = with_numpy
+
+
+if __name__ == '__main__':
+    main()
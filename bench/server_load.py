@@ -0,0 +1,139 @@
+"""Latency and throughput of the evaluation server (mfp.py --serve), against
+starting `python mfp.py` for every request.
+
+Starts a server on a temporary socket, then runs CLIENTS threads, each with
+its own connection and session, sending REQUESTS small evaluations apiece.
+With --runaway, one more client keeps sending infinite recursions, each
+stopped by a 0.5s budget: clients whose sessions share its worker wait for
+it once per request, the others are not held up.
+
+Usage: python bench/server_load.py [--clients N] [--requests N] [--workers N] [--runaway]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from client import Client
+
+
+DEFINITIONS = (
+    'poly := x |-> x*x*x - 2*x*x + 3*x - 1\n'
+    'fib := n |-> if 2 > n then n else fib(n-1) + fib(n-2)\n'
+    'sum := n |-> acc |-> if n > 0 then sum(n - 1)(acc + poly(n)) else acc\n'
+)
+
+
+def request(i: int):
+    return f'sum({10 + i % 50})(0) + fib({5 + i % 10})\n'
+
+
+def expected(i: int):
+    def fib(n):
+        return n if n < 2 else fib(n - 1) + fib(n - 2)
+    n = 10 + i % 50
+    return sum(x * x * x - 2 * x * x + 3 * x - 1 for x in range(1, n + 1)) + fib(5 + i % 10)
+
+
+def start_server(path: str, workers: int):
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'mfp.py'), '--serve', path, '-j', str(workers),
+                                '--max-seconds', '2'], stderr=subprocess.DEVNULL)
+    deadline = time.perf_counter() + 30
+    while True:
+        try:
+            with Client(path) as client:
+                client.request({'op': 'ping'})
+            return process
+        except OSError:
+            if time.perf_counter() > deadline or process.poll() is not None:
+                raise RuntimeError("the server did not start")
+            time.sleep(0.05)
+
+
+def run_client(path: str, requests: int, latencies: list[float]):
+    with Client(path) as client:
+        session = client.open()
+        client.evaluate(DEFINITIONS, session)
+        for i in range(requests):
+            start = time.perf_counter()
+            reply = client.evaluate(request(i), session)
+            latencies.append(time.perf_counter() - start)
+            assert reply['ok'] and reply['value'] == expected(i), reply
+
+
+def run_runaway(path: str, stop: threading.Event, stopped: list[float]):
+    with Client(path) as client:
+        session = client.open()
+        client.evaluate('loop := n |-> loop(n + 1)\n', session)
+        while not stop.is_set():
+            start = time.perf_counter()
+            reply = client.evaluate('loop(0)\n', session, seconds=0.5)
+            assert not reply['ok'] and 'budget' in reply['error'], reply
+            stopped.append(time.perf_counter() - start)
+
+
+def percentile(values: list[float], fraction: float):
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--clients', type=int, default=8)
+    arg_parser.add_argument('--requests', type=int, default=200)
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    arg_parser.add_argument('--runaway', action='store_true')
+    args = arg_parser.parse_args()
+
+    # A new process per request: what callers pay without the server
+    with tempfile.NamedTemporaryFile('w', suffix='.mfp', delete=False) as f:
+        f.write(DEFINITIONS + f'print({request(0).strip()})\n')
+    process_times = []
+    for _ in range(5):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(ROOT, 'mfp.py'), f.name], check=True, capture_output=True)
+        process_times.append(time.perf_counter() - start)
+    os.unlink(f.name)
+
+    path = os.path.join(tempfile.mkdtemp(), 'mfp.sock')
+    server = start_server(path, args.workers)
+    try:
+        latencies: list[float] = []
+        stop, stopped = threading.Event(), []
+        runaway = threading.Thread(target=run_runaway, args=(path, stop, stopped))
+        if args.runaway:
+            runaway.start()
+        clients = [threading.Thread(target=run_client, args=(path, args.requests, latencies))
+                   for _ in range(args.clients)]
+        start = time.perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        if args.runaway:
+            runaway.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    total = args.clients * args.requests
+    assert len(latencies) == total, "a client failed"
+    print(f"process per request: {statistics.median(process_times) * 1000:8.1f} ms median")
+    print(f"server, {args.clients} clients on {args.workers} workers:")
+    print(f"  latency  p50 {percentile(latencies, 0.5) * 1000:6.2f} ms   p95 {percentile(latencies, 0.95) * 1000:6.2f} ms"
+          f"   p99 {percentile(latencies, 0.99) * 1000:6.2f} ms")
+    print(f"  throughput {total / elapsed:,.0f} requests/s ({total:,} in {elapsed:.2f}s)")
+    if args.runaway:
+        print(f"  runaway recursions stopped: {len(stopped)}, after {statistics.mean(stopped):.2f}s on average")
+
+
+if __name__ == '__main__':
+    main()
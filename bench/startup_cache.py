@@ -0,0 +1,56 @@
+"""Cold vs warm startup of mfp.py with the compiled program cache (.mfpc).
+
+Cold runs delete __mfpcache__ first, so they preprocess, tokenise, parse and
+resolve from scratch and write the cache; warm runs load it.
+
+Usage: python bench/startup_cache.py [BINDINGS] [RUNS]
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mfpc import CACHE_DIR
+
+
+def write_sources(directory: str, bindings: int):
+    # A shared library included by a short entry script, like a batch job
+    with open(os.path.join(directory, 'lib.mfp'), 'w') as f:
+        for i in range(bindings):
+            f.write(f'f{i} := x |-> if x > {i} then 2*x*x + 3*x - {i} else x - 1\n')
+    entry = os.path.join(directory, 'main.mfp')
+    with open(entry, 'w') as f:
+        f.write('!include(lib.mfp)\nprint(f7(10))\n')
+    return entry
+
+
+def time_run(entry: str, cold: bool):
+    if cold:
+        shutil.rmtree(os.path.join(os.path.dirname(entry), CACHE_DIR), ignore_errors=True)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(ROOT, 'mfp.py'), entry],
+                   check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    bindings = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as directory:
+        entry = write_sources(directory, bindings)
+        cold = min(time_run(entry, cold=True) for _ in range(runs))
+        warm = min(time_run(entry, cold=False) for _ in range(runs))
+
+    print(f"{bindings} bindings, best of {runs}")
+    print(f"  cold: {cold:.3f}s")
+    print(f"  warm: {warm:.3f}s  ({cold / warm:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
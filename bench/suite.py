@@ -0,0 +1,286 @@
+"""Times every phase of the pipeline on representative workloads.
+
+Each workload is preprocessed, tokenised, parsed, resolved, compiled and
+evaluated on both backends, with every phase timed separately (best of
+--repeat runs). Peak memory per phase is measured in one extra run under
+tracemalloc. Results can be written as JSON and compared against a saved
+baseline: any phase slower than the baseline by more than --threshold fails
+the run (exit status 1).
+
+Usage:
+    python bench/suite.py [--json OUT.json] [--baseline BASE.json]
+                          [--threshold 0.15] [--repeat 3] [--scale 1]
+                          [--only NAME ...]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler import Compiler
+from env import Env
+from eval import Evaluator
+from optimiser import count_nodes
+from parser import Parser
+from preprocessor import IncludeCache, Preprocessor
+from resolver import Resolver
+from specialise import Specialiser
+from tokeniser import Tokeniser
+from typecheck import TypeChecker
+from vm import VM
+
+
+# Phases faster than this are too noisy to compare against a baseline
+MIN_COMPARABLE_SECONDS = 0.005
+
+
+def fact_source(scale: int):
+    # Deep non-tail recursion, driven by a tail-recursive loop
+    return (
+        'fact := n |-> if n > 0 then n*fact(n-1) else 1\n'
+        'loop := n |-> if n > 0 then loop(n - 1 + 0*fact(150)) else 0\n'
+        f'loop({100 * scale})\n'
+    )
+
+
+def fib_source(scale: int):
+    return (
+        'fib := n |-> if 2 > n then n else fib(n-1) + fib(n-2)\n'
+        f'fib({19 + scale})\n'
+    )
+
+
+def curry_source(scale: int):
+    # Every iteration builds and calls an intermediate closure
+    return (
+        'add := x |-> y |-> x + y\n'
+        'loop := n |-> if n > 0 then loop(n - add(9)(10) + 18) else 0\n'
+        f'loop({20000 * scale})\n'
+    )
+
+
+def bindings_source(scale: int):
+    lines = ['v0 := 0\n']
+    for i in range(1, 5000 * scale):
+        lines.append(f'v{i} := v{i - 1} + {i}\n')
+        lines.append(f'f{i} := x |-> x*{i} + v{i}\n')
+    return ''.join(lines)
+
+
+def large_source(scale: int):
+    # About 1 MB per unit of scale
+    size, lines, i = scale * 1024 * 1024, [], 0
+    while size > 0:
+        line = f'g{i} := x |-> if x > {i} then 2*x*x + 3.5*x - {i} else g{i}(x - 1)  # comment\n'
+        lines.append(line)
+        size -= len(line)
+        i += 1
+    return ''.join(lines)
+
+
+def write_nested_includes(directory: str, scale: int):
+    # A chain of files, each including the next from a subdirectory
+    depth = 40 * scale
+    for level in range(depth, 0, -1):
+        path = os.path.join(directory, *['lib'] * level, 'part.mfp')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            if level < depth:
+                f.write('!include(lib/part.mfp)\n')
+            f.write(''.join(f'h{level}_{j} := x |-> x + {j}\n' for j in range(100)))
+    return '!include(lib/part.mfp)\nh1_1(1)\n'
+
+
+WORKLOADS = {
+    'fact': fact_source,
+    'fib': fib_source,
+    'curry': curry_source,
+    'bindings': bindings_source,
+    'includes': write_nested_includes,
+    'large-source': large_source,
+}
+
+
+class Workload:
+    """Runs the pipeline on one source file, one phase at a time."""
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        with open(path) as f:
+            self.source = f.read()
+
+    def phases(self):
+        # (phase, function) pairs; each function returns what the next one needs
+        # and the number of items it processed, for throughput
+        state = {}
+
+        def preprocess():
+            preprocessor = Preprocessor(IncludeCache())  # Cold: every include is read
+            state['preprocessed'] = preprocessor.preprocess(self.source, self.path)
+            return state['preprocessed'].count('\n'), 'lines'
+
+        def tokenise():
+            tokeniser = Tokeniser(state['preprocessed'])
+            tokeniser.tokenise()
+            state['tokens'] = tokeniser.tokens
+            return len(tokeniser.tokens), 'tokens'
+
+        def parse():
+            parser = Parser(state['tokens'])
+            parser.parse()
+            state['program'] = parser.ast
+            return len(state['tokens']), 'tokens'
+
+        def resolve():
+            Resolver().resolve(state['program'])
+            return state.setdefault('nodes', count_nodes(state['program'])), 'nodes'
+
+        def typecheck():
+            TypeChecker().check(state['program'])
+            return state['nodes'], 'nodes'
+
+        def specialise():
+            Specialiser().specialise(state['program'])
+            return state['nodes'], 'nodes'
+
+        def compile_():
+            state['code'] = Compiler().compile(state['program'])
+            return state['nodes'], 'nodes'
+
+        def evaluate_vm():
+            VM().run(state['code'], Env())
+            return None, None
+
+        def evaluate_tree():
+            Evaluator().execute(state['program'], Env())
+            return None, None
+
+        return [
+            ('preprocess', preprocess),
+            ('tokenise', tokenise),
+            ('parse', parse),
+            ('resolve', resolve),
+            ('typecheck', typecheck),
+            ('specialise', specialise),
+            ('compile', compile_),
+            ('evaluate-vm', evaluate_vm),
+            ('evaluate-tree', evaluate_tree),
+        ]
+
+    def measure(self, repeat: int):
+        results = {}
+        for _ in range(repeat):
+            for phase, run in self.phases():
+                start = time.perf_counter()
+                count, unit = run()
+                elapsed = time.perf_counter() - start
+                result = results.setdefault(phase, {'seconds': elapsed})
+                result['seconds'] = min(result['seconds'], elapsed)
+                if count is not None:
+                    result['throughput'] = count / result['seconds'] if result['seconds'] else 0.0
+                    result['unit'] = f'{unit}/s'
+
+        tracemalloc.start()
+        for phase, run in self.phases():
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            run()
+            results[phase]['peak_kb'] = (tracemalloc.get_traced_memory()[1] - before) / 1024
+        tracemalloc.stop()
+        return results
+
+
+def run_suite(names: list[str], repeat: int, scale: int):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            make_source = WORKLOADS[name]
+            if name == 'includes':
+                source = make_source(directory, scale)
+            else:
+                source = make_source(scale)
+            path = os.path.join(directory, f'{name}.mfp')
+            with open(path, 'w') as f:
+                f.write(source)
+            print(f"{name} ...", file=sys.stderr)
+            results[name] = Workload(name, path).measure(repeat)
+    return results
+
+
+def print_results(results: dict):
+    print(f"{'workload':<14} {'phase':<14} {'seconds':>9} {'throughput':>22} {'peak KB':>10}")
+    for name, phases in results.items():
+        for phase, result in phases.items():
+            throughput = f"{result['throughput']:,.0f} {result['unit']}" if 'throughput' in result else ''
+            print(f"{name:<14} {phase:<14} {result['seconds']:>9.4f} {throughput:>22} {result['peak_kb']:>10,.0f}")
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Prints phases whose time changed against the baseline and returns the
+    number that got slower by more than `threshold`."""
+    regressions = 0
+    print(f"\n{'workload':<14} {'phase':<14} {'baseline':>9} {'now':>9} {'change':>8}")
+    for name, phases in results.items():
+        for phase, result in phases.items():
+            old = baseline.get(name, {}).get(phase)
+            if old is None:
+                continue
+            if max(old['seconds'], result['seconds']) < MIN_COMPARABLE_SECONDS:
+                continue
+            change = result['seconds'] / old['seconds'] - 1
+            status = ''
+            if change > threshold:
+                status = 'SLOWER'
+                regressions += 1
+            elif change < -threshold:
+                status = 'faster'
+            print(f"{name:<14} {phase:<14} {old['seconds']:>9.4f} {result['seconds']:>9.4f} "
+                  f"{change:>+8.1%} {status}")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='MathFP pipeline benchmark suite')
+    arg_parser.add_argument('--json', metavar='PATH', help='write the results as JSON')
+    arg_parser.add_argument('--baseline', metavar='PATH', help='compare against saved JSON results')
+    arg_parser.add_argument('--threshold', type=float, default=0.15,
+                            help='fail if a phase is this much slower than the baseline (default 0.15)')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='timed runs per phase (default 3)')
+    arg_parser.add_argument('--scale', type=int, default=1, help='multiplies workload sizes (default 1)')
+    arg_parser.add_argument('--only', nargs='+', choices=list(WORKLOADS), default=list(WORKLOADS),
+                            metavar='NAME', help=f"workloads to run: {', '.join(WORKLOADS)}")
+    args = arg_parser.parse_args()
+
+    results = run_suite(args.only, args.repeat, args.scale)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'scale': args.scale,
+                'results': results,
+            }, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != args.scale:
+            print(f"Baseline was run with --scale {baseline.get('scale')}, not {args.scale}", file=sys.stderr)
+            sys.exit(2)
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"\nFAIL: {regressions} phase(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"\nOK: no phase slower than the baseline by more than {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
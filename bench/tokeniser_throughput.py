@@ -0,0 +1,41 @@
+"""Tokeniser throughput on large generated sources.
+
+Usage: python bench/tokeniser_throughput.py [MEGABYTES ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tokeniser import Tokeniser
+
+
+def generate_source(size: int):
+    lines = []
+    length = 0
+    i = 0
+    while length < size:
+        line = f'f{i} := x |-> if x > {i} then 2*x*x + 3.5*x - {i} else f{i}(x - 1)  # comment\n'
+        lines.append(line)
+        length += len(line)
+        i += 1
+    return ''.join(lines)
+
+
+def main():
+    sizes = [float(arg) for arg in sys.argv[1:]] or [1, 4, 16]
+
+    print(f"{'MB':>6} {'tokens':>12} {'seconds':>10} {'tokens/s':>14}")
+    for megabytes in sizes:
+        source = generate_source(int(megabytes * 1024 * 1024))
+        tokeniser = Tokeniser(source)
+        start = time.perf_counter()
+        tokeniser.tokenise()
+        elapsed = time.perf_counter() - start
+        count = len(tokeniser.tokens)
+        print(f"{megabytes:>6g} {count:>12,} {elapsed:>10.3f} {count / elapsed:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Arithmetic-heavy functions with and without the Specialiser's kernels,
+on both backends.
+
+Usage: python bench/typed_arithmetic.py [ITERATIONS]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from env import Env
+from eval import Evaluator
+from parser import Parser
+from resolver import Resolver
+from specialise import Specialiser
+from tokeniser import Tokeniser
+from typecheck import TypeChecker
+from vm import VM
+
+
+WORKLOADS = {
+    'polynomial': 'f := x |-> x*x + 2*x - 4\n',
+    'horner': 'f := x |-> ((3*x - 2)*x + 5)*x - 7/x\n',
+    'curried': 'f := x |-> (y |-> x*y - y*y + x/2)(x + 1)\n',
+}
+
+BACKENDS = {
+    'tree': Evaluator,
+    'vm': VM,
+}
+
+
+def run(source: str, interpreter, specialise: bool):
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+    TypeChecker().check(parser.ast)
+    if specialise:
+        Specialiser().specialise(parser.ast)
+    start = time.perf_counter()
+    result = interpreter.execute(parser.ast, Env())[1]
+    return time.perf_counter() - start, result
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    loop = f'loop := n |-> if n > 0 then loop(n - 1 + 0*f(n)) else f(3)\nloop({iterations})\n'
+
+    print(f"{'workload':<12} {'backend':<8} {'generic':>9} {'kernels':>9} {'speedup':>8}")
+    for name, definition in WORKLOADS.items():
+        for backend, interpreter_class in BACKENDS.items():
+            generic, expected = run(definition + loop, interpreter_class(), False)
+            specialised, result = run(definition + loop, interpreter_class(), True)
+            assert result == expected, f"{name}: {result} != {expected}"
+            print(f"{name:<12} {backend:<8} {generic:>8.3f}s {specialised:>8.3f}s {generic / specialised:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Batch evaluation of a MathFP function over NumPy arrays versus per-point calls.
+
+Usage: python bench/vectorise.py [POINTS]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from env import Env
+from parser import Parser
+from resolver import Resolver
+from tokeniser import Tokeniser
+from vectorise import vectorise
+from vm import VM
+
+
+SOURCE = (
+    'f := x |-> 2*x*x + 3*x - 1\n'
+    'g := x |-> if x > 0 then exp(-x) else cos(x)\n'
+)
+
+SCALAR_POINTS = 10**5
+
+
+def load(source: str):
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+    env, _ = VM().execute(parser.ast, Env())
+    return env
+
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 10**7
+    env = load(SOURCE)
+    xs = np.linspace(-10, 10, points)
+
+    print(f"{'function':<10} {'mode':<12} {'points':>12} {'seconds':>10} {'points/s':>14}")
+    for slot, name in enumerate(('f', 'g')):
+        closure = env.values[slot]
+
+        start = time.perf_counter()
+        vectorise(closure)(xs)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<10} {'vectorised':<12} {points:>12,} {elapsed:>10.3f} {points / elapsed:>14,.0f}")
+
+        sample = xs[:SCALAR_POINTS].tolist()
+        start = time.perf_counter()
+        for x in sample:
+            closure(x)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<10} {'scalar':<12} {SCALAR_POINTS:>12,} {elapsed:>10.3f} {SCALAR_POINTS / elapsed:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""A formula applied to a vector on the tree, vm and py backends, against
+calling it once per element.
+
+Usage: python bench/vectors.py [POINTS]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import embed
+
+
+SOURCE = (
+    'f := x |-> 2*x*x + 3*x - 1\n'
+    'g := x |-> where(x > 0)(exp(-x))(cos(x))\n'
+)
+
+SCALAR_POINTS = 10**5
+BACKENDS = ('tree', 'vm', 'py')
+
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 10**6
+    xs = np.linspace(-10, 10, points)
+    sample = xs[:SCALAR_POINTS].tolist()
+
+    print(f"{'function':<10} {'backend':<8} {'mode':<10} {'points':>12} {'seconds':>10} {'points/s':>14}")
+    for name in ('f', 'g'):
+        for backend in BACKENDS:
+            func = embed.compile(SOURCE, backend=backend).get(name)
+
+            start = time.perf_counter()
+            result = func(xs)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<10} {backend:<8} {'vector':<10} {points:>12,} {elapsed:>10.3f} {points / elapsed:>14,.0f}")
+
+            start = time.perf_counter()
+            scalar = [func(x) for x in sample]
+            elapsed = time.perf_counter() - start
+            print(f"{name:<10} {backend:<8} {'scalar':<10} {len(sample):>12,} {elapsed:>10.3f} "
+                  f"{len(sample) / elapsed:>14,.0f}")
+            assert np.allclose(result[:len(sample)], scalar, rtol=1e-12)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Edit-to-result latency of --watch on a generated library of BINDINGS
+functions, against running the program afresh, for an edit to the last
+function, to one in the middle and to the first (which everything reads).
+
+Usage: python bench/watch.py [BINDINGS]
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vm import VM
+from watch import Watcher
+
+
+def library(bindings: int, edited: int | None = None):
+    # Each function calls two earlier ones; every tenth has a value computed from it
+    rng = random.Random(0)
+    lines = []
+    for i in range(bindings):
+        constant = i + 1 if i == edited else i
+        if i == 0:
+            lines.append(f'f0 := x |-> x + {constant}')
+        else:
+            a, b = rng.randrange(i), rng.randrange(i)
+            lines.append(f'f{i} := x |-> if x > 0 then f{a}(x - 1) + f{b}(x - 1) * 2 + {constant} else {constant}')
+        if i % 10 == 0:
+            lines.append(f'v{i} := f{i}(4)')
+    return '\n'.join(lines) + '\n'
+
+
+def update(watcher: Watcher):
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        watcher.update()
+    return time.perf_counter() - start, output.getvalue()
+
+
+def program_output(output: str):
+    return [line for line in output.splitlines() if not line.startswith('[mfp] Parsed')]
+
+
+def write(path: str, text: str):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def main():
+    bindings = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as directory:
+        lib, script = os.path.join(directory, 'lib.mfp'), os.path.join(directory, 'main.mfp')
+        write(lib, library(bindings))
+        write(script, f'!include(lib.mfp)\nprint(f{bindings - 1}(4))\nprint(v{bindings // 2 // 10 * 10})\n')
+        watcher = Watcher(script, VM())
+        seconds, _ = update(watcher)
+        print(f"{bindings:,} functions, {len(watcher.units):,} lines")
+        print(f"{'first run':<16} {seconds * 1000:>10.1f} ms")
+
+        for name, edited in (('last function', bindings - 1), ('middle function', bindings // 2), ('first function', 0)):
+            write(lib, library(bindings, edited))
+            seconds, output = update(watcher)
+            fresh_seconds, expected = update(Watcher(script, VM()))
+            assert program_output(output) == program_output(expected), f"after editing the {name}"
+            summary = output.splitlines()[-1].removeprefix('[mfp] ')
+            print(f"{name:<16} {seconds * 1000:>10.1f} ms   (afresh {fresh_seconds * 1000:.1f} ms)   {summary}")
+            write(lib, library(bindings))
+            update(watcher)
+
+
+if __name__ == '__main__':
+    main()
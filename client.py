@@ -0,0 +1,95 @@
+"""Client for the evaluation server (`python mfp.py --serve SOCKET`).
+
+As a script it is a REPL whose lines run on the server:
+
+    python client.py SOCKET [--steps N] [--seconds S]
+"""
+import argparse
+import os
+import socket
+import sys
+
+from protocol import receive, send
+
+
+class ServerError(Exception):
+    pass
+
+
+class Client:
+    """One connection to the server. Not thread-safe: give each thread its own."""
+
+    def __init__(self, path: str, timeout: float | None = None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+
+    def request(self, message: dict) -> dict:
+        send(self.sock, message)
+        return receive(self.sock)
+
+    def open(self) -> str:
+        """Opens a session, whose bindings persist until it is closed (or the
+        connection is)."""
+        reply = self.request({'op': 'open'})
+        if not reply['ok']:
+            raise ServerError(reply['error'])
+        return reply['session']
+
+    def evaluate(self, source: str, session: str | None = None, steps: int | None = None,
+                 seconds: float | None = None) -> dict:
+        """Evaluates `source` in `session`, or in a fresh session if None.
+        The reply holds what it printed and its result; if it failed, `ok` is
+        false and `error` says why."""
+        message = {'op': 'eval', 'source': source, 'directory': os.getcwd()}
+        if session is not None:
+            message['session'] = session
+        if steps is not None:
+            message['steps'] = steps
+        if seconds is not None:
+            message['seconds'] = seconds
+        return self.request(message)
+
+    def close_session(self, session: str):
+        reply = self.request({'op': 'close', 'session': session})
+        if not reply['ok']:
+            raise ServerError(reply['error'])
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(prog='client.py', description='MathFP evaluation server client')
+    arg_parser.add_argument('socket', help='the socket the server listens on')
+    arg_parser.add_argument('--steps', type=int, help='step budget per line (MathFP calls)')
+    arg_parser.add_argument('--seconds', type=float, help='time budget per line')
+    args = arg_parser.parse_args()
+
+    with Client(args.socket) as client:
+        session = client.open()
+        print(f"MathFP on {args.socket} (session {session}). Type 'exit' to quit.")
+        while True:
+            try:
+                line = input(">>> ")
+            except EOFError:
+                break
+            if line.strip() == "exit":
+                break
+            reply = client.evaluate(line + '\n', session, args.steps, args.seconds)
+            sys.stdout.write(reply.get('output', ''))
+            sys.stderr.write(reply.get('errors', ''))
+            if not reply['ok'] and not reply.get('errors'):
+                print(f"[mfp] {reply['error']}", file=sys.stderr)
+            elif reply['result'] is not None:
+                print(reply['result'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+from env import Env
+
+
+# Function value: a function together with the environment it was defined in.
+# `function` is whatever the interpreter that created the closure executes
+# (a FunctionDef_ for the Evaluator, a CodeObject for the VM). The defining
+# environment is captured once; each call binds the argument in a fresh frame.
+class Closure:
+    def __init__(self, function, env: Env, interpreter):
+        self.function = function
+        self.env = env
+        self.interpreter = interpreter
+
+    @property
+    def name(self) -> str:
+        return self.function.name
+
+    def __call__(self, arg):
+        # Lets builtins call MathFP functions like Python functions
+        return self.interpreter.call(self, arg)
+
+    def __repr__(self):
+        return f"<function {self.name}>"
@@ -0,0 +1,324 @@
+import math
+import sys
+
+from ast_nodes import *
+from closure import Closure
+from env import Env, UNBOUND
+from eval import BUILTINS, Evaluator
+
+
+class Untranslatable(Exception):
+    pass
+
+
+def unknown(frame: Env, slot: int, name: str):
+    # What the Evaluator does for a variable that is read before it is bound
+    value = frame.unbound(slot)
+    if value is UNBOUND:
+        print(f"[mfp] Unknown variable: {name}", file=sys.stderr)
+        return None
+    return value
+
+
+# Names generated code sees besides its parameters: builtins are prefixed so
+# they cannot clash with the names we generate
+NAMESPACE = {'UNBOUND': UNBOUND, 'unknown': unknown} | {f"b_{name}": func for name, func in BUILTINS.items()
+                                                        if name.isidentifier()}
+
+# Factories with the same source share one compiled function
+_factories: dict[str, object] = {}
+
+
+def compile_factory(source: str):
+    factory = _factories.get(source)
+    if factory is None:
+        namespace = dict(NAMESPACE)
+        exec(source, namespace)
+        factory = _factories[source] = namespace['make']
+    return factory
+
+
+def chain(node: FunctionDef_):
+    # The parameters of a curried function `x |-> y |-> body`, and its body
+    params = [node]
+    while isinstance(params[-1].body, FunctionDef_):
+        params.append(params[-1].body)
+    return params, params[-1].body
+
+
+class Translator(ASTVisitor):
+    """Translates a MathFP function into the source of a Python factory
+    `make(c0, c1, ...)` that is passed the values the function captures from
+    the environment it is defined in and returns a plain Python function.
+
+    Curried functions become nested lambdas, IfExpr conditional expressions
+    and calls Python calls, which work on every kind of MathFP function value.
+    Captured variables that are still unbound when the function is made (a
+    global defined further down the file) are read when the function runs,
+    as the interpreters do. A function bound to a global that calls itself
+    in tail position with all its arguments becomes a loop, so deep tail
+    recursion runs in constant stack as it does in the interpreters.
+
+    Visitor methods return Python expressions; `env` is unused. Raises
+    Untranslatable for anything else (bindings inside functions, unknown
+    variables, source too deeply nested for Python's compiler).
+    """
+
+    def __init__(self, lazy: frozenset[int] = frozenset()):
+        self.lazy = lazy  # Indexes of captures to read when the function runs
+        self.params: list[str] = []
+        self.captures: list[tuple[int, int, str]] = []  # (depth, slot, name) in the defining Env
+        self.indexes: dict[tuple[int, int], int] = {}
+        self.own: tuple[int, int] | None = None  # Address of the global this function is bound to
+
+    def translate(self, node: FunctionDef_, binding: Binding | None = None):
+        if binding is not None and binding.expr is node and binding.slot is not None and not binding.redeclared:
+            self.own = (0, binding.slot)
+
+        params, body = chain(node)
+        names = [f"p{i}" for i in range(len(params))]
+        if self.own is not None and not any(isinstance(n, (FunctionDef_, Binding)) for n in walk(body)) \
+                and self.has_tail_call(body, len(params)):
+            self.params = names
+            lines = [f"    def loop({', '.join(names)}):", "        while True:"]
+            self.statements(body, lines, 3)
+            if len(params) == 1:
+                lines.append("    function = loop")
+            else:
+                curried = ''.join(f"lambda {name}: " for name in names[1:])
+                lines.append(f"    def function(p0):\n        return {curried}loop({', '.join(names)})")
+        else:
+            self.params = names[:1]
+            lines = [f"    def function(p0):", f"        return {self.expression(node.body)}"]
+
+        header = ', '.join(f"v{i}, f{i}" if i in self.lazy else f"c{i}" for i in range(len(self.captures)))
+        return f"def make({header}):\n" + '\n'.join(lines) + "\n    return function\n"
+
+    def expression(self, node: ASTNode):
+        return node.accept(None, self)
+
+    def self_call(self, node: ASTNode, arity: int):
+        # The arguments of `own(a1)...(an)` with n == arity, or None
+        args = []
+        while isinstance(node, FunctionCall):
+            args.append(node.arg)
+            node = node.func
+        if isinstance(node, Var) and node.depth is not None and len(args) == arity \
+                and (node.depth - arity, node.slot) == self.own:
+            return args[::-1]
+        return None
+
+    def has_tail_call(self, node: ASTNode, arity: int):
+        if isinstance(node, IfExpr):
+            return self.has_tail_call(node.then_expr, arity) or self.has_tail_call(node.else_expr, arity)
+        return self.self_call(node, arity) is not None
+
+    def statements(self, node: ASTNode, lines: list[str], level: int):
+        # The body of `loop`: tail calls to itself rebind the parameters
+        indent = '    ' * level
+        keyword = 'if'
+        while isinstance(node, IfExpr):
+            lines.append(f"{indent}{keyword} {self.expression(node.cond)}:")
+            self.statements(node.then_expr, lines, level + 1)
+            keyword = 'elif'
+            node = node.else_expr
+        if keyword == 'elif':
+            lines.append(f"{indent}else:")
+            indent += '    '
+        args = self.self_call(node, len(self.params))
+        if args is None:
+            lines.append(f"{indent}return {self.expression(node)}")
+        else:
+            values = ', '.join(self.expression(arg) for arg in args)
+            lines.append(f"{indent}{', '.join(self.params)} = {values}")
+            lines.append(f"{indent}continue")
+
+    def capture(self, node: Var):
+        address = (node.depth - len(self.params), node.slot)
+        if address == self.own:
+            return "function"
+        index = self.indexes.get(address)
+        if index is None:
+            index = self.indexes[address] = len(self.captures)
+            self.captures.append((*address, node.name))
+        if index in self.lazy:
+            slot = node.slot
+            return f"(v{index}[{slot}] if len(v{index}) > {slot} and v{index}[{slot}] is not UNBOUND " \
+                   f"else unknown(f{index}, {slot}, {node.name!r}))"
+        return f"c{index}"
+
+    def visit_program(self, env: Env, node: Program):
+        raise Untranslatable("not a function")
+
+    def visit_number(self, env: Env, node: Number):
+        value = node.value
+        if isinstance(value, float) and not math.isfinite(value):
+            return f"float('{value!r}')"
+        return repr(value)
+
+    def visit_var(self, env: Env, node: Var):
+        if node.depth is None:
+            if f"b_{node.name}" not in NAMESPACE:
+                raise Untranslatable(f"unknown variable '{node.name}'")
+            return f"b_{node.name}"
+        if node.depth < len(self.params):
+            return self.params[-1 - node.depth]
+        return self.capture(node)
+
+    def visit_binding(self, env: Env, node: Binding):
+        raise Untranslatable("bindings inside functions are not supported")
+
+    def visit_functiondef(self, env: Env, node: FunctionDef_):
+        param = f"p{len(self.params)}"
+        self.params.append(param)
+        try:
+            return f"(lambda {param}: {self.expression(node.body)})"
+        finally:
+            self.params.pop()
+
+    def visit_functioncall(self, env: Env, node: FunctionCall):
+        return f"{self.expression(node.func)}({self.expression(node.arg)})"
+
+    def visit_binaryop(self, env: Env, node: BinaryOp):
+        return f"({self.expression(node.left)} {node.op} {self.expression(node.right)})"
+
+    def visit_unaryop(self, env: Env, node: UnaryOp):
+        return f"(-{self.expression(node.right)})"
+
+    def visit_ifexpr(self, env: Env, node: IfExpr):
+        return (f"({self.expression(node.then_expr)} if {self.expression(node.cond)} "
+                f"else {self.expression(node.else_expr)})")
+
+    def visit_load(self, env: Env, node: Load):
+        raise Untranslatable("!load inside a function")
+
+
+def walk(node: ASTNode):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.children())
+
+
+class Translation:
+    # A translated FunctionDef_: the variables it captures and its factories,
+    # one per set of captures that are still unbound when it is made
+    def __init__(self, node: FunctionDef_, binding: Binding | None):
+        self.node = node
+        self.binding = binding
+        translator = Translator()
+        try:
+            self.source = translator.translate(node, binding)
+        except RecursionError as e:
+            raise Untranslatable("too deeply nested to translate") from e
+        self.captures = translator.captures
+        self.factories = {}
+
+    @staticmethod
+    def compile(source: str):
+        try:
+            return compile_factory(source)
+        except (SyntaxError, RecursionError, MemoryError) as e:
+            raise Untranslatable(f"too deeply nested for Python ({type(e).__name__})") from e
+
+    def make(self, env: Env):
+        args, lazy = [], set()
+        for i, (depth, slot, _) in enumerate(self.captures):
+            frame = env
+            for _ in range(depth):
+                frame = frame.parent
+            values = frame.values
+            value = values[slot] if slot < len(values) else UNBOUND
+            if value is UNBOUND:
+                lazy.add(i)
+                args.append(values)
+                value = frame
+            args.append(value)
+
+        lazy = frozenset(lazy)
+        factory = self.factories.get(lazy)
+        if factory is None:
+            source = Translator(lazy).translate(self.node, self.binding) if lazy else self.source
+            factory = self.factories[lazy] = self.compile(source)
+        function = factory(*args)
+        function.name = function.__name__ = function.__qualname__ = self.node.name
+        function.node, function.env = self.node, env  # For sequence.compile_kernel
+        return function
+
+
+class CompilingEvaluator(Evaluator):
+    """Evaluator that turns every MathFP function it can into a Python
+    function (see Translator) when the function is defined, so calling it
+    runs as CPython bytecode instead of a visit per node. Functions that
+    cannot be translated stay Closures run by the Evaluator; the two kinds
+    call each other freely.
+    """
+
+    def __init__(self):
+        self.translations: dict[FunctionDef_, Translation | None] = {}  # None: untranslatable
+        self.binding: Binding | None = None  # Top-level binding being evaluated
+
+    def visit_binding(self, env: Env, node: Binding):
+        self.binding = node
+        try:
+            return super().visit_binding(env, node)
+        finally:
+            self.binding = None
+
+    def visit_functiondef(self, env: Env, node: FunctionDef_):
+        translation = self.translations.get(node, UNBOUND)
+        if translation is UNBOUND:
+            binding = self.binding if self.binding is not None and self.binding.expr is node else None
+            try:
+                translation = Translation(node, binding)
+            except Untranslatable:
+                translation = None
+            self.translations[node] = translation
+        if translation is None:
+            return env, Closure(node, env, self)
+        try:
+            return env, translation.make(env)
+        except Untranslatable:
+            self.translations[node] = None
+            return env, Closure(node, env, self)
+
+
+def main():
+    from tokeniser import Tokeniser
+    from parser import Parser
+    from resolver import Resolver
+
+    source = (
+        'f := x |-> x*x + 2*x - 4\n'
+        'add := x |-> y |-> x + y\n'
+        'count := n |-> acc |-> if n > 0 then count(n - 1)(acc + n) else acc\n'
+        'print(f(3) + add(1)(2))\n'
+        'print(count(100000)(0))\n'
+    )
+
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+
+    evaluator = CompilingEvaluator()
+    env, _ = evaluator.execute(parser.ast, Env())  # 14, then 5000050000
+    print(env.values[0])                           # <function f at 0x...>
+    print(evaluator.translations[parser.ast.exprs[2].expr].source)
+    # def make():
+    #     def loop(p0, p1):
+    #         while True:
+    #             if (p0 > 0):
+    #                 p0, p1 = (p0 - 1), (p1 + p0)
+    #                 continue
+    #             else:
+    #                 return p1
+    #     def function(p0):
+    #         return lambda p1: loop(p0, p1)
+    #     return function
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+import math
+
+from ast_nodes import *
+from env import Env
+from vector import load_vector
+
+
+class Op:
+    # Opcodes (each instruction is an (opcode, argument) pair)
+    # Jump targets are instruction indices.
+
+    LOAD_CONST = 0      # push constants[arg]
+    LOAD_LOCAL = 1      # push slot arg of the current function frame
+    LOAD_OUTER = 2      # push the value at lexical address addresses[arg]
+    LOAD_NAME = 3       # push the builtin names[arg]
+    BIND = 4            # pop value, store it in global slot arg, push None
+    REDECLARE = 5       # pop value, report redeclaration of names[arg], push None
+    MAKE_FUNCTION = 6   # push a closure over constants[arg] and the current frame
+    CALL = 7            # pop argument and function, push the result of the call
+    RETURN = 8          # return the top of the stack to the caller
+    POP = 9             # discard the top of the stack
+    JUMP = 10           # continue at instruction arg
+    JUMP_IF_FALSE = 11  # pop condition, continue at instruction arg if it is falsy
+
+    ADD = 12
+    SUB = 13
+    MUL = 14
+    DIV = 15
+    GREATER_THAN = 16
+    NEGATE = 17
+
+    # Superinstructions: binary operation with constants[arg] as the right operand
+    ADD_CONST = 18
+    SUB_CONST = 19
+    MUL_CONST = 20
+    DIV_CONST = 21
+    GREATER_THAN_CONST = 22
+
+    TAIL_CALL = 23      # like CALL, but a closure call replaces the current frame
+
+    # Only emitted when compiling for the profiler
+    PROFILE_ENTER = 24  # the current function has been entered
+    PROFILE_EXIT = 25   # the current function is about to return
+    PROFILE_CLOSURE = 26  # a closure has been made
+
+    KERNEL = 27         # push the result of the Kernel constants[arg] on the current frame
+
+    NAMES = {
+        LOAD_CONST: 'LOAD_CONST',
+        LOAD_LOCAL: 'LOAD_LOCAL',
+        LOAD_OUTER: 'LOAD_OUTER',
+        LOAD_NAME: 'LOAD_NAME',
+        BIND: 'BIND',
+        REDECLARE: 'REDECLARE',
+        MAKE_FUNCTION: 'MAKE_FUNCTION',
+        CALL: 'CALL',
+        TAIL_CALL: 'TAIL_CALL',
+        PROFILE_ENTER: 'PROFILE_ENTER',
+        PROFILE_EXIT: 'PROFILE_EXIT',
+        PROFILE_CLOSURE: 'PROFILE_CLOSURE',
+        KERNEL: 'KERNEL',
+        RETURN: 'RETURN',
+        POP: 'POP',
+        JUMP: 'JUMP',
+        JUMP_IF_FALSE: 'JUMP_IF_FALSE',
+        ADD: 'ADD',
+        SUB: 'SUB',
+        MUL: 'MUL',
+        DIV: 'DIV',
+        GREATER_THAN: 'GREATER_THAN',
+        NEGATE: 'NEGATE',
+        ADD_CONST: 'ADD_CONST',
+        SUB_CONST: 'SUB_CONST',
+        MUL_CONST: 'MUL_CONST',
+        DIV_CONST: 'DIV_CONST',
+        GREATER_THAN_CONST: 'GREATER_THAN_CONST',
+    }
+
+    BINARY = {
+        '+': ADD,
+        '-': SUB,
+        '*': MUL,
+        '/': DIV,
+        '>': GREATER_THAN,
+    }
+
+    BINARY_CONST = {
+        '+': ADD_CONST,
+        '-': SUB_CONST,
+        '*': MUL_CONST,
+        '/': DIV_CONST,
+        '>': GREATER_THAN_CONST,
+    }
+
+
+class CodeObject:
+    def __init__(self, name: str, param: str | None = None, node: FunctionDef_ | None = None):
+        self.name = name
+        self.param = param
+        self.node = node  # The function this was compiled from, for passes that need the AST
+        self.code: list[tuple[int, int]] = []
+        self.constants: list = []
+        self.names: list[str] = []
+        self.addresses: list[tuple[int, int, str]] = []  # (depth, slot, name)
+        self.indices: dict = {}  # Pool entry -> index, keeps lookups O(1)
+
+    def __getstate__(self):
+        # The pool indices are only needed while compiling, and are keyed by id()
+        state = self.__dict__.copy()
+        state['indices'] = {}
+        return state
+
+    def emit(self, op: int, arg: int = 0):
+        self.code.append((op, arg))
+        return len(self.code) - 1
+
+    def patch(self, position: int, arg: int):
+        self.code[position] = (self.code[position][0], arg)
+
+    def optimise(self):
+        # A jump straight to a RETURN can return immediately
+        for i, (op, arg) in enumerate(self.code):
+            if op == Op.JUMP and self.code[arg][0] == Op.RETURN:
+                self.code[i] = (Op.RETURN, 0)
+
+    def add_to_pool(self, pool: list, key, value):
+        if key not in self.indices:
+            self.indices[key] = len(pool)
+            pool.append(value)
+        return self.indices[key]
+
+    def add_constant(self, value):
+        # Code objects are compared by identity, numbers by value and type,
+        # and floats by sign too, as 0.0 == -0.0
+        if isinstance(value, CodeObject):
+            key = ('code', id(value))
+        elif type(value) is float:
+            key = ('constant', float, value, math.copysign(1.0, value))
+        else:
+            key = ('constant', type(value), value)
+        return self.add_to_pool(self.constants, key, value)
+
+    def add_name(self, name: str):
+        return self.add_to_pool(self.names, ('name', name), name)
+
+    def add_address(self, depth: int, slot: int, name: str):
+        address = (depth, slot, name)
+        return self.add_to_pool(self.addresses, ('address', address), address)
+
+
+class Compiler(ASTVisitor):
+    """Compiles a resolved AST (see Resolver) into CodeObjects for the VM.
+
+    The `env` argument of the visitor methods is unused; code is emitted into
+    the CodeObject currently being compiled. With `profile`, every function
+    reports entering and returning, and every closure made, to the VM's
+    profiler.
+    """
+
+    def __init__(self, profile: bool = False):
+        self.code: CodeObject = CodeObject('<program>')
+        self.tail = False  # Is the expression being compiled in tail position?
+        self.profile = profile
+
+    def compile(self, node: ASTNode, name: str = '<program>'):
+        self.code = CodeObject(name)
+        self.tail = False
+        node.accept(None, self)
+        if not isinstance(node, Program):
+            self.code.emit(Op.RETURN)
+        self.code.optimise()
+        return self.code
+
+    def visit_program(self, env: Env, node: Program):
+        if not node.exprs:
+            self.code.emit(Op.LOAD_CONST, self.code.add_constant(None))
+        for i, expr in enumerate(node.exprs):
+            if i > 0:
+                self.code.emit(Op.POP)
+            expr.accept(env, self)
+        self.code.emit(Op.RETURN)
+
+    def operand(self, env: Env, node: ASTNode):
+        # Compiles a subexpression whose value is used by the enclosing one
+        tail, self.tail = self.tail, False
+        node.accept(env, self)
+        self.tail = tail
+
+    def visit_number(self, env: Env, node: Number):
+        self.code.emit(Op.LOAD_CONST, self.code.add_constant(node.value))
+
+    def visit_var(self, env: Env, node: Var):
+        if node.depth is None:
+            self.code.emit(Op.LOAD_NAME, self.code.add_name(node.name))
+        elif node.depth == 0 and self.code.param is not None:
+            # Parameters are always bound; global slots may not be yet
+            self.code.emit(Op.LOAD_LOCAL, node.slot)
+        else:
+            self.code.emit(Op.LOAD_OUTER, self.code.add_address(node.depth, node.slot, node.name))
+
+    def visit_binding(self, env: Env, node: Binding):
+        self.operand(env, node.expr)
+
+        if node.redeclared:
+            self.code.emit(Op.REDECLARE, self.code.add_name(node.name))
+        elif node.slot is not None:
+            self.code.emit(Op.BIND, node.slot)
+        else:
+            # Bindings nested inside other expressions never extend the environment
+            self.code.emit(Op.POP)
+            self.code.emit(Op.LOAD_CONST, self.code.add_constant(None))
+
+    def visit_functiondef(self, env: Env, node: FunctionDef_):
+        outer_code, outer_tail = self.code, self.tail
+        self.code, self.tail = CodeObject(node.name, node.param, node), True
+        if self.profile:
+            self.code.emit(Op.PROFILE_ENTER)
+        node.body.accept(None, self)
+        if self.profile:
+            self.code.emit(Op.PROFILE_EXIT)
+        self.code.emit(Op.RETURN)
+        self.code.optimise()
+        function_code = self.code
+        self.code, self.tail = outer_code, outer_tail
+        self.code.emit(Op.MAKE_FUNCTION, self.code.add_constant(function_code))
+        if self.profile:
+            self.code.emit(Op.PROFILE_CLOSURE)
+
+    def visit_functioncall(self, env: Env, node: FunctionCall):
+        self.operand(env, node.func)
+        self.operand(env, node.arg)
+        self.code.emit(Op.TAIL_CALL if self.tail else Op.CALL)
+
+    def kernel(self, node: BinaryOp | UnaryOp):
+        # A kernel replacing a single operator is no faster than its instruction
+        if node.kernel is None or node.kernel.operations < 2:
+            return False
+        self.code.emit(Op.KERNEL, self.code.add_constant(node.kernel))
+        return True
+
+    def visit_binaryop(self, env: Env, node: BinaryOp):
+        if self.kernel(node):
+            return
+        self.operand(env, node.left)
+        if isinstance(node.right, Number):
+            self.code.emit(Op.BINARY_CONST[node.op], self.code.add_constant(node.right.value))
+        else:
+            self.operand(env, node.right)
+            self.code.emit(Op.BINARY[node.op])
+
+    def visit_unaryop(self, env: Env, node: UnaryOp):
+        if self.kernel(node):
+            return
+        self.operand(env, node.right)
+        self.code.emit(Op.NEGATE)
+
+    def visit_ifexpr(self, env: Env, node: IfExpr):
+        # The branches stay in tail position if the whole if is
+        self.operand(env, node.cond)
+        jump_to_else = self.code.emit(Op.JUMP_IF_FALSE)
+        node.then_expr.accept(env, self)
+        jump_to_end = self.code.emit(Op.JUMP)
+        self.code.patch(jump_to_else, len(self.code.code))
+        node.else_expr.accept(env, self)
+        self.code.patch(jump_to_end, len(self.code.code))
+
+    def visit_load(self, env: Env, node: Load):
+        self.code.emit(Op.LOAD_CONST, self.code.add_constant(load_vector))
+        self.code.emit(Op.LOAD_CONST, self.code.add_constant(node.path))
+        self.code.emit(Op.CALL)
+
+
+def disassemble(code: CodeObject, indent: str = ''):
+    print(f"{indent}Code object '{code.name}'" + (f" (param {code.param})" if code.param else ''))
+    nested = []
+    for pc, (op, arg) in enumerate(code.code):
+        name = Op.NAMES[op]
+        if op in (Op.LOAD_NAME, Op.REDECLARE):
+            detail = f"{arg} ({code.names[arg]})"
+        elif op == Op.LOAD_OUTER:
+            detail = f"{arg} {code.addresses[arg]}"
+        elif op in (Op.LOAD_CONST, Op.MAKE_FUNCTION, Op.KERNEL) or op in Op.BINARY_CONST.values():
+            constant = code.constants[arg]
+            if isinstance(constant, CodeObject):
+                nested.append(constant)
+                detail = f"{arg} (<code {constant.name}>)"
+            else:
+                detail = f"{arg} ({constant!r})"
+        elif op in (Op.JUMP, Op.JUMP_IF_FALSE, Op.LOAD_LOCAL, Op.BIND):
+            detail = f"{arg}"
+        else:
+            detail = ''
+        print(f"{indent}{pc:>6} {name:<18} {detail}")
+    for constant in nested:
+        disassemble(constant, indent + '    ')
+
+
+def main():
+    from tokeniser import Tokeniser
+    from parser import Parser
+    from resolver import Resolver
+
+    source = 'fact := n |-> if n > 0 then n*fact(n-1) else 1\nprint(fact(5))\n'
+
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+
+    disassemble(Compiler().compile(parser.ast))
+
+    # 0.0 and -0.0 are equal but print differently, so each has its own slot
+    code = CodeObject('<constants>')
+    print([code.add_constant(value) for value in (0.0, -0.0, 0.0, 0, -0.0)], code.constants)
+
+
+if __name__ == "__main__":
+    main()
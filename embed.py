@@ -0,0 +1,218 @@
+"""Embedding API: compile MathFP source once, then call its functions from
+Python, from any number of threads.
+
+    import embed
+    program = embed.compile('area := r |-> 3.14159*r*r\\nadd := x |-> y |-> x + y\\n')
+    area = program.get('area')
+    area(2.0)             # 12.56636
+    program.get('add')(1, 2)  # 3, curried arguments may be passed together
+
+Compiling runs the program's top-level expressions once. After that the
+program and its global bindings are only ever read: every call gets its own
+frames, so calls from many threads (or calls made from inside a callback
+MathFP is running) never see each other's state.
+"""
+import os
+import sys
+
+from ast_nodes import *
+from closure import Closure
+from codegen import CompilingEvaluator
+from env import Env, UNBOUND
+from eval import BUILTINS, Evaluator
+from memo import Memo
+from optimiser import Optimiser
+from parser import Parser
+from preprocessor import IncludeCache, Preprocessor
+from resolver import Resolver
+from specialise import Specialiser
+from tokeniser import Tokeniser
+from typecheck import TypeChecker
+from vector import Vector
+from vm import VM
+
+
+class CompileError(Exception):
+    pass
+
+
+class QuietTokeniser(Tokeniser):
+    # Collects its errors for the CompileError instead of printing them
+    def __init__(self, source: str, source_map=None):
+        super().__init__(source, source_map)
+        self.errors: list[str] = []
+
+    def report(self, message: str):
+        self.errors.append(message)
+
+
+class QuietTypeChecker(TypeChecker):
+    def report(self, error: str):
+        pass  # Left in `errors`, for the CompileError
+
+
+def name_errors(node: ASTNode) -> list[str]:
+    # What the interpreters would report on reaching `node`: names that are
+    # neither bound nor builtins, and bindings of names already bound
+    if isinstance(node, Var) and node.depth is None and node.name not in BUILTINS:
+        errors = [f"Unknown variable: {node.name}"]
+    elif isinstance(node, Binding) and node.redeclared:
+        errors = [f"Redeclaration of variable: {node.name}"]
+    else:
+        errors = []
+    for child in node.children():
+        errors += name_errors(child)
+    return errors
+
+
+class Function:
+    """A MathFP function as a plain Python callable.
+
+    Calling it with several arguments applies them one at a time, as
+    MathFP's curried functions take them. Functions it returns are wrapped
+    the same way, and Functions passed in are unwrapped again. NumPy arrays
+    passed in become MathFP vectors, and vectors returned become arrays.
+    """
+
+    __slots__ = ('function', 'name')
+
+    def __init__(self, function, name: str):
+        self.function = function  # Closure, Memo or builtin
+        self.name = name
+
+    def __call__(self, *args):
+        if not args:
+            raise TypeError(f"{self.name}() takes at least one argument")
+        result = self.function
+        for arg in args:
+            result = result(unwrap(arg))
+        return wrap(result, self.name)
+
+    def __repr__(self):
+        return f"<MathFP function {self.name}>"
+
+
+def wrap(value, name: str = '<lambda>'):
+    if type(value) is Vector:
+        return value.values
+    if type(value) is Closure:
+        return Function(value, value.name)
+    if type(value) is Memo or callable(value):
+        return Function(value, getattr(value, 'name', name))
+    return value
+
+
+def unwrap(value):
+    if type(value) is Function:
+        return value.function
+    numpy = sys.modules.get('numpy')  # Not an array if NumPy was never imported
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        if value.ndim != 1:
+            raise ValueError(f"expected a one-dimensional array, got one of shape {value.shape}")
+        return Vector(value.astype(numpy.float64))
+    return value
+
+
+class Program:
+    """A compiled and evaluated MathFP program. Read-only once made."""
+
+    def __init__(self, globals: dict[str, int], env: Env, result):
+        self._globals = dict(globals)  # Name -> slot in the global frame
+        self._env = env
+        self.result = result  # Value of the last top-level expression
+
+    @property
+    def names(self):
+        return [name for name, slot in self._globals.items() if self._value(slot) is not UNBOUND]
+
+    def _value(self, slot: int):
+        values = self._env.values
+        return values[slot] if slot < len(values) else UNBOUND
+
+    def _binding(self, name: str):
+        slot = self._globals.get(name)
+        value = UNBOUND if slot is None else self._value(slot)
+        if value is UNBOUND:
+            raise KeyError(f"MathFP program has no binding '{name}'")
+        return value
+
+    def get(self, name: str):
+        """The value bound to `name`; functions come back as Python callables."""
+        return wrap(self._binding(name), name)
+
+    def vectorise(self, name: str):
+        """The one-parameter function bound to `name` as a Python callable
+        applying it to each element of a NumPy array, computed on whole
+        arrays where it is plain arithmetic (see vectorise.py)."""
+        from vectorise import vectorise  # Imports NumPy
+        return vectorise(self._binding(name))
+
+    def __contains__(self, name: str):
+        return name in self.names
+
+
+def compile(source: str, filename: str | None = None, backend: str = 'vm', optimise: bool = False):
+    """Compiles and runs MathFP source, returning the Program. `backend` is
+    one of mfp.py's ('vm', 'tree' or 'py'); with 'py', `get` returns the
+    functions translated into Python functions. `filename` locates included
+    files (default: the current directory). Raises CompileError for
+    preprocessor, syntax and type errors, unknown names and redeclared
+    bindings, with every message found; nothing is printed."""
+    if filename is None:
+        filename = os.path.join(os.getcwd(), '<string>')
+    try:
+        preprocessor = Preprocessor(IncludeCache())  # Nothing shared with other compiles
+        source = preprocessor.preprocess_or_throw(source, filename)
+        lexer = QuietTokeniser(source, preprocessor.source_map)
+        lexer.tokenise()
+        parser = Parser(lexer.tokens, preprocessor.source_map)
+        parser.parse()
+    except Exception as e:
+        raise CompileError(str(e)) from e
+    if lexer.had_error:
+        raise CompileError('\n'.join(lexer.errors))
+
+    program = parser.ast
+    if optimise:
+        Optimiser().optimise(program)
+    resolver = Resolver()
+    resolver.resolve(program)
+    errors = name_errors(program)
+    if errors:
+        raise CompileError('\n'.join(errors))
+    checker = QuietTypeChecker()
+    checker.check(program)
+    if checker.had_error:
+        raise CompileError('\n'.join(checker.errors))
+    Specialiser().specialise(program)
+
+    interpreter = {'tree': Evaluator, 'py': CompilingEvaluator}.get(backend, VM)()
+    env, result = interpreter.execute(program, Env())
+    return Program(resolver.globals, env, wrap(result))
+
+
+def main():
+    program = compile(
+        'area := r |-> 3.14159*r*r\n'
+        'add := x |-> y |-> x + y\n'
+        'fib := memo(n |-> if 2 > n then n else fib(n-1) + fib(n-2))\n'
+        'twice := f |-> x |-> f(f(x))\n'
+    )
+    print(program.names)                           # ['area', 'add', 'fib', 'twice']
+    print(program.get('area')(2.0))                # 12.56636
+    print(program.get('add')(1, 2))                # 3
+    print(program.get('twice')(lambda x: x * 10)(3))  # 300, with a Python callback
+    print(program.get('fib')(90))                  # 2880067194370816120
+
+    try:
+        compile('f := x |-> x*x\nf + 1\n')
+    except CompileError as e:
+        print(e)                                   # in <program>: cannot apply '+' to function
+    try:
+        compile('f := x |-> x*y\nf := 2\n')
+    except CompileError as e:
+        print(e)                                   # Unknown variable: y, Redeclaration of variable: f
+
+
+if __name__ == "__main__":
+    main()
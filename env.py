@@ -1,6 +1,42 @@
-# Environment: immutable dictionary mapping names -> values
-class Env(dict):
-    def extend(self, name, value):
-        new_env = Env(self)
-        new_env[name] = value
-        return new_env
+# Marks a slot that has been declared but not yet bound
+class Unbound:
+    def __repr__(self):
+        return '<unbound>'
+
+
+UNBOUND = Unbound()
+
+
+# Environment: a frame of values addressed by slot, linked to its enclosing frame.
+# The Resolver assigns every variable a (depth, slot) address, so frames never
+# need to be copied: function calls create a fresh one-slot frame and top-level
+# bindings fill in slots of the global frame.
+class Env:
+    def __init__(self, values: list | None = None, parent: 'Env | None' = None):
+        self.values = values if values is not None else []
+        self.parent = parent
+
+    def lookup(self, depth: int, slot: int):
+        env = self
+        for _ in range(depth):
+            env = env.parent
+        values = env.values
+        return values[slot] if slot < len(values) else UNBOUND
+
+    def define(self, slot: int, value):
+        values = self.values
+        while len(values) <= slot:
+            values.append(UNBOUND)
+        values[slot] = value
+
+    def force(self, depth: int, slot: int):
+        # For a slot `lookup` found UNBOUND: its value if its frame can still
+        # compute it, else UNBOUND
+        env = self
+        for _ in range(depth):
+            env = env.parent
+        return env.unbound(slot)
+
+    def unbound(self, slot: int):
+        # Frames of lazily evaluated programs compute their slots on demand (see lazy.py)
+        return UNBOUND
@@ -2,7 +2,13 @@ import math
 import sys
 
 from ast_nodes import *
-from env import Env
+from closure import Closure
+from env import Env, UNBOUND
+from memo import builtin_memo, builtin_memo_lru
+from resolver import Resolver
+from sequence import builtin_filter, builtin_fold, builtin_iterate, builtin_map, builtin_range, builtin_take
+from vector import (Elementwise, builtin_linspace, builtin_max, builtin_sum, builtin_vector, builtin_where,
+                    builtin_zeros, load_vector)
 
 
 # Built-in functions
@@ -23,15 +29,56 @@ BUILTINS = {
 
     'print': print,
 
-    # Math functions
-    "exp": math.exp,
-    "ln": math.log,
-    "sin": math.sin,
-    "cos": math.cos,
+    # Memoization
+    'memo': builtin_memo,
+    'memo_lru': builtin_memo_lru,
+
+    # Lazy sequences
+    'range': builtin_range,
+    'map': builtin_map,
+    'filter': builtin_filter,
+    'fold': builtin_fold,
+    'take': builtin_take,
+    'iterate': builtin_iterate,
+    'sum': builtin_sum,
+    'max': builtin_max,
+
+    # Vectors
+    'linspace': builtin_linspace,
+    'zeros': builtin_zeros,
+    'vector': builtin_vector,
+    'where': builtin_where,
+
+    # Math functions, elementwise on vectors
+    "exp": Elementwise(math.exp, 'exp'),
+    "ln": Elementwise(math.log, 'log'),
+    "sin": Elementwise(math.sin, 'sin'),
+    "cos": Elementwise(math.cos, 'cos'),
 }
 
 
 class Evaluator(ASTVisitor):
+    def execute(self, program: Program, env: Env):
+        return program.accept(env, self)
+
+    def call(self, closure: Closure, arg):
+        # Trampoline: a call in tail position (the function body, or a branch of
+        # an if in tail position) reuses this loop instead of a new Python frame.
+        while True:
+            env = Env([arg], closure.env)
+            node = closure.function.body
+            while type(node) is IfExpr:
+                _, cond = node.cond.accept(env, self)
+                node = builtin_if(cond, node.then_expr, node.else_expr)
+            if type(node) is not FunctionCall:
+                return node.accept(env, self)[1]
+
+            _, func = node.func.accept(env, self)
+            _, arg = node.arg.accept(env, self)
+            if type(func) is not Closure or func.interpreter is not self:
+                return func(arg)
+            closure = func
+
     def visit_program(self, env: Env, node: Program):
         result = None
         for node in node.exprs:
@@ -42,48 +89,48 @@ class Evaluator(ASTVisitor):
         return env, node.value
     
     def visit_var(self, env, node):
-        if node.name in env:
-            return env, env[node.name]
+        if node.depth is not None:
+            value = env.lookup(node.depth, node.slot)
+            if value is not UNBOUND:
+                return env, value
+            value = env.force(node.depth, node.slot)
+            if value is not UNBOUND:
+                return env, value
         elif node.name in BUILTINS:
             return env, BUILTINS[node.name]
-        else:
-            print(f"[mfp] Unknown variable: {node.name}", file=sys.stderr)
-            return env, None
+        print(f"[mfp] Unknown variable: {node.name}", file=sys.stderr)
+        return env, None
 
     def visit_binding(self, env: Env, node: Binding):
         _, value = node.expr.accept(env, self)
-        if node.name in env:
+        if node.redeclared:
             print(f"[mfp] Redeclaration of variable: {node.name}", file=sys.stderr)
             return env, None
-        if isinstance(node.expr, FunctionDef_):  # To enable self-reference (recursion)
-            inner: FunctionDef_ = node.expr
-            inner.local_env = inner.local_env.extend(node.name, value)
-        return env.extend(node.name, value), None
+        if node.slot is not None:
+            env.define(node.slot, value)
+        return env, None
     
     def visit_functiondef(self, env: Env, node: FunctionDef_):
-        param = node.param
-        body = node.body
-        def func(param_value):
-            # Inherit outer scope
-            for key, val in env.items():
-                if key not in node.local_env:
-                    node.local_env[key] = val
-            node.local_env = node.local_env.extend(param, param_value)  # Add param variable
-            return body.accept(node.local_env, self)[1]
-        return env, func
+        return env, Closure(node, env, self)
     
     def visit_functioncall(self, env: Env, node: FunctionCall):
         _, func = node.func.accept(env, self)
         _, arg = node.arg.accept(env, self)
+        if type(func) is Closure and func.interpreter is self:
+            return env, self.call(func, arg)
         return env, func(arg)
     
     def visit_binaryop(self, env: Env, node: BinaryOp):
+        if node.kernel is not None:
+            return env, node.kernel.function(env)
         _, left = node.left.accept(env, self)
         _, right = node.right.accept(env, self)
         op_func = BUILTINS[node.op]
         return env, op_func(left, right)
     
     def visit_unaryop(self, env, node):
+        if node.kernel is not None:
+            return env, node.kernel.function(env)
         _, right = node.right.accept(env, self)
         return env, -right
     
@@ -93,6 +140,9 @@ class Evaluator(ASTVisitor):
         _, value = lazy_branch.accept(env, self)
         return env, value
 
+    def visit_load(self, env: Env, node: Load):
+        return env, load_vector(node.path)
+
 
 def main():
     ## Build AST
@@ -113,10 +163,12 @@ def main():
         ),
         FunctionCall( Var('a'), Var('b') ),
     ]
-    visitor = Evaluator()
-    env = Env()
+    program = Program()
     for expr in exprs:
-        env, res = expr.accept(env, visitor)
+        program.add_expression(expr)
+    Resolver().resolve(program)
+
+    env, res = Evaluator().execute(program, Env())
 
     print(res)  # Should print 0
 
@@ -0,0 +1,110 @@
+from collections.abc import Callable
+
+from ast_nodes import *
+from env import Env, UNBOUND
+
+
+def eager_reads(node: ASTNode) -> list[int]:
+    """The global slots a top-level expression reads every time it is
+    evaluated, in order: not those read only in function bodies, which may
+    never run, or in one branch of an `if`."""
+    if isinstance(node, Var):
+        return [node.slot] if node.depth == 0 else []
+    if isinstance(node, FunctionDef_):
+        return []
+    if isinstance(node, IfExpr):
+        return eager_reads(node.cond)
+    return [slot for child in node.children() for slot in eager_reads(child)]
+
+
+class LazyEnv(Env):
+    """The global frame of a program run by `execute_lazily`.
+
+    The slot of a top-level binding stays UNBOUND until it is first read,
+    which loads and evaluates the binding (call by need); later reads find
+    the value in the slot like any other. A binding leaves `pending` before
+    it is evaluated, so reading it from its own expression finds it unbound,
+    as it would be if the program ran in order.
+    """
+
+    def __init__(self, interpreter):
+        super().__init__()
+        self.interpreter = interpreter
+        self.pending: dict[int, Callable[[], Binding]] = {}  # Slot -> loader of a binding not evaluated yet
+
+    def unbound(self, slot: int):
+        if slot not in self.pending:
+            return UNBOUND
+
+        # The bindings it reads are evaluated first, depth first, so that a
+        # long chain of bindings reading each other does not nest Python calls
+        order, stack, bindings = [], [(slot, False)], {}
+        while stack:
+            read, expanded = stack.pop()
+            if expanded:
+                order.append(read)
+            elif read not in bindings and read in self.pending:
+                binding = bindings[read] = self.pending[read]()
+                stack.append((read, True))
+                stack.extend((dependency, False) for dependency in reversed(eager_reads(binding.expr)))
+        for read in order:
+            if self.pending.pop(read, None) is not None:
+                program = Program()
+                program.add_expression(bindings[read])
+                self.interpreter.execute(program, self)
+        return self.lookup(0, slot)
+
+
+def expressions(program: Program):
+    # The top-level expressions of a resolved program as execute_lazily takes them
+    return [(expr.slot if isinstance(expr, Binding) else None, lambda expr=expr: expr) for expr in program.exprs]
+
+
+def execute_lazily(exprs: list[tuple[int | None, Callable[[], ASTNode]]], interpreter):
+    """Runs a resolved program as `interpreter.execute(program, Env())`
+    would, except that each top-level binding is evaluated when it is first
+    read, if ever. Other expressions run in order, so what they print still
+    comes out in order.
+
+    The expressions are given as (slot, load) pairs, where `slot` is that
+    of the binding the expression makes (None if it makes none) and
+    `load()` returns it: a program loaded from its cache file (see mfpc.py)
+    only unpickles the bindings that are read.
+    """
+    env = LazyEnv(interpreter)
+    result = None
+    for slot, load in exprs:
+        if slot is not None:
+            env.pending[slot] = load
+            result = None
+        else:
+            program = Program()
+            program.add_expression(load())
+            _, result = interpreter.execute(program, env)
+    return env, result
+
+
+def main():
+    from tokeniser import Tokeniser
+    from parser import Parser
+    from resolver import Resolver
+    from vm import VM
+
+    source = (
+        'fib := n |-> if 2 > n then n else fib(n-1) + fib(n-2)\n'
+        'slow := fib(30)\n'
+        'fast := fib(10)\n'
+        'print(fast)\n'
+    )
+
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+    env, _ = execute_lazily(expressions(parser.ast), VM())  # Prints 55 without computing fib(30)
+    print(sorted(env.pending))                              # [1]: `slow` was never read
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+from types import FunctionType
+
+from closure import Closure
+
+
+MEMO_MAXSIZE = 1024
+
+
+# Marks a cache miss
+class Missing:
+    def __repr__(self):
+        return '<missing>'
+
+
+MISSING = Missing()
+
+
+# Memoized function: caches results keyed on the argument, evicting the least
+# recently used entry once `maxsize` results are cached. Results that are
+# themselves functions (partial applications of a curried function, as
+# Closures or as the 'py' backend's Python functions) are memoized as well,
+# so every level of a curried call is cached. The cache is locked, so one
+# Memo can be called from many threads; the function itself runs unlocked,
+# and two threads missing on one key may both compute it.
+class Memo:
+    def __init__(self, func, maxsize: int = MEMO_MAXSIZE):
+        if maxsize < 1:
+            raise ValueError(f"memo: cache size must be positive, got {maxsize}")
+        self.func = func
+        self.maxsize = maxsize
+        self.cache: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        if type(self.func) is FunctionType:
+            return getattr(self.func, 'name', self.func.__name__)  # Generated by the 'py' backend
+        return getattr(self.func, 'name', '<builtin>')
+
+    @staticmethod
+    def key(arg):
+        # 1 and 1.0 compare equal but must not share a cache entry
+        key = (type(arg), arg)
+        try:
+            hash(key)
+        except TypeError:
+            return None  # Unhashable arguments are never cached
+        return key
+
+    def get(self, key):
+        with self.lock:
+            if key is None or key not in self.cache:
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+    def store(self, key, value):
+        if type(value) is Closure or type(value) is FunctionType:
+            value = Memo(value, self.maxsize)
+        if key is not None:
+            with self.lock:
+                self.cache[key] = value
+                if len(self.cache) > self.maxsize:
+                    self.cache.popitem(last=False)
+        return value
+
+    def __call__(self, arg):
+        key = self.key(arg)
+        value = self.get(key)
+        if value is MISSING:
+            value = self.store(key, self.func(arg))
+        return value
+
+    def __repr__(self):
+        return (f"<memo {self.name}: hits={self.hits} misses={self.misses} "
+                f"size={len(self.cache)}/{self.maxsize}>")
+
+
+def builtin_memo(func):
+    return Memo(func)
+
+
+def builtin_memo_lru(maxsize):
+    return lambda func: Memo(func, maxsize)
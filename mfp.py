@@ -1,17 +1,48 @@
-import sys
+import argparse
 import os
+import sys
 
+import mfpc
 from util import try_read_file
 from preprocessor import Preprocessor
 from tokeniser import Tokeniser
 from parser import Parser
+from ast_nodes import Program
+from resolver import Resolver
+from optimiser import Optimiser
+from typecheck import TypeChecker
+from specialise import Specialiser
+from compiler import Compiler
 from eval import Env, Evaluator
+from codegen import CompilingEvaluator
+from vm import VM
+from profiler import Profiler, ProfilingEvaluator
+from stats import RuntimeStats, describe
+from batch import run_batch
+from parallel import evaluate_parallel
+from watch import watch
+from lazy import execute_lazily
+
 
+def make_interpreter(backend: str, profiler: Profiler | RuntimeStats | None = None):
+    if backend == 'py' and profiler is not None:
+        # Profiling hooks into the Evaluator's calls, which Python functions bypass
+        print("[mfp] Profiling runs the 'py' backend's functions on the tree backend", file=sys.stderr)
+        backend = 'tree'
+    if backend == 'py':
+        return CompilingEvaluator()
+    if backend == 'tree':
+        return Evaluator() if profiler is None else ProfilingEvaluator(profiler)
+    return VM(profiler)
 
-def run_repl():
+
+def run_repl(backend: str = 'vm', optimise: bool = False, stats: RuntimeStats | None = None):
     print("MathFP REPL. Type 'exit' to quit.")
     env = Env()
-    evaluator = Evaluator()
+    resolver = Resolver()
+    checker = TypeChecker()
+    optimiser = Optimiser() if optimise else None
+    interpreter = make_interpreter(backend, stats)
     while True:
         line = input(">>> ")
         if line.strip() == "exit":
@@ -21,46 +52,245 @@ def run_repl():
         line = preprocessor.preprocess(line, os.path.join(os.getcwd(), '<repl>'))
         if preprocessor.had_error:
             continue
-        lexer = Tokeniser(line)
+        lexer = Tokeniser(line, preprocessor.source_map)
         lexer.tokenise()
-        parser = Parser(lexer.tokens)
+        parser = Parser(lexer.tokens, preprocessor.source_map)
         parser.parse()
         if lexer.had_error:
             continue
         
-        env, result = parser.ast.accept(env, evaluator)
+        if optimiser is not None:
+            optimiser.optimise(parser.ast)
+        resolver.resolve(parser.ast)
+        checker.check(parser.ast)
+        if checker.had_error:
+            continue
+        Specialiser().specialise(parser.ast)
+        if stats is None:
+            env, result = interpreter.execute(parser.ast, env)
+        else:
+            with stats.expression(line.strip(), env) as line_stats:
+                env, result = interpreter.execute(parser.ast, env)
         if result is not None:
             print(result)
+        if stats is not None:
+            print(f"[mfp] envs={line_stats.envs} entries={line_stats.env_entries} "
+                  f"closures={line_stats.closures} depth={line_stats.max_depth} "
+                  f"peak={line_stats.peak_kb:.1f}KB kept={line_stats.retained_kb:.1f}KB", file=sys.stderr)
 
 
-def run_file(filepath: str):
+def load_program(filepath: str, optimise: bool = False):
+    # Preprocesses, parses, optimises and resolves a file, returning None on errors
     source = try_read_file(os.path.abspath(filepath))
-    source = Preprocessor().preprocess(source, filepath)
-    lexer = Tokeniser(source)
+    preprocessor = Preprocessor()
+    source = preprocessor.preprocess(source, filepath)
+    if preprocessor.had_error:
+        return None
+    lexer = Tokeniser(source, preprocessor.source_map)
     lexer.tokenise()
-    parser = Parser(lexer.tokens)
+    parser = Parser(lexer.tokens, preprocessor.source_map)
     parser.parse()
-    env = Env()
-    evaluator = Evaluator()
-    if not lexer.had_error:
-        env, result = parser.ast.accept(env, evaluator)
+    if lexer.had_error:
+        return None
+    eliminated = 0
+    if optimise:
+        optimiser = Optimiser()
+        optimiser.optimise(parser.ast)
+        eliminated = optimiser.eliminated
+    Resolver().resolve(parser.ast)
+    checker = TypeChecker()
+    checker.check(parser.ast)
+    if checker.had_error:
+        return None
+    Specialiser().specialise(parser.ast)
+    return mfpc.CachedProgram(parser.ast, mfpc.hash_files(preprocessor.included_files), eliminated)
+
 
+def run_file(filepath: str, backend: str = 'vm', optimise: bool = False, use_cache: bool = True,
+             profiler: Profiler | RuntimeStats | None = None, parallel: int | None = None, lazy: bool = False):
+    cached = mfpc.load(filepath, optimise) if use_cache else None
+    changed = cached is None
+    if cached is None:
+        cached = load_program(filepath, optimise)
+        if cached is None:
+            return
+    if optimise:
+        print(f"[mfp] Optimiser eliminated {cached.eliminated} nodes", file=sys.stderr)
 
-def print_usage():
-    print("Usage: mfp.py MFP_SOURCE")
-    print("    MFP_SOURCE: path to source file")
+    interpreter = make_interpreter(backend, profiler)
+    # Profiling code is compiled separately and never cached, and lazily
+    # evaluated bindings are compiled when they are first read
+    use_code = isinstance(interpreter, VM) and profiler is None and parallel is None and not lazy
+    if use_code and cached.code is None:
+        cached.code = Compiler().compile(cached.program)
+        changed = True
+    if use_cache and changed:
+        mfpc.store(filepath, cached, optimise)
+
+    if use_code:
+        env, result = interpreter.run(cached.code, Env())
+    elif lazy:
+        env, result = execute_lazily(cached.expressions(), interpreter)
+    elif parallel is not None:
+        env, result = evaluate_parallel(cached.program, type(interpreter), parallel or None)
+    elif isinstance(profiler, RuntimeStats):
+        # One expression at a time, to attribute what each one allocates
+        env = Env()
+        for expr in cached.program.exprs:
+            program = Program()
+            program.add_expression(expr)
+            with profiler.expression(describe(expr), env):
+                env, result = interpreter.execute(program, env)
+    else:
+        env, result = interpreter.execute(cached.program, Env())
+
+
+def run_file_streaming(filepath: str, backend: str = 'vm', optimise: bool = False,
+                       profiler: Profiler | RuntimeStats | None = None):
+    # Each top-level expression is evaluated as soon as it has been parsed,
+    # so memory use is bounded by the largest expression, not the file.
+    env = Env()
+    resolver = Resolver()
+    checker = TypeChecker()
+    specialiser = Specialiser()
+    optimiser = Optimiser() if optimise else None
+    interpreter = make_interpreter(backend, profiler)
+    with open(os.path.abspath(filepath)) as f:
+        preprocessor = Preprocessor()
+        lexer = Tokeniser(preprocessor.iter_lines(f, filepath), preprocessor.source_map)
+        parser = Parser(lexer.iter_tokens(), preprocessor.source_map)
+        for expr in parser.iter_expressions():
+            if lexer.had_error:
+                break  # As in run_file, nothing after a bad character runs
+            program = Program()
+            program.add_expression(expr)
+            if optimiser is not None:
+                optimiser.optimise(program)
+            resolver.resolve(program)
+            checker.check(program)
+            if checker.had_error:
+                break
+            specialiser.specialise(program)
+            if isinstance(profiler, RuntimeStats):
+                with profiler.expression(describe(expr), env):
+                    env, result = interpreter.execute(program, env)
+            else:
+                env, result = interpreter.execute(program, env)
+    if optimiser is not None:
+        print(f"[mfp] Optimiser eliminated {optimiser.eliminated} nodes", file=sys.stderr)
 
 
 def main():
-    argc = len(sys.argv)
+    arg_parser = argparse.ArgumentParser(prog='mfp.py', description='MathFP interpreter')
+    arg_parser.add_argument('sources', nargs='*', metavar='MFP_SOURCE',
+                            help='source files or directories of them (starts the REPL if omitted)')
+    arg_parser.add_argument('--backend', choices=('vm', 'tree', 'py'), default='vm',
+                            help="'vm' compiles to bytecode (default), 'tree' uses the tree-walking Evaluator, "
+                                 "'py' translates functions into Python functions; only 'vm' runs non-tail "
+                                 "recursion deeper than about 200 calls")
+    arg_parser.add_argument('-O', dest='optimise', action='store_true',
+                            help='fold constants and inline small functions before running')
+    arg_parser.add_argument('--stream', action='store_true',
+                            help='evaluate each top-level expression as soon as it is parsed, '
+                                 'without reading the whole file into memory first')
+    arg_parser.add_argument('--no-cache', action='store_true',
+                            help=f'do not read or write parsed programs in {mfpc.CACHE_DIR}/')
+    arg_parser.add_argument('--profile', action='store_true',
+                            help='report calls and time per MathFP function on stderr')
+    arg_parser.add_argument('--profile-stacks', metavar='PATH',
+                            help='profile and write collapsed stacks (for flame graphs) to PATH; '
+                                 'with --profile, the same run also reports on stderr')
+    arg_parser.add_argument('--stats', action='store_true',
+                            help='report environments, closures, call depth and memory '
+                                 'per top-level expression on stderr')
+    arg_parser.add_argument('-j', '--jobs', type=int, metavar='N',
+                            help='run files in parallel on N worker processes, or serve on N workers '
+                                 'with --serve (default: one per CPU)')
+    arg_parser.add_argument('--ordered', action='store_true',
+                            help='with several files, report them in the order given rather than '
+                                 'as each one finishes')
+    arg_parser.add_argument('--parallel', type=int, metavar='N',
+                            help='evaluate top-level expressions that do not depend on each other '
+                                 'at the same time on N worker processes (0: one per CPU)')
+    arg_parser.add_argument('--lazy', action='store_true',
+                            help='evaluate each top-level binding when it is first used rather than '
+                                 'in order, so unused definitions cost nothing to run')
+    arg_parser.add_argument('--watch', action='store_true',
+                            help='run the file again whenever it or a file it includes changes, '
+                                 'evaluating only what the change affects')
+    arg_parser.add_argument('--serve', metavar='SOCKET',
+                            help='serve evaluation requests on a Unix socket (see client.py)')
+    arg_parser.add_argument('--max-steps', type=int, metavar='N',
+                            help='with --serve, the most MathFP calls one request may make (default: 10,000,000)')
+    arg_parser.add_argument('--max-seconds', type=float, metavar='S',
+                            help='with --serve, the longest one request may run (default: 10s)')
+    args = arg_parser.parse_args()
 
-    if argc == 1:
-        run_repl()
-    elif argc == 2:
-        run_file(sys.argv[1])
-    else:
-        print_usage()
-        exit(1)
+    if args.stats and (args.profile or args.profile_stacks):
+        arg_parser.error('--stats cannot be combined with --profile or --profile-stacks')
+    if args.serve is not None:
+        if args.sources or args.stream or args.profile or args.profile_stacks or args.stats \
+                or args.parallel is not None or args.watch or args.lazy:
+            arg_parser.error('--serve takes no source files and cannot be combined with --stream, '
+                             '--profile, --stats, --parallel, --watch or --lazy')
+        if args.backend == 'py':
+            arg_parser.error("--serve needs the 'vm' or 'tree' backend, which can enforce step budgets")
+        from server import run_server  # asyncio is slow to import, and only the server needs it
+        run_server(args.serve, args.jobs, args.backend, args.optimise, args.max_steps, args.max_seconds)
+        return
+
+    if len(args.sources) > 1 or args.jobs is not None or any(map(os.path.isdir, args.sources)):
+        if args.stream or args.profile or args.profile_stacks or args.stats or args.watch or args.lazy:
+            arg_parser.error('--stream, --profile, --stats, --watch and --lazy take a single source file')
+        if args.parallel is not None:
+            arg_parser.error('--parallel takes a single source file; use -j to run files in parallel')
+        failed = run_batch(args.sources, args.jobs, args.backend, args.optimise, not args.no_cache, args.ordered)
+        sys.exit(1 if failed else 0)
+    args.source = args.sources[0] if args.sources else None
+    if args.parallel is not None and (args.source is None or args.stream or args.profile
+                                      or args.profile_stacks or args.stats):
+        arg_parser.error('--parallel needs a source file and cannot be combined with --stream, '
+                         '--profile or --stats')
+
+    if args.watch and (args.source is None or args.optimise or args.stream or args.profile
+                       or args.profile_stacks or args.stats or args.parallel is not None):
+        # The optimiser inlines earlier bindings by what it saw of them,
+        # which editing them would make out of date
+        arg_parser.error('--watch needs a source file and cannot be combined with -O, --stream, '
+                         '--profile, --stats or --parallel')
+    if args.lazy and (args.source is None or args.stream or args.stats or args.parallel is not None
+                      or args.watch):
+        arg_parser.error('--lazy needs a source file and cannot be combined with --stream, --stats, '
+                         '--parallel or --watch')
+
+    profiler = Profiler() if args.profile or args.profile_stacks else None
+    if args.stats:
+        profiler = RuntimeStats()
+    try:
+        if args.source is None:
+            run_repl(args.backend, args.optimise, profiler if args.stats else None)
+        elif args.watch:
+            watch(args.source, make_interpreter(args.backend))
+        elif args.stream:
+            run_file_streaming(args.source, args.backend, args.optimise, profiler)
+        else:
+            run_file(args.source, args.backend, args.optimise, not args.no_cache, profiler, args.parallel,
+                     args.lazy)
+    finally:
+        if args.stats:
+            profiler.stop()
+            if args.source is not None:
+                print(profiler.report(), file=sys.stderr)
+        elif profiler is not None:
+            write_profile(profiler, args.profile, args.profile_stacks)
+
+
+def write_profile(profiler: Profiler, report: bool, stacks_path: str | None):
+    if report:
+        print(profiler.report(), file=sys.stderr)
+    if stacks_path is not None:
+        with open(stacks_path, 'w') as f:
+            f.write(profiler.collapsed_stacks() + '\n')
 
 
 if __name__ == '__main__':
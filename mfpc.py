@@ -0,0 +1,134 @@
+import functools
+import hashlib
+import os
+import pickle
+
+from ast_nodes import Binding, Program
+from compiler import CodeObject
+from lazy import expressions
+
+
+MAGIC = b'MFPC\x01'
+CACHE_DIR = '__mfpcache__'
+
+# Modules whose code decides what ends up in a cache file. Files written by
+# a different version of any of them are rebuilt instead of loaded.
+FRONT_END_MODULES = ('ast_nodes', 'util', 'preprocessor', 'tokeniser', 'parser', 'optimiser',
+                     'resolver', 'typecheck', 'specialise', 'compiler', 'mfpc')
+
+
+class CachedProgram:
+    """A resolved (and possibly optimised) Program, with the hashes of every
+    file it was built from. `code` is its compiled CodeObject, filled in the
+    first time it runs on the VM.
+
+    Each top-level expression, and the code, is pickled on its own and
+    unpickled when first used, so a lazily evaluated run (see lazy.py) only
+    loads the bindings it reads.
+    """
+
+    def __init__(self, program: Program, dependencies: dict[str, bytes], eliminated: int = 0):
+        self.program = program
+        self.dependencies = dependencies  # realpath -> SHA-256 of the contents
+        self.eliminated = eliminated      # Nodes the optimiser eliminated, for -O
+        self.code: CodeObject | None = None
+
+    def __getstate__(self):
+        return {
+            'dependencies': self.dependencies,
+            'eliminated': self.eliminated,
+            'exprs': [(expr.slot if isinstance(expr, Binding) else None,
+                       pickle.dumps(expr, protocol=pickle.HIGHEST_PROTOCOL)) for expr in self.program.exprs],
+            'code': None if self.code is None else pickle.dumps(self.code, protocol=pickle.HIGHEST_PROTOCOL),
+        }
+
+    def __setstate__(self, state):
+        self.dependencies = state['dependencies']
+        self.eliminated = state['eliminated']
+        self.pickled_exprs: list[tuple[int | None, bytes]] = state['exprs']
+        self.pickled_code: bytes | None = state['code']
+
+    def __getattr__(self, name: str):
+        # `program` and `code` of a loaded file, unpickled on first use
+        if name == 'program':
+            self.program = Program()
+            for _, data in self.pickled_exprs:
+                self.program.add_expression(pickle.loads(data))
+            return self.program
+        if name == 'code':
+            self.code = None if self.pickled_code is None else pickle.loads(self.pickled_code)
+            return self.code
+        raise AttributeError(name)
+
+    def expressions(self):
+        """The top-level expressions as lazy.execute_lazily takes them, which
+        are only unpickled if they are run."""
+        if 'program' in self.__dict__:
+            return expressions(self.program)
+        return [(slot, functools.partial(pickle.loads, data)) for slot, data in self.pickled_exprs]
+
+    def is_valid(self):
+        try:
+            return all(file_hash(path) == digest for path, digest in self.dependencies.items())
+        except OSError:
+            return False
+
+
+def file_hash(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+def hash_files(paths) -> dict[str, bytes]:
+    return {path: file_hash(path) for path in sorted(paths)}
+
+
+@functools.cache
+def front_end_fingerprint() -> bytes:
+    directory = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for name in FRONT_END_MODULES:
+        digest.update(file_hash(os.path.join(directory, f"{name}.py")))
+    return digest.digest()
+
+
+def cache_path(source_path: str, optimise: bool = False):
+    # Like __pycache__: examples/main.mfp -> examples/__mfpcache__/main.mfp.mfpc
+    directory, name = os.path.split(os.path.realpath(source_path))
+    tag = '.opt' if optimise else ''
+    return os.path.join(directory, CACHE_DIR, f"{name}{tag}.mfpc")
+
+
+def load(source_path: str, optimise: bool = False) -> CachedProgram | None:
+    """Returns the cached program for `source_path`, or None if there is no
+    cache file or any file it was built from has changed since."""
+    try:
+        with open(cache_path(source_path, optimise), 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC or f.read(32) != front_end_fingerprint():
+                return None
+            cached = pickle.load(f)
+    except Exception:
+        return None  # Missing, unreadable or corrupt; rebuilt by the caller
+    if not isinstance(cached, CachedProgram) or not cached.is_valid():
+        return None
+    return cached
+
+
+def store(source_path: str, cached: CachedProgram, optimise: bool = False):
+    """Writes the cache file, silently giving up if that is not possible
+    (read-only directory, AST too deep to pickle, ...)."""
+    path = cache_path(source_path, optimise)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = pickle.dumps(cached, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(temp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(front_end_fingerprint())
+            f.write(data)
+        os.replace(temp_path, path)  # Concurrent runs never see a partial file
+    except (OSError, pickle.PicklingError, RecursionError):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
@@ -0,0 +1,242 @@
+from ast_nodes import *
+from env import Env
+from eval import BUILTINS, builtin_if
+
+
+def count_nodes(node: ASTNode) -> int:
+    return 1 + sum(count_nodes(child) for child in node.children())
+
+
+def free_variables(node: ASTNode, bound: frozenset[str] = frozenset()) -> set[str]:
+    if isinstance(node, Var):
+        return set() if node.name in bound else {node.name}
+    if isinstance(node, FunctionDef_):
+        return free_variables(node.body, bound | {node.param})
+    free = set()
+    for child in node.children():
+        free |= free_variables(child, bound)
+    return free
+
+
+def contains(node: ASTNode, node_type: type, predicate=lambda node: True) -> bool:
+    if isinstance(node, node_type) and predicate(node):
+        return True
+    return any(contains(child, node_type, predicate) for child in node.children())
+
+
+class Substitution(ASTVisitor):
+    """Copies an AST, replacing free occurrences of `name` with copies of `value`."""
+
+    def __init__(self, name: str | None, value: Number | Var):
+        self.name = name
+        self.value = value
+
+    def visit_program(self, env: Env, node: Program):
+        raise RuntimeError("Cannot substitute into a whole program")
+
+    def visit_number(self, env: Env, node: Number):
+        return Number(node.value)
+
+    def visit_var(self, env: Env, node: Var):
+        if node.name != self.name:
+            return Var(node.name)
+        if isinstance(self.value, Number):
+            return Number(self.value.value)
+        return Var(self.value.name)
+
+    def visit_binding(self, env: Env, node: Binding):
+        return Binding(node.name, node.expr.accept(env, self))
+
+    def visit_functiondef(self, env: Env, node: FunctionDef_):
+        if node.param == self.name:  # Shadowed, copy the body unchanged
+            return FunctionDef_(node.param, node.body.accept(env, Substitution(None, self.value)), node.name)
+        return FunctionDef_(node.param, node.body.accept(env, self), node.name)
+
+    def visit_functioncall(self, env: Env, node: FunctionCall):
+        return FunctionCall(node.func.accept(env, self), node.arg.accept(env, self))
+
+    def visit_binaryop(self, env: Env, node: BinaryOp):
+        return BinaryOp(node.left.accept(env, self), node.op, node.right.accept(env, self))
+
+    def visit_unaryop(self, env: Env, node: UnaryOp):
+        return UnaryOp(node.op, node.right.accept(env, self))
+
+    def visit_ifexpr(self, env: Env, node: IfExpr):
+        return IfExpr(node.cond.accept(env, self), node.then_expr.accept(env, self), node.else_expr.accept(env, self))
+
+    def visit_load(self, env: Env, node: Load):
+        return Load(node.path)
+
+
+class InlineCandidate:
+    def __init__(self, function: FunctionDef_, free_globals: set[str], free_builtins: set[str]):
+        self.function = function
+        self.free_globals = free_globals    # Globals the body refers to
+        self.free_builtins = free_builtins  # Other names, which were not globals when it was defined
+
+
+class Optimiser(ASTVisitor):
+    """Rewrites an unresolved AST into a cheaper equivalent one.
+
+    - Folds BinaryOp/UnaryOp on constants and IfExpr with a constant condition
+    - Propagates top-level bindings of constants
+    - Beta-reduces immediately applied lambdas whose argument is a constant or
+      a bound variable
+    - Inlines calls to small non-recursive top-level functions
+
+    Knowledge about top-level bindings persists between calls to `optimise`,
+    so the REPL can optimise one line at a time. Visitor methods return the
+    rewritten node; the `env` argument is unused.
+    """
+
+    INLINE_MAX_NODES = 16
+
+    def __init__(self):
+        self.globals: set[str] = set()
+        self.constants: dict[str, int | float] = {}
+        self.inline_candidates: dict[str, InlineCandidate] = {}
+        self.params: list[str] = []  # Parameters in scope, innermost last
+        self.eliminated = 0
+
+    def optimise(self, program: Program):
+        before = count_nodes(program)
+        program.accept(None, self)
+        self.eliminated += before - count_nodes(program)
+        return program
+
+    def visit_program(self, env: Env, node: Program):
+        exprs = []
+        for expr in node.exprs:
+            if isinstance(expr, Binding):
+                expr.expr = expr.expr.accept(env, self)
+                self.declare_global(expr)
+                exprs.append(expr)
+            else:
+                exprs.append(expr.accept(env, self))
+        node.exprs = exprs
+        return node
+
+    def declare_global(self, node: Binding):
+        if node.name in self.globals:
+            return  # Redeclaration, the binding has no effect
+        if isinstance(node.expr, Number):
+            self.constants[node.name] = node.expr.value
+        elif isinstance(node.expr, FunctionDef_) and self.can_inline(node.name, node.expr):
+            free = free_variables(node.expr)
+            self.inline_candidates[node.name] = InlineCandidate(
+                node.expr, free & self.globals, free - self.globals)
+        self.globals.add(node.name)
+
+    def can_inline(self, name: str, node: FunctionDef_):
+        return (count_nodes(node) <= self.INLINE_MAX_NODES
+                and name not in free_variables(node)
+                and not contains(node.body, Binding))
+
+    def visit_number(self, env: Env, node: Number):
+        return node
+
+    def visit_var(self, env: Env, node: Var):
+        if node.name not in self.params and node.name in self.constants:
+            return Number(self.constants[node.name])
+        return node
+
+    def visit_binding(self, env: Env, node: Binding):
+        # Bindings nested inside other expressions never extend the environment
+        node.expr = node.expr.accept(env, self)
+        return node
+
+    def visit_functiondef(self, env: Env, node: FunctionDef_):
+        self.params.append(node.param)
+        node.body = node.body.accept(env, self)
+        self.params.pop()
+        return node
+
+    def visit_functioncall(self, env: Env, node: FunctionCall):
+        node.func = node.func.accept(env, self)
+        node.arg = node.arg.accept(env, self)
+
+        func = node.func
+        if isinstance(func, Var) and func.name not in self.params and func.name in self.inline_candidates:
+            candidate = self.inline_candidates[func.name]
+            if self.can_substitute(candidate.function, node.arg) and self.same_meaning(candidate):
+                return self.beta_reduce(candidate.function, node.arg)
+        if isinstance(func, FunctionDef_) and not contains(func.body, Binding) \
+                and self.can_substitute(func, node.arg):
+            return self.beta_reduce(func, node.arg)
+        return node
+
+    def can_substitute(self, func: FunctionDef_, arg: ASTNode):
+        if isinstance(arg, Number):
+            return True
+        if isinstance(arg, Var):
+            # Must be bound (so evaluating it has no side effects) and not
+            # captured by a lambda inside the body
+            bound = arg.name in self.params or arg.name in self.globals
+            captured = contains(func.body, FunctionDef_, lambda inner: inner.param == arg.name)
+            return bound and not captured
+        return False
+
+    def same_meaning(self, candidate: InlineCandidate):
+        # The inlined body's free variables must mean the same at the call site
+        for name in candidate.free_globals | candidate.free_builtins:
+            if name in self.params:
+                return False
+        return not (candidate.free_builtins & self.globals)
+
+    def beta_reduce(self, func: FunctionDef_, arg: Number | Var):
+        body = func.body.accept(None, Substitution(func.param, arg))
+        return body.accept(None, self)
+
+    def visit_binaryop(self, env: Env, node: BinaryOp):
+        node.left = node.left.accept(env, self)
+        node.right = node.right.accept(env, self)
+        if isinstance(node.left, Number) and isinstance(node.right, Number):
+            try:
+                return Number(BUILTINS[node.op](node.left.value, node.right.value))
+            except ArithmeticError:
+                pass  # Leave it to fail at runtime
+        return node
+
+    def visit_unaryop(self, env: Env, node: UnaryOp):
+        node.right = node.right.accept(env, self)
+        if isinstance(node.right, Number):
+            return Number(-node.right.value)
+        return node
+
+    def visit_ifexpr(self, env: Env, node: IfExpr):
+        node.cond = node.cond.accept(env, self)
+        if isinstance(node.cond, Number):
+            return builtin_if(node.cond.value, node.then_expr, node.else_expr).accept(env, self)
+        node.then_expr = node.then_expr.accept(env, self)
+        node.else_expr = node.else_expr.accept(env, self)
+        return node
+
+    def visit_load(self, env: Env, node: Load):
+        return node
+
+
+def main():
+    from tokeniser import Tokeniser
+    from parser import Parser
+
+    source = (
+        'r := 2\n'
+        'area := 3.14159265*r*r\n'
+        'double := x |-> 2*x\n'
+        'print( double(3) + (x |-> x*x)(4) )\n'
+    )
+
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+
+    optimiser = Optimiser()
+    optimiser.optimise(parser.ast)
+    print(parser.ast.exprs[1].expr.value)          # 12.5663706
+    print(parser.ast.exprs[3].arg.value)           # 22
+    print(f"{optimiser.eliminated} nodes eliminated")
+
+
+if __name__ == "__main__":
+    main()
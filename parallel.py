@@ -0,0 +1,317 @@
+import os
+import pickle
+import sys
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import redirect_stderr, redirect_stdout
+
+from ast_nodes import *
+from env import Env
+from sequence import Sequence
+
+
+class GlobalReads(ASTVisitor):
+    """Collects the global slots an expression reads, also inside the bodies
+    of the functions it defines (they read those globals when called)."""
+
+    def __init__(self):
+        self.slots: set[int] = set()
+        self.depth = 0  # Function scopes entered
+
+    def visit_program(self, env: Env, node: Program):
+        for expr in node.exprs:
+            expr.accept(env, self)
+
+    def visit_var(self, env: Env, node: Var):
+        if node.depth == self.depth:
+            self.slots.add(node.slot)
+
+    def visit_binding(self, env: Env, node: Binding):
+        node.expr.accept(env, self)
+
+    def visit_functiondef(self, env: Env, node: FunctionDef_):
+        self.depth += 1
+        node.body.accept(env, self)
+        self.depth -= 1
+
+    def visit_functioncall(self, env: Env, node: FunctionCall):
+        node.func.accept(env, self)
+        node.arg.accept(env, self)
+
+    def visit_binaryop(self, env: Env, node: BinaryOp):
+        node.left.accept(env, self)
+        node.right.accept(env, self)
+
+    def visit_unaryop(self, env: Env, node: UnaryOp):
+        node.right.accept(env, self)
+
+    def visit_ifexpr(self, env: Env, node: IfExpr):
+        node.cond.accept(env, self)
+        node.then_expr.accept(env, self)
+        node.else_expr.accept(env, self)
+
+
+def global_reads(expr: ASTNode):
+    reads = GlobalReads()
+    expr.accept(None, reads)
+    return reads.slots
+
+
+def is_builtin(node: ASTNode, name: str):
+    return isinstance(node, Var) and node.depth is None and node.name == name
+
+
+def is_definition(expr: ASTNode):
+    # Numbers, functions and memoised functions: making them runs no MathFP
+    # code and prints nothing, so every process can make its own copy
+    if isinstance(expr, (Number, FunctionDef_)):
+        return True
+    if not isinstance(expr, FunctionCall) or not is_definition(expr.arg):
+        return False
+    func = expr.func
+    return is_builtin(func, 'memo') or (
+        isinstance(func, FunctionCall) and is_builtin(func.func, 'memo_lru') and isinstance(func.arg, Number))
+
+
+class DependencyGraph:
+    """Splits the top-level expressions of a resolved program into
+    definitions, which every process evaluates up front, and tasks, which
+    run once each, after the tasks whose bindings they read.
+
+    A task depends on the bindings it reads directly, and on those read by
+    the functions it calls: reading a function defined at the top level
+    means reading everything its body reads.
+    """
+
+    def __init__(self, exprs: list[ASTNode]):
+        self.exprs = exprs
+        reads = [global_reads(expr) for expr in exprs]
+        defined_by: dict[int, int] = {}
+        self.definitions: set[int] = set()
+        for i, expr in enumerate(exprs):
+            if isinstance(expr, Binding) and expr.slot is not None:
+                defined_by[expr.slot] = i
+                if is_definition(expr.expr):
+                    self.definitions.add(i)
+
+        self.tasks = [i for i in range(len(exprs)) if i not in self.definitions]
+        self.needs: dict[int, set[int]] = {}       # Task -> global slots computed by other tasks
+        self.depends_on: dict[int, set[int]] = {}  # Task -> tasks computing them
+        self.dependents: dict[int, list[int]] = {i: [] for i in self.tasks}
+        for i in self.tasks:
+            seen = set()
+            pending = list(reads[i])
+            while pending:
+                slot = pending.pop()
+                if slot in seen:
+                    continue
+                seen.add(slot)
+                j = defined_by.get(slot)
+                if j in self.definitions:
+                    pending.extend(reads[j])
+            self.needs[i] = {slot for slot in seen if defined_by.get(slot, i) != i
+                             and defined_by[slot] not in self.definitions}
+            self.depends_on[i] = {defined_by[slot] for slot in self.needs[i]}
+            for j in self.depends_on[i]:
+                self.dependents[j].append(i)
+
+
+class Recorder:
+    # Stands in for stdout or stderr, keeping what is written in order
+    def __init__(self, events: list, stream: str):
+        self.events = events
+        self.stream = stream
+
+    def write(self, text: str):
+        self.events.append((self.stream, text))
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class RemoteTraceback(Exception):
+    # Shows where an exception from a worker process was raised
+    def __str__(self):
+        return self.args[0]
+
+
+class Outcome:
+    def __init__(self, index: int, events: list, value=None, shippable: bool = True,
+                 error: Exception | None = None, traceback: str = ''):
+        self.index = index
+        self.events = events        # (stream name, text) pairs, in the order written
+        self.value = value          # The binding's value, or the expression's result
+        self.shippable = shippable  # False for functions and sequences, which cannot leave the process
+        self.error = error
+        self.traceback = traceback
+
+    def replay(self):
+        for stream, text in self.events:
+            getattr(sys, stream).write(text)
+
+
+class Session:
+    # One process's copy of the program and its global environment. Every
+    # global slot is written once, so values from other processes can be
+    # added to the environment as they arrive.
+    def __init__(self, exprs: list[ASTNode], definitions: list[int], interpreter_class):
+        self.exprs = exprs
+        self.interpreter = interpreter_class()
+        self.env = Env()
+        program = Program()
+        for i in definitions:
+            program.add_expression(exprs[i])
+        self.env, _ = self.interpreter.execute(program, self.env)
+
+    def run(self, index: int, values: dict[int, object]):
+        for slot, value in values.items():
+            self.env.define(slot, value)
+        expr = self.exprs[index]
+        program = Program()
+        program.add_expression(expr)
+
+        events = []
+        with redirect_stdout(Recorder(events, 'stdout')), redirect_stderr(Recorder(events, 'stderr')):
+            try:
+                self.env, value = self.interpreter.execute(program, self.env)
+            except Exception as e:
+                return Outcome(index, events, error=e, traceback=traceback.format_exc())
+        if isinstance(expr, Binding) and expr.slot is not None:
+            value = self.env.lookup(0, expr.slot)
+        if callable(value) or isinstance(value, Sequence):
+            if isinstance(expr, Binding):
+                return Outcome(index, events, shippable=False)
+            value = None
+        return Outcome(index, events, value)
+
+
+_session: Session | None = None
+
+
+def start_worker(program_data: bytes, definitions: list[int], interpreter_class):
+    global _session
+    _session = Session(pickle.loads(program_data).exprs, definitions, interpreter_class)
+
+
+def run_in_worker(index: int, values: dict[int, object]):
+    return _session.run(index, values)
+
+
+def evaluate_parallel(program: Program, interpreter_class, jobs: int | None = None):
+    """Evaluates a resolved program like `interpreter_class().execute`, but
+    runs top-level expressions that do not depend on each other at the same
+    time on `jobs` worker processes.
+
+    Output is replayed in program order, and an exception stops the program
+    at the expression that raised it, as if it had run sequentially. Tasks
+    whose value is a function (say `inc := add(1)`) are run again in this
+    process, along with everything that reads them, since functions cannot
+    be sent between processes.
+    """
+    exprs = program.exprs
+    graph = DependencyGraph(exprs)
+    definitions = sorted(graph.definitions)
+    session = None
+    if len(graph.tasks) > 1:
+        try:
+            program_data = pickle.dumps(program)
+            session = Session(exprs, definitions, interpreter_class)
+        except Exception:
+            pass  # Too deep to pickle, or a definition raised: running in order raises it in the right place
+    if session is None:
+        return interpreter_class().execute(program, Env())
+
+    outcomes: dict[int, Outcome] = {}
+    waiting = {i: set(graph.depends_on[i]) for i in graph.tasks}
+    ready = [i for i in graph.tasks if not waiting[i]]
+    local: set[int] = set()  # Tasks run in this process
+    values: dict[int, object] = {}
+    result = None
+
+    def finish(outcome: Outcome, here: bool = False):
+        i = outcome.index
+        if not outcome.shippable and not here:
+            outcome, here = session.run(i, {}), True
+        if not outcome.shippable:
+            local.add(i)  # Its value only exists in this process
+        expr = exprs[i]
+        if outcome.error is None and outcome.shippable and isinstance(expr, Binding) and expr.slot is not None:
+            values[expr.slot] = outcome.value
+            if not here:
+                session.env.define(expr.slot, outcome.value)
+        outcomes[i] = outcome
+        if outcome.error is not None:
+            return  # Nothing that reads it runs
+        for j in graph.dependents[i]:
+            waiting[j].discard(i)
+            if not waiting[j]:
+                ready.append(j)
+
+    executor = ProcessPoolExecutor(jobs, initializer=start_worker,
+                                   initargs=(program_data, definitions, interpreter_class))
+    try:
+        running = {}
+        emitted = 0
+        while True:
+            ready.sort()
+            while ready:
+                i = ready.pop(0)
+                if graph.depends_on[i] & local:
+                    finish(session.run(i, {}), here=True)
+                else:
+                    needs = {slot: values[slot] for slot in graph.needs[i]}
+                    running[executor.submit(run_in_worker, i, needs)] = i
+
+            while emitted < len(exprs):
+                if emitted not in graph.definitions:
+                    outcome = outcomes.pop(emitted, None)
+                    if outcome is None:
+                        break
+                    outcome.replay()
+                    if outcome.error is not None and outcome.error.__traceback__ is None:
+                        raise outcome.error from RemoteTraceback(outcome.traceback)
+                    if outcome.error is not None:
+                        raise outcome.error
+                result = None if isinstance(exprs[emitted], Binding) else outcome.value
+                emitted += 1
+            if emitted == len(exprs):
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+                finish(future.result())
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+    return session.env, result
+
+
+def main():
+    from tokeniser import Tokeniser
+    from parser import Parser
+    from resolver import Resolver
+    from eval import Evaluator
+
+    source = (
+        'fib := n |-> if 2 > n then n else fib(n-1) + fib(n-2)\n'
+        'a := fib(20)\n'
+        'b := fib(21)\n'
+        'print(fib(22))\n'
+        'print(a + b)\n'
+    )
+
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+
+    graph = DependencyGraph(parser.ast.exprs)
+    print(graph.depends_on)  # {1: set(), 2: set(), 3: set(), 4: {1, 2}}
+    evaluate_parallel(parser.ast, Evaluator, os.cpu_count())  # 17711, then 17711
+
+
+if __name__ == "__main__":
+    main()
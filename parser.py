@@ -1,35 +1,57 @@
+from collections.abc import Iterable, Iterator
+
 from ast_nodes import *
+from preprocessor import SourceMap
 from tokeniser import Token, Tokeniser
 
 
 class Parser:
-    def __init__(self, tokens: list[Token]):
-        self.index = 0
-        self.tokens = tokens
+    """Recursive descent parser over a stream of tokens.
+
+    `tokens` may be a list or any iterator, such as `Tokeniser.iter_tokens()`:
+    the parser only ever holds the current token and one token of lookahead.
+    `parse` collects the whole program into `ast`, while `iter_expressions`
+    yields each top-level expression as soon as it is complete.
+    """
+
+    def __init__(self, tokens: Iterable[Token], source_map: SourceMap | None = None):
+        self.tokens = iter(tokens)
+        self.source_map = source_map
+        self.current = next(self.tokens, None)
+        self.next = next(self.tokens, None)
         self.ast = Program()
     
     def is_at_end(self):
-        return self.index >= len(self.tokens)
+        return self.current is None
     
     def current_token(self):
-        return self.tokens[self.index]
+        if self.current is None:
+            raise RuntimeError("Unexpected end of input")
+        return self.current
 
     def can_lookahead(self):
-        return self.index + 1 < len(self.tokens)
+        return self.next is not None
 
     def lookahead(self):
-        if self.index + 1 < len(self.tokens):
-            return self.tokens[self.index + 1]
+        if self.next is not None:
+            return self.next
         else:
             raise RuntimeError("Unexpected end of input")
 
     def advance(self, count: int = 1):
-        self.index += count
+        for _ in range(count):
+            self.current, self.next = self.next, next(self.tokens, None)
+
+    def position(self, token: Token):
+        if self.source_map is not None:
+            return self.source_map.describe(token.line, token.column)
+        return token.position()
 
     def consume(self, expected_type: int):
         tk_type = self.current_token().token_type
         if tk_type != expected_type:
-            raise RuntimeError(f"Expected a token of type {expected_type} but found {tk_type}")
+            raise RuntimeError(f"Expected a token of type {expected_type} but found {tk_type} "
+                               f"at {self.position(self.current_token())}")
         previous = self.current_token()
         self.advance()
         return previous
@@ -37,13 +59,17 @@ class Parser:
     def parse(self):
         self.program()
 
-    # Grammar rules.
-
-    def program(self):
+    def iter_expressions(self) -> Iterator[ASTNode]:
         while not self.is_at_end():
             expr = self.expression()
             if expr is not None:
-                self.ast.add_expression(expr)
+                yield expr
+
+    # Grammar rules.
+
+    def program(self):
+        for expr in self.iter_expressions():
+            self.ast.add_expression(expr)
         return self.ast
     
     def expression(self):
@@ -85,6 +111,12 @@ class Parser:
         self.advance()
         self.consume(Token.BINDING)
         value = self.expression()
+        # Name the bound lambda, also when wrapped in calls such as memo(...)
+        function = value
+        while isinstance(function, FunctionCall):
+            function = function.arg
+        if isinstance(function, FunctionDef_):
+            function.name = var_name
         return Binding(var_name, value)
     
     def if_expr(self):
@@ -147,13 +179,16 @@ class Parser:
                 return Number(int(token.lexeme))
 
         if token.token_type == Token.IDENTIFIER:
-            if self.index + 1 >= len(self.tokens):
+            if not self.can_lookahead():
                 return self.identifier()
             elif self.lookahead().token_type == Token.LEFT_PAREN:
                 return self.function_call()
             else:
                 return self.identifier()
 
+        if token.token_type == Token.LOAD:
+            return self.load()
+
         if token.token_type == Token.LEFT_PAREN:
             self.consume(Token.LEFT_PAREN)
             expr = self.expression()
@@ -181,7 +216,18 @@ class Parser:
             return None
 
         else:
-            raise Exception(f"Unexpected token: '{token.lexeme}'")
+            raise Exception(f"Unexpected token: '{token.lexeme}' at {self.position(token)}")
+
+    def load(self):
+        # !load(index), which the preprocessor writes for !load(name, file)
+        token = self.consume(Token.LOAD)
+        self.consume(Token.LEFT_PAREN)
+        index = int(self.consume(Token.NUMBER).lexeme)
+        self.consume(Token.RIGHT_PAREN)
+        loads = self.source_map.loads if self.source_map is not None else []
+        if index >= len(loads):
+            raise Exception(f"'!load' is a macro, not an expression, at {self.position(token)}")
+        return Load(loads[index])
 
     def call_or_var(self):
         name = self.consume(Token.IDENTIFIER).lexeme
@@ -1,4 +1,7 @@
 import os
+import re
+from bisect import bisect_right
+from collections.abc import Iterable, Iterator
 
 from util import try_read_file
 
@@ -7,10 +10,121 @@ class PreprocessorError(Exception):
     pass
 
 
-class Preprocessor:
+def is_macro_call(line: str):
+    stripped = line.strip()
+    return stripped.startswith('!') and len(stripped) > 1
+
+
+class SourceFile:
+    """The text of a source file split into runs of plain lines and macro calls.
+
+    `segments` holds (line, text, is_macro) triples: `text` is either whole
+    lines to copy to the output or the stripped macro call on `line`.
+    """
+
+    MACRO_LINE = re.compile(r'^[^\S\n]*!.*$', re.MULTILINE)
+
+    def __init__(self, text: str, ensure_newline: bool = False):
+        self.segments: list[tuple[int, str, bool]] = []
+        if ensure_newline and text and not text.endswith('\n'):
+            text += '\n'  # Keep the including file's next line on a line of its own
+
+        line, pos = 1, 0
+        for match in self.MACRO_LINE.finditer(text):
+            call = match.group().strip()
+            if len(call) == 1:
+                continue  # A lone '!' is left for the tokeniser to report
+            start = match.start()
+            if start > pos:
+                self.segments.append((line, text[pos:start], False))
+                line += text.count('\n', pos, start)
+            self.segments.append((line, call, True))
+            line += 1
+            pos = match.end() + 1  # Past the newline
+        if pos < len(text):
+            self.segments.append((line, text[pos:], False))
+
+
+class IncludeCache:
+    """Included files, keyed by realpath.
+
+    An entry is reused while the file's mtime and size are unchanged, so a
+    library included from many scripts (or many REPL lines) is read and
+    scanned for macros once.
+    """
+
     def __init__(self):
-        self.lines: list[str] = []
+        self.entries: dict[str, tuple[int, int, SourceFile]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, path: str) -> SourceFile:
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        source_file = SourceFile(try_read_file(path), ensure_newline=True)
+        self.entries[path] = (stat.st_mtime_ns, stat.st_size, source_file)
+        return source_file
+
+
+INCLUDE_CACHE = IncludeCache()
+
+
+class SourceMap:
+    """Maps lines of preprocessed output back to (file, line) in the sources.
+
+    Stored as runs of consecutive lines from the same file, so its size grows
+    with the number of includes rather than the length of the output. Also
+    holds the files named by !load, which the output refers to by index.
+    """
+
+    def __init__(self):
+        self.starts: list[int] = []               # First output line of each run
+        self.origins: list[tuple[str, int]] = []  # (file, line) that run starts at
+        self.lines = 0                            # Output lines in finished runs
+        self.loads: list[str] = []                # Absolute path of each `!load(index)` in the output
+
+    def begin_run(self, filename: str, line: int):
+        self.starts.append(self.lines + 1)
+        self.origins.append((filename, line))
+
+    def end_run(self, count: int):
+        self.lines += count
+
+    def lookup(self, line: int):
+        run = bisect_right(self.starts, line) - 1
+        if run < 0:
+            return None, line
+        filename, start_line = self.origins[run]
+        return filename, start_line + line - self.starts[run]
+
+    def describe(self, line: int, column: int):
+        filename, line = self.lookup(line)
+        return f"{filename}:{line}:{column}" if filename is not None else f"{line}:{column}"
+
+    def load_index(self, path: str):
+        if path not in self.loads:
+            self.loads.append(path)
+        return self.loads.index(path)
+
+
+class Preprocessor:
+    """Expands macros in a single pass over the source.
+
+    Output is produced in pieces of whole lines, while `source_map` records
+    where each output line came from. Included files are read through
+    `cache`, shared by default between all Preprocessors in the process.
+    """
+
+    def __init__(self, cache: IncludeCache = INCLUDE_CACHE):
         self.included_files: set[str] = set()
+        self.loaded_files: set[str] = set()  # Data files named by !load
+        self.source_map = SourceMap()
+        self.cache = cache
         self.had_error = False
 
     @staticmethod
@@ -18,12 +132,14 @@ class Preprocessor:
         if pos >= len(sequence) or sequence[pos] != char:
             raise PreprocessorError(msg)
 
-    def call_macro(self, macro, arguments):
+    def call_macro(self, macro, arguments, line: int):
         if macro == '':
             raise PreprocessorError("Expected a macro name")
         match macro:
             case 'include':
-                self.include(*arguments)
+                return self.include(*arguments)
+            case 'load':
+                return self.load(*arguments, line)
             case _:
                 raise PreprocessorError(f"No such macro '{macro}'")
 
@@ -50,7 +166,7 @@ class Preprocessor:
 
         return macro_name, argument
 
-    def include(self, copy_to_file: str, copy_from_file: str, copy_pos: int):
+    def include(self, copy_to_file: str, copy_from_file: str):
         parent_dir = os.path.dirname(copy_to_file)
         abs_copy_from_file = os.path.join(parent_dir, copy_from_file)
         abs_copy_from_file = os.path.realpath(abs_copy_from_file)
@@ -62,29 +178,80 @@ class Preprocessor:
             raise PreprocessorError("!include: Expected a filename")
 
         if os.path.isfile(abs_copy_from_file):
-            contents = try_read_file(abs_copy_from_file)
+            source_file = self.cache.read(abs_copy_from_file)
         elif os.path.isdir(abs_copy_from_file):
             raise PreprocessorError(f"!include: '{abs_copy_from_file}' is a directory")
         else:
             raise PreprocessorError(f"!include: No such file '{abs_copy_from_file}' found")
 
-        self.lines.insert(copy_pos, contents)
         self.included_files.add(abs_copy_from_file)
+        # Nested includes are relative to the included file
+        yield from self.expand_file(source_file, abs_copy_from_file)
 
-    def preprocess_or_throw(self, source: str, filename: str):
-        # TODO: strip line comments here instead of in the tokeniser
-        self.lines = source.splitlines(keepends=True)
+    def load(self, load_to_file: str, argument: str, line: int):
+        # !load(name, file) binds `name` to the vector in `file`, relative to
+        # the file it is in. The file is read when the binding runs, not here;
+        # the output names it by its index in the source map, which the parser
+        # turns into a Load node
+        name, _, path = (part.strip() for part in argument.partition(','))
+        if not name.isidentifier() or not path:
+            raise PreprocessorError("!load: Expected a name and a filename, as in !load(samples, samples.f64)")
+        abs_path = os.path.realpath(os.path.join(os.path.dirname(load_to_file), path))
+        if not os.path.isfile(abs_path):
+            raise PreprocessorError(f"!load: No such file '{abs_path}' found")
+        self.loaded_files.add(abs_path)
+
+        self.source_map.begin_run(load_to_file, line)
+        self.source_map.end_run(1)
+        yield f"{name} := !load({self.source_map.load_index(abs_path)})\n"
+
+    def expand_file(self, source_file: SourceFile, filename: str) -> Iterator[str]:
+        source_map = self.source_map
+        for line, text, is_macro in source_file.segments:
+            if is_macro:
+                macro_name, argument = self.expect_macro_format(text)
+                yield from self.call_macro(macro_name, (filename, argument), line)
+            else:
+                source_map.begin_run(filename, line)
+                source_map.end_run(text.count('\n') + (not text.endswith('\n')))
+                yield text
+
+    def expand_lines(self, lines: Iterable[str], filename: str) -> Iterator[str]:
+        # Same as expand_file, for a file that is read one line at a time
+        source_map = self.source_map
+        run_start = None  # Line the current run of copied lines started at
         line_no = 0
-        for line in self.lines:
-            stripped = line.strip()
-            if stripped.startswith('!') and len(stripped) > 1:
-                macro_name, argument = self.expect_macro_format(stripped)
-                # replace the macro call with the contents
-                self.lines.pop(line_no)
-                self.call_macro(macro_name, (filename, argument, line_no))
-            line_no += 1
-
-        return ''.join(self.lines)
+        for line_no, line in enumerate(lines, 1):
+            if is_macro_call(line):
+                if run_start is not None:
+                    source_map.end_run(line_no - run_start)
+                    run_start = None
+                macro_name, argument = self.expect_macro_format(line.strip())
+                yield from self.call_macro(macro_name, (filename, argument), line_no)
+            else:
+                if run_start is None:
+                    source_map.begin_run(filename, line_no)
+                    run_start = line_no
+                yield line
+        if run_start is not None:
+            source_map.end_run(line_no + 1 - run_start)
+
+    def iter_lines_or_throw(self, lines: Iterable[str], filename: str) -> Iterator[str]:
+        # TODO: strip line comments here instead of in the tokeniser
+        self.included_files.add(os.path.realpath(filename))
+        return self.expand_lines(lines, filename)
+
+    def iter_lines(self, lines: Iterable[str], filename: str) -> Iterator[str]:
+        """Preprocesses lazily, yielding output as the input is read."""
+        try:
+            yield from self.iter_lines_or_throw(lines, filename)
+        except PreprocessorError as e:
+            self.had_error = True
+            print(f"Preprocessor: {e}")
+
+    def preprocess_or_throw(self, source: str, filename: str):
+        self.included_files.add(os.path.realpath(filename))
+        return ''.join(self.expand_file(SourceFile(source), filename))
 
     def preprocess(self, source: str, filename: str):
         try:
@@ -0,0 +1,196 @@
+import time
+
+from closure import Closure
+from env import Env
+from eval import Evaluator, builtin_if
+from ast_nodes import FunctionCall, FunctionDef_, IfExpr
+
+
+class FunctionStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.self_time = 0.0
+        self.inclusive_time = 0.0  # Counted once for recursive calls
+
+
+class CallNode:
+    # One node per distinct call path; direct recursion is folded into a
+    # single node so deep recursion does not produce deep paths
+    def __init__(self, name: str, parent: CallNode | None = None):
+        self.name = name
+        self.parent = parent
+        self.children: dict[str, CallNode] = {}
+        self.self_time = 0.0
+
+    def path(self):
+        names = []
+        node = self
+        while node.parent is not None:
+            names.append(node.name)
+            node = node.parent
+        return ';'.join(reversed(names))
+
+
+class Profiler:
+    """Attributes call counts and time to named MathFP functions.
+
+    Interpreters call `enter` when a function starts, `exit` when it returns
+    and `closure_created` for every closure they make. A tail call replaces
+    the caller's frame (as it does when the program runs), so the caller's
+    time stops when the callee starts; an interpreter reports this by passing
+    the same `key` for both frames.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.root = CallNode('<program>')
+        self.stack: list[list] = []  # [node, stats, start, child time, key]
+        self.stats: dict[str, FunctionStats] = {}
+        self.active: dict[str, int] = {}  # Frames of each function on the stack
+
+    def enter(self, name: str, key=None):
+        stack = self.stack
+        if key is not None and stack and stack[-1][4] == key:
+            self.exit()  # Replaced by a tail call
+
+        parent = stack[-1][0] if stack else self.root
+        if parent.name == name and parent is not self.root:
+            node = parent
+        elif name in parent.children:
+            node = parent.children[name]
+        else:
+            node = parent.children[name] = CallNode(name, parent)
+
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = FunctionStats(name)
+        stats.calls += 1
+        self.active[name] = self.active.get(name, 0) + 1
+        stack.append([node, stats, self.clock(), 0.0, key])
+
+    def exit(self):
+        node, stats, start, child_time, _ = self.stack.pop()
+        elapsed = self.clock() - start
+        node.self_time += elapsed - child_time
+        stats.self_time += elapsed - child_time
+        self.active[stats.name] -= 1
+        if not self.active[stats.name]:
+            stats.inclusive_time += elapsed  # Outermost frame of this function
+        if self.stack:
+            self.stack[-1][3] += elapsed
+
+    def closure_created(self):
+        pass
+
+    def report(self, limit: int | None = None):
+        """Text report of every function, sorted by self time."""
+        stats = sorted(self.stats.values(), key=lambda s: s.self_time, reverse=True)
+        total = sum(s.self_time for s in stats) or 1.0
+        lines = [f"{'calls':>10} {'self s':>10} {'self %':>7} {'incl s':>10}  function"]
+        for s in stats[:limit]:
+            lines.append(f"{s.calls:>10,} {s.self_time:>10.4f} {s.self_time / total:>7.1%} "
+                         f"{s.inclusive_time:>10.4f}  {s.name}")
+        return '\n'.join(lines)
+
+    def collapsed_stacks(self):
+        """Lines of 'outer;inner;function microseconds', the input format of
+        flamegraph.pl, speedscope and similar tools."""
+        lines = []
+        nodes = list(self.root.children.values())
+        while nodes:
+            node = nodes.pop()
+            microseconds = round(node.self_time * 1e6)
+            if microseconds > 0:
+                lines.append(f"{node.path()} {microseconds}")
+            nodes.extend(node.children.values())
+        return '\n'.join(sorted(lines))
+
+
+class ProfilingEvaluator(Evaluator):
+    """Evaluator reporting every MathFP function call and closure to a
+    Profiler (or RuntimeStats).
+
+    A separate class, so the plain Evaluator pays nothing for profiling.
+    """
+
+    def __init__(self, profiler: Profiler):
+        self.profiler = profiler
+
+    def visit_functiondef(self, env: Env, node: FunctionDef_):
+        self.profiler.closure_created()
+        return super().visit_functiondef(env, node)
+
+    def call(self, closure: Closure, arg):
+        # Evaluator.call with profiling: each iteration of the trampoline is
+        # a new frame that replaces the previous one
+        profiler = self.profiler
+        profiler.enter(closure.name)
+        try:
+            while True:
+                env = Env([arg], closure.env)
+                node = closure.function.body
+                while type(node) is IfExpr:
+                    _, cond = node.cond.accept(env, self)
+                    node = builtin_if(cond, node.then_expr, node.else_expr)
+                if type(node) is not FunctionCall:
+                    return node.accept(env, self)[1]
+
+                _, func = node.func.accept(env, self)
+                _, arg = node.arg.accept(env, self)
+                if type(func) is not Closure or func.interpreter is not self:
+                    return func(arg)
+                closure = func
+                profiler.exit()
+                profiler.enter(closure.name)
+        finally:
+            profiler.exit()
+
+
+def main():
+    from tokeniser import Tokeniser
+    from parser import Parser
+    from resolver import Resolver
+    from vm import VM
+
+    source = (
+        'fib := n |-> if 2 > n then n else fib(n-1) + fib(n-2)\n'
+        'square := x |-> x*x\n'
+        'loop := n |-> if n > 0 then loop(n - 1 + 0*square(fib(10))) else 0\n'
+        'loop(50)\n'
+        'memo_fib := memo(n |-> if 2 > n then n else memo_fib(n-1) + memo_fib(n-2))\n'
+        'via := n |-> memo_fib(n)\n'  # A tail call into a memoized function
+        'twice := n |-> via(n) + via(n + 1)\n'
+        'twice(25)\n'
+    )
+
+    def call_paths(profiler: Profiler):
+        paths, nodes = [], list(profiler.root.children.values())
+        while nodes:
+            node = nodes.pop()
+            paths.append(node.path())
+            nodes.extend(node.children.values())
+        return sorted(paths)
+
+    profiles = []
+    for interpreter_class in (ProfilingEvaluator, VM):
+        tokeniser = Tokeniser(source)
+        tokeniser.tokenise()
+        parser = Parser(tokeniser.tokens)
+        parser.parse()
+        Resolver().resolve(parser.ast)
+
+        profiler = Profiler()
+        interpreter_class(profiler).execute(parser.ast, Env())
+        print(profiler.report())
+        print(profiler.collapsed_stacks())
+        calls = {name: stats.calls for name, stats in profiler.stats.items()}
+        profiles.append((calls, call_paths(profiler), len(profiler.stack)))
+
+    # Both interpreters report the same calls on the same paths, and every
+    # frame entered has exited
+    print('same profile:', profiles[0] == profiles[1] and profiles[1][2] == 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Framing for the evaluation server (see server.py): every message is a JSON
+object encoded as UTF-8 and preceded by its length as a 4-byte big-endian
+unsigned integer.
+
+Requests have an "op" and answers an "ok":
+
+    {"op": "open"}                                  -> {"ok": true, "session": "3"}
+    {"op": "eval", "session": "3", "source": "x := 2\\n",
+     "steps": 100000, "seconds": 1.5}               -> {"ok": true, "result": null, "output": "", ...}
+    {"op": "eval", "source": "print(1)\\n"}          -> a fresh session for just this request
+    {"op": "close", "session": "3"}                 -> {"ok": true}
+    {"op": "ping"}                                  -> {"ok": true}
+
+Failed requests answer {"ok": false, "error": "..."}. Requests on one
+connection are answered in order.
+"""
+import asyncio
+import json
+import socket
+import struct
+
+HEADER = struct.Struct('>I')
+MAX_MESSAGE = 16 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode(message: dict) -> bytes:
+    data = json.dumps(message, separators=(',', ':')).encode()
+    if len(data) > MAX_MESSAGE:
+        raise ProtocolError(f"message of {len(data):,} bytes is over the {MAX_MESSAGE:,} byte limit")
+    return HEADER.pack(len(data)) + data
+
+
+def decode(data: bytes) -> dict:
+    try:
+        message = json.loads(data)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ProtocolError(f"malformed message: {e}") from e
+    if not isinstance(message, dict):
+        raise ProtocolError("a message must be a JSON object")
+    return message
+
+
+def check_length(header: bytes):
+    (length,) = HEADER.unpack(header)
+    if length > MAX_MESSAGE:
+        raise ProtocolError(f"message of {length:,} bytes is over the {MAX_MESSAGE:,} byte limit")
+    return length
+
+
+async def read_message(reader) -> dict | None:
+    """The next message from an asyncio StreamReader, or None at end of stream."""
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ProtocolError("connection closed inside a message header") from e
+        return None
+    try:
+        return decode(await reader.readexactly(check_length(header)))
+    except asyncio.IncompleteReadError as e:
+        raise ProtocolError("connection closed inside a message") from e
+
+
+async def write_message(writer, message: dict):
+    writer.write(encode(message))
+    await writer.drain()
+
+
+def receive_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ProtocolError("connection closed by the server")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send(sock: socket.socket, message: dict):
+    sock.sendall(encode(message))
+
+
+def receive(sock: socket.socket) -> dict:
+    return decode(receive_exactly(sock, check_length(receive_exactly(sock, HEADER.size))))
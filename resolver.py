@@ -0,0 +1,112 @@
+from ast_nodes import *
+from env import Env
+
+
+class Resolver(ASTVisitor):
+    """Assigns lexical addresses to variables ahead of evaluation.
+
+    Every resolved Var gets a (depth, slot) address: `depth` counts the
+    function frames to walk outwards and `slot` indexes into that frame.
+    Vars left with depth None refer to builtins (or are unknown).
+
+    Top-level bindings get a slot in the global frame. The global scope
+    persists between calls to `resolve`, so the REPL can resolve one line
+    at a time. New bindings take the next free slot, unless `new_slot` is
+    overridden (see watch.py).
+    """
+
+    def __init__(self):
+        self.globals: dict[str, int] = {}
+        self.scopes: list[dict[str, int]] = []  # Function scopes, innermost last
+        self.binding: tuple[str, int] | None = None  # Top-level binding being resolved
+
+    def resolve(self, node: ASTNode):
+        node.accept(None, self)
+        return node
+
+    def lookup(self, name: str):
+        for i, scope in enumerate(reversed(self.scopes)):
+            if name in scope:
+                return i, scope[name]
+        if name in self.globals:
+            return len(self.scopes), self.globals[name]
+        if self.binding is not None and self.scopes and name == self.binding[0]:
+            # Inside a function body, the binding being defined is already in scope
+            # (recursion), since the body only runs after the binding is made.
+            return len(self.scopes), self.binding[1]
+        return None, None
+
+    def visit_program(self, env: Env, node: Program):
+        for expr in node.exprs:
+            if isinstance(expr, Binding):
+                self.resolve_global_binding(expr)
+            else:
+                expr.accept(env, self)
+
+    def resolve_global_binding(self, node: Binding):
+        if node.name in self.globals:
+            node.redeclared = True
+            node.expr.accept(None, self)
+            return
+        node.slot = self.new_slot(node.name)
+        self.binding = (node.name, node.slot)
+        node.expr.accept(None, self)
+        self.binding = None
+        self.globals[node.name] = node.slot
+
+    def new_slot(self, name: str) -> int:
+        return len(self.globals)
+
+    def visit_number(self, env: Env, node: Number):
+        pass
+
+    def visit_var(self, env: Env, node: Var):
+        node.depth, node.slot = self.lookup(node.name)
+
+    def visit_binding(self, env: Env, node: Binding):
+        # Bindings nested inside other expressions never extend the environment
+        node.expr.accept(env, self)
+        node.redeclared = self.lookup(node.name)[0] is not None
+
+    def visit_functiondef(self, env: Env, node: FunctionDef_):
+        self.scopes.append({node.param: 0})
+        node.body.accept(env, self)
+        self.scopes.pop()
+
+    def visit_functioncall(self, env: Env, node: FunctionCall):
+        node.func.accept(env, self)
+        node.arg.accept(env, self)
+
+    def visit_binaryop(self, env: Env, node: BinaryOp):
+        node.left.accept(env, self)
+        node.right.accept(env, self)
+
+    def visit_unaryop(self, env: Env, node: UnaryOp):
+        node.right.accept(env, self)
+
+    def visit_ifexpr(self, env: Env, node: IfExpr):
+        node.cond.accept(env, self)
+        node.then_expr.accept(env, self)
+        node.else_expr.accept(env, self)
+
+
+def main():
+    from tokeniser import Tokeniser
+    from parser import Parser
+
+    source = 'add := x |-> y |-> x + y\nadd(9)(10)\n'
+
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+
+    inner: FunctionDef_ = parser.ast.exprs[0].expr.body
+    body: BinaryOp = inner.body
+    print((body.left.name, body.left.depth, body.left.slot))     # ('x', 1, 0)
+    print((body.right.name, body.right.depth, body.right.slot))  # ('y', 0, 0)
+
+
+if __name__ == "__main__":
+    main()
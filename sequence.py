@@ -0,0 +1,271 @@
+import abc
+import functools
+import itertools
+import operator
+
+from env import Env
+from typecheck import BOOL, FLOAT, INT
+from vectorise import EXACT_LIMIT, ArrayCompiler, Inexact, Unvectorisable, definition, numpy
+
+
+CHUNK_SIZE = 4096
+KINDS = {'i': INT, 'f': FLOAT, 'b': BOOL}  # Of NumPy dtypes
+
+
+class Block:
+    """A chunk of a sequence held as a float64 NumPy array, with the kind of
+    Python number (INT, FLOAT or BOOL) each element stands for."""
+
+    __slots__ = ('values', 'kind')
+
+    def __init__(self, values, kind: str):
+        self.values = values
+        self.kind = kind
+
+    def elements(self) -> list:
+        if self.kind == INT:
+            return self.values.astype(numpy().int64).tolist()
+        if self.kind == BOOL:
+            return (self.values != 0).tolist()
+        return self.values.tolist()
+
+
+def elements(chunk):
+    return chunk.elements() if type(chunk) is Block else chunk
+
+
+def compile_kernel(func, kind: str):
+    """A function from a Block to the Block of `func`'s results, or None if
+    `func` is not plain arithmetic (see vectorise.ArrayCompiler). The
+    function raises Inexact for Blocks it cannot compute exactly."""
+    np = numpy()
+    if np is None or definition(func) is None:
+        return None
+    try:
+        body = ArrayCompiler(same_types=True).compile(func)
+    except Unvectorisable:
+        return None
+    dtype = {INT: np.int64, FLOAT: np.float64, BOOL: np.bool_}[kind]
+
+    def kernel(block: Block) -> Block:
+        with np.errstate(all='raise'):
+            values = np.asarray(body(block.values.astype(dtype)))
+        result_kind = KINDS[values.dtype.kind]
+        if values.ndim == 0:
+            values = np.full(np.shape(block.values), values)
+        return Block(values.astype(np.float64), result_kind)
+    return kernel
+
+
+def apply(kernel, block: Block) -> Block | None:
+    # None when the block has to be computed element by element instead
+    if kernel is None:
+        return None
+    try:
+        return kernel(block)
+    except (Inexact, FloatingPointError):
+        return None
+
+
+class Sequence(abc.ABC):
+    """A lazy sequence of values. Elements are computed as they are consumed,
+    so a sequence takes constant memory however long (or infinite) it is, and
+    consuming one is a loop rather than a recursion. Consuming a sequence
+    again computes its elements again.
+
+    `chunks()` yields the elements in pieces: Blocks where the elements can be
+    computed as arrays, iterators otherwise. Iterators are consumed lazily, so
+    functions are only called on the elements actually consumed.
+    """
+
+    @abc.abstractmethod
+    def chunks(self):
+        pass
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from elements(chunk)
+
+
+class RangeSequence(Sequence):
+    def __init__(self, start: int, stop: int):
+        self.start = start
+        self.stop = stop
+
+    def chunks(self):
+        np = numpy()
+        if np is None or max(abs(self.start), abs(self.stop)) >= EXACT_LIMIT:
+            yield iter(range(self.start, self.stop))
+            return
+        for low in range(self.start, self.stop, CHUNK_SIZE):
+            yield Block(np.arange(low, min(low + CHUNK_SIZE, self.stop), dtype=np.float64), INT)
+
+    def __repr__(self):
+        return f"<sequence range({self.start})({self.stop})>"
+
+
+class MapSequence(Sequence):
+    def __init__(self, func, source: Sequence):
+        self.func = func
+        self.source = source
+
+    def chunks(self):
+        kernels = {}
+        for chunk in self.source.chunks():
+            if type(chunk) is Block:
+                if chunk.kind not in kernels:
+                    kernels[chunk.kind] = compile_kernel(self.func, chunk.kind)
+                block = apply(kernels[chunk.kind], chunk)
+                if block is not None:
+                    yield block
+                    continue
+            yield map(self.func, elements(chunk))
+
+    def __repr__(self):
+        return f"<sequence map({self.func!r})({self.source!r})>"
+
+
+class FilterSequence(Sequence):
+    def __init__(self, predicate, source: Sequence):
+        self.predicate = predicate
+        self.source = source
+
+    def chunks(self):
+        kernels = {}
+        for chunk in self.source.chunks():
+            if type(chunk) is Block:
+                if chunk.kind not in kernels:
+                    kernels[chunk.kind] = compile_kernel(self.predicate, chunk.kind)
+                block = apply(kernels[chunk.kind], chunk)
+                if block is not None:
+                    yield Block(chunk.values[block.values != 0], chunk.kind)
+                    continue
+            yield (value for value in elements(chunk) if self.predicate(value))
+
+    def __repr__(self):
+        return f"<sequence filter({self.predicate!r})({self.source!r})>"
+
+
+class TakeSequence(Sequence):
+    def __init__(self, count: int, source: Sequence):
+        self.count = count
+        self.source = source
+
+    def chunks(self):
+        remaining = self.count
+        if remaining <= 0:
+            return
+        chunks = self.source.chunks()
+        for chunk in chunks:
+            if type(chunk) is not Block:
+                # How much of an iterator its consumer used is unknown, so
+                # the rest is taken element by element
+                rest = itertools.chain(chunk, itertools.chain.from_iterable(map(elements, chunks)))
+                yield itertools.islice(rest, remaining)
+                return
+            if len(chunk.values) >= remaining:
+                yield Block(chunk.values[:remaining], chunk.kind)
+                return
+            remaining -= len(chunk.values)
+            yield chunk
+
+    def __repr__(self):
+        return f"<sequence take({self.count})({self.source!r})>"
+
+
+class IterateSequence(Sequence):
+    def __init__(self, func, start):
+        self.func = func
+        self.start = start
+
+    def chunks(self):
+        yield self.iterate()
+
+    def iterate(self):
+        value = self.start
+        while True:
+            yield value
+            value = self.func(value)
+
+    def __repr__(self):
+        return f"<sequence iterate({self.func!r})({self.start!r})>"
+
+
+def check_sequence(value, name: str):
+    if not isinstance(value, Sequence):
+        raise TypeError(f"{name}: expected a sequence, got {value!r}")
+    return value
+
+
+def check_whole(value, name: str):
+    if type(value) is not int:
+        raise TypeError(f"{name}: expected a whole number, got {value!r}")
+    return value
+
+
+# Built-in functions, curried like MathFP functions
+def builtin_range(start):
+    check_whole(start, 'range')
+    return lambda stop: RangeSequence(start, check_whole(stop, 'range'))
+
+
+def builtin_map(func):
+    return lambda seq: MapSequence(func, check_sequence(seq, 'map'))
+
+
+def builtin_filter(predicate):
+    return lambda seq: FilterSequence(predicate, check_sequence(seq, 'filter'))
+
+
+def builtin_take(count):
+    check_whole(count, 'take')
+    return lambda seq: TakeSequence(count, check_sequence(seq, 'take'))
+
+
+def builtin_iterate(func):
+    return lambda start: IterateSequence(func, start)
+
+
+def builtin_fold(func):
+    def fold(acc, value):
+        return func(acc)(value)
+    return lambda init: lambda seq: functools.reduce(fold, check_sequence(seq, 'fold'), init)
+
+
+def builtin_sum(seq):
+    # Adds in order, as fold would: floats are not summed pairwise or compensated
+    total = 0
+    for chunk in check_sequence(seq, 'sum').chunks():
+        if type(chunk) is Block and chunk.kind != FLOAT and type(total) is int:
+            total += sum(chunk.elements())  # Exact, so the order is irrelevant
+        else:
+            total = functools.reduce(operator.add, elements(chunk), total)
+    return total
+
+
+def main():
+    from tokeniser import Tokeniser
+    from parser import Parser
+    from resolver import Resolver
+    from vm import VM
+
+    source = (
+        'square := k |-> k*k\n'
+        'basel := sum(map(k |-> 1/(k*k))(range(1)(1000001)))\n'
+    )
+
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+    env, _ = VM().execute(parser.ast, Env())
+
+    square = env.values[0]
+    print(builtin_map(square)(builtin_range(0)(10)), list(builtin_map(square)(builtin_range(0)(10))))
+    print(list(builtin_take(5)(builtin_iterate(square)(2))))
+    print('basel:', env.values[1], '(pi^2/6 = 1.6449340668...)')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+"""Evaluation server: `python mfp.py --serve SOCKET` keeps MathFP sessions
+alive between requests, so callers pay neither interpreter startup nor
+re-running the definitions a script builds on. See protocol.py for the
+messages it accepts.
+
+Sessions live in worker processes, each session in one worker for its whole
+life (its Env holds closures, which cannot move between processes). The
+asyncio loop only frames messages and routes them, so a long evaluation
+holds up its own worker and nobody else's. Every evaluation runs under a
+step budget (MathFP function calls) and a time budget: exhausting either
+fails the request and leaves the session as the last good line left it. A
+worker that stops answering altogether, such as one looping inside a single
+builtin call past its time budget, is killed and restarted, and its sessions
+are rebuilt by replaying the lines they had evaluated.
+"""
+import asyncio
+import copy
+import io
+import itertools
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+
+from ast_nodes import *
+from env import Env
+from optimiser import Optimiser
+from parser import Parser
+from preprocessor import Preprocessor
+from profiler import ProfilingEvaluator
+from protocol import ProtocolError, read_message, write_message
+from resolver import Resolver
+from specialise import Specialiser
+from tokeniser import Tokeniser
+from typecheck import TypeChecker
+from vm import VM
+
+
+MAX_STEPS = 10_000_000
+MAX_SECONDS = 10.0
+GRACE_SECONDS = 2.0  # How long past its time budget a worker may take before it is killed
+CLOCK_INTERVAL = 1024  # Steps between checks of the clock
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Budget:
+    """Limits the MathFP function calls, and the time, an evaluation may take.
+
+    Passed to an interpreter in place of a Profiler, which reports every
+    call to `enter`. A runaway recursion is stopped at its next call;
+    MathFP has no other way to loop.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.start(MAX_STEPS, MAX_SECONDS)
+
+    def start(self, steps: int, seconds: float):
+        self.steps = steps
+        self.seconds = seconds
+        self.remaining = steps
+        self.started = self.clock()
+        self.deadline = self.started + seconds
+        self.countdown = CLOCK_INTERVAL
+
+    @property
+    def used(self):
+        return self.steps - self.remaining
+
+    # Profiler interface, called by the interpreter
+
+    def enter(self, name: str, key=None):
+        self.remaining -= 1
+        if self.remaining < 0:
+            raise BudgetExceeded(f"step budget of {self.steps:,} calls exhausted in '{name}'")
+        self.countdown -= 1
+        if not self.countdown:
+            self.countdown = CLOCK_INTERVAL
+            if self.clock() > self.deadline:
+                raise BudgetExceeded(f"time budget of {self.seconds:g}s exhausted in '{name}'")
+
+    def exit(self):
+        pass
+
+    def closure_created(self):
+        pass
+
+
+# Worker side
+
+def fork(state, *fields: str):
+    # A copy of a pass's state whose `fields` can change without changing it
+    clone = copy.copy(state)
+    for field in fields:
+        setattr(clone, field, getattr(state, field).copy())
+    return clone
+
+
+def redeclarations(node: ASTNode) -> list[str]:
+    # The names bound again in `node`, which the interpreters report when they reach them
+    names = [node.name] if isinstance(node, Binding) and node.redeclared else []
+    for child in node.children():
+        names += redeclarations(child)
+    return names
+
+
+class Session:
+    """The state one client builds up line by line, as in the REPL.
+
+    A request either succeeds or changes nothing: its passes run on copies
+    of their state, kept only once it has run, and the global slots it
+    bound are put back if it raises.
+    """
+
+    def __init__(self, backend: str, optimise: bool):
+        self.env = Env()
+        self.resolver = Resolver()
+        self.checker = TypeChecker()
+        self.optimiser = Optimiser() if optimise else None
+        self.budget = Budget()
+        self.interpreter = VM(self.budget) if backend == 'vm' else ProfilingEvaluator(self.budget)
+
+    def evaluate(self, source: str, filename: str):
+        # Returns (ok, result); diagnostics are printed, as by the REPL
+        preprocessor = Preprocessor()  # Included files come from the worker's include cache
+        source = preprocessor.preprocess(source, filename)
+        if preprocessor.had_error:
+            return False, None
+        lexer = Tokeniser(source, preprocessor.source_map)
+        lexer.tokenise()
+        parser = Parser(lexer.tokens, preprocessor.source_map)
+        parser.parse()
+        if lexer.had_error:
+            return False, None
+
+        optimiser = None
+        if self.optimiser is not None:
+            optimiser = fork(self.optimiser, 'globals', 'constants', 'inline_candidates')
+            optimiser.optimise(parser.ast)
+        resolver = fork(self.resolver, 'globals')
+        resolver.resolve(parser.ast)
+        names = redeclarations(parser.ast)
+        for name in names:
+            print(f"[mfp] Redeclaration of variable: {name}", file=sys.stderr)
+        if names:
+            return False, None
+        checker = fork(self.checker, 'globals', 'returns', 'params', 'errors')
+        checker.check(parser.ast)
+        if checker.had_error:
+            return False, None
+        Specialiser().specialise(parser.ast)
+
+        values = self.env.values.copy()  # Closures hold on to the global frame, so it is restored in place
+        try:
+            self.env, result = self.interpreter.execute(parser.ast, self.env)
+        except Exception:
+            self.env.values[:] = values
+            raise
+        self.optimiser, self.resolver, self.checker = optimiser, resolver, checker
+        return True, result
+
+
+def answer(ok: bool, result, output: str, errors: str, budget: Budget, error: str | None = None):
+    message = {
+        'ok': ok,
+        'result': None if result is None else str(result),
+        'output': output,
+        'errors': errors,
+        'steps': budget.used,
+        'seconds': round(budget.clock() - budget.started, 6),
+    }
+    if type(result) in (int, float, bool):
+        message['value'] = result
+    if error is not None:
+        message['error'] = error
+    return message
+
+
+def run_request(sessions: dict[str, Session], request: tuple, backend: str, optimise: bool):
+    session_id, source, filename, steps, seconds, history = request
+    session = sessions.get(session_id)
+    if session is None:
+        session = sessions[session_id] = Session(backend, optimise)
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            for line, line_filename in history:  # Rebuilding a session after a restart
+                session.budget.start(MAX_STEPS, MAX_SECONDS)
+                try:
+                    session.evaluate(line, line_filename)
+                except Exception:
+                    pass
+
+    output, errors = io.StringIO(), io.StringIO()
+    session.budget.start(steps, seconds)
+    ok, result, error = False, None, None
+    with redirect_stdout(output), redirect_stderr(errors):
+        try:
+            ok, result = session.evaluate(source, filename)
+            if not ok:
+                error = "the source has errors"
+        except BudgetExceeded as e:
+            error = str(e)
+        except RecursionError:
+            error = "maximum recursion depth exceeded"
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+    return answer(ok, result, output.getvalue(), errors.getvalue(), session.budget, error)
+
+
+def worker_main(connection, backend: str, optimise: bool):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The server decides when its workers stop
+    parent = multiprocessing.parent_process()
+    sessions: dict[str, Session] = {}
+    while True:
+        try:
+            while not connection.poll(1.0):
+                if parent is not None and not parent.is_alive():
+                    return  # The server was killed without stopping us
+            op, request = connection.recv()
+        except EOFError:
+            return
+        if op == 'close':
+            sessions.pop(request, None)
+            connection.send({'ok': True})
+        else:
+            connection.send(run_request(sessions, request, backend, optimise))
+
+
+# Server side
+
+class WorkerLost(Exception):
+    pass
+
+
+class WorkerTimedOut(WorkerLost):
+    # Past its time budget and grace period, as when one builtin call loops
+    # for longer than the budget without calling a MathFP function
+    pass
+
+
+class Worker:
+    """A worker process and the requests queued for it, answered one at a time."""
+
+    def __init__(self, backend: str, optimise: bool):
+        self.backend = backend
+        self.optimise = optimise
+        self.generation = 0  # Restarts, so sessions know when to replay their history
+        self.lock = asyncio.Lock()
+        self.pending = 0
+        self.sessions = 0
+        self.start()
+
+    def start(self):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=worker_main, args=(child, self.backend, self.optimise),
+                                               daemon=True)
+        self.process.start()
+        child.close()
+        self.generation += 1
+
+    def restart(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+        self.start()
+
+    def stop(self):
+        self.connection.close()  # The worker sees EOFError and returns
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+
+    async def call(self, op: str, request, timeout: float):
+        self.pending += 1
+        try:
+            async with self.lock:
+                loop = asyncio.get_running_loop()
+                ready = loop.create_future()
+                fd = self.connection.fileno()
+                loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+                lost = None
+                try:
+                    self.connection.send((op, request))
+                    await asyncio.wait_for(ready, timeout)
+                    return self.connection.recv()
+                except (asyncio.TimeoutError, EOFError, OSError) as e:
+                    lost = e
+                finally:
+                    loop.remove_reader(fd)
+                    if lost is not None:
+                        print(f"[mfp] Worker {self.process.pid} stopped answering; restarting it", file=sys.stderr)
+                        self.restart()
+                if isinstance(lost, asyncio.TimeoutError):
+                    raise WorkerTimedOut("the worker running this session stopped answering and was restarted") from lost
+                raise WorkerLost("the worker running this session stopped answering and was restarted") from lost
+        finally:
+            self.pending -= 1
+
+
+class ServerSession:
+    def __init__(self, worker: Worker):
+        self.worker = worker
+        self.generation = worker.generation
+        self.history: list[tuple[str, str]] = []  # (source, filename) of the lines it evaluated
+
+
+class Server:
+    def __init__(self, workers: int | None = None, backend: str = 'vm', optimise: bool = False,
+                 max_steps: int = MAX_STEPS, max_seconds: float = MAX_SECONDS):
+        self.workers = [Worker(backend, optimise) for _ in range(workers or os.cpu_count() or 1)]
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.sessions: dict[str, ServerSession] = {}
+        self.ids = itertools.count(1)
+        self.requests = 0
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def open_session(self):
+        worker = min(self.workers, key=lambda w: (w.sessions, w.pending))
+        worker.sessions += 1
+        session_id = str(next(self.ids))
+        self.sessions[session_id] = ServerSession(worker)
+        return session_id
+
+    def close_session(self, session_id: str):
+        session = self.sessions.pop(session_id)
+        session.worker.sessions -= 1
+        return session
+
+    async def evaluate(self, message: dict):
+        source = message.get('source')
+        if not isinstance(source, str):
+            raise ValueError("'eval' needs a 'source' string")
+        steps = min(int(message.get('steps') or self.max_steps), self.max_steps)
+        seconds = min(float(message.get('seconds') or self.max_seconds), self.max_seconds)
+        filename = os.path.join(os.path.abspath(message.get('directory') or os.getcwd()), '<request>')
+
+        session_id = message.get('session')
+        one_shot = session_id is None
+        if one_shot:
+            session_id = self.open_session()
+        session = self.sessions.get(str(session_id))
+        if session is None:
+            raise ValueError(f"no session '{session_id}'")
+        worker = session.worker
+        history = session.history if session.generation != worker.generation else []
+        session.generation = worker.generation
+        try:
+            reply = await worker.call('eval', (str(session_id), source, filename, steps, seconds, history),
+                                      seconds + GRACE_SECONDS)
+        except WorkerTimedOut:
+            # The session is rebuilt without this request, as after any other failure
+            reply = {'ok': False, 'error': f"time budget of {seconds:g}s exhausted; the worker was restarted"}
+        finally:
+            if one_shot:
+                self.close_session(session_id)
+                if session.generation == worker.generation:
+                    await worker.call('close', str(session_id), GRACE_SECONDS)
+        if reply['ok'] and not one_shot:
+            session.history.append((source, filename))
+        return reply
+
+    async def dispatch(self, message: dict):
+        op = message.get('op')
+        if op == 'ping':
+            return {'ok': True}
+        if op == 'open':
+            return {'ok': True, 'session': self.open_session()}
+        if op == 'eval':
+            return await self.evaluate(message)
+        if op == 'close':
+            session_id = str(message.get('session'))
+            if session_id not in self.sessions:
+                raise ValueError(f"no session '{session_id}'")
+            session = self.close_session(session_id)
+            if session.generation == session.worker.generation:
+                await session.worker.call('close', session_id, GRACE_SECONDS)
+            return {'ok': True}
+        raise ValueError(f"unknown op {op!r}")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        opened: list[str] = []  # Sessions opened on this connection, closed with it
+        try:
+            while True:
+                try:
+                    message = await read_message(reader)
+                except ProtocolError as e:
+                    # The stream cannot be trusted after a bad frame
+                    await write_message(writer, {'ok': False, 'error': str(e)})
+                    break
+                if message is None:
+                    break
+                self.requests += 1
+                try:
+                    reply = await self.dispatch(message)
+                except (ValueError, TypeError, WorkerLost) as e:
+                    reply = {'ok': False, 'error': str(e)}
+                if message.get('op') == 'open':
+                    opened.append(reply['session'])
+                await write_message(writer, reply)
+        except ConnectionError:
+            pass
+        finally:
+            for session_id in opened:
+                if session_id in self.sessions:
+                    session = self.close_session(session_id)
+                    if session.generation == session.worker.generation:
+                        try:
+                            await session.worker.call('close', session_id, GRACE_SECONDS)
+                        except (WorkerLost, OSError):
+                            pass  # Restarted, or stopped with the server
+            writer.close()
+
+
+async def serve(path: str, server: Server, ready: asyncio.Event | None = None):
+    if os.path.exists(path):
+        os.unlink(path)  # A socket left behind by a server that did not shut down
+    unix_server = await asyncio.start_unix_server(server.handle, path)
+    print(f"[mfp] Serving on {path} with {len(server.workers)} workers", file=sys.stderr)
+    if ready is not None:
+        ready.set()
+    try:
+        async with unix_server:
+            await unix_server.serve_forever()
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def run_server(path: str, workers: int | None = None, backend: str = 'vm', optimise: bool = False,
+               max_steps: int | None = None, max_seconds: float | None = None):
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, terminate)  # Stop as for Ctrl-C, so the workers are stopped too
+    server = Server(workers, backend, optimise, max_steps or MAX_STEPS, max_seconds or MAX_SECONDS)
+    try:
+        asyncio.run(serve(path, server))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"[mfp] Served {server.requests:,} requests", file=sys.stderr)
+
+
+def main():
+    import tempfile
+    from client import Client
+
+    path = os.path.join(tempfile.mkdtemp(), 'mfp.sock')
+
+    def talk():
+        with Client(path) as client:
+            session = client.open()
+            client.evaluate('f := x |-> x*x + 1\n', session)
+            print(client.evaluate('f(4)\n', session)['value'])                  # 17
+            print(client.evaluate('print(f(2))\n', session)['output'], end='')  # 5
+            loop = client.evaluate('loop := n |-> loop(n + 1)\nloop(0)\n', session, steps=100_000)
+            print(loop['error'])                       # step budget of 100,000 calls exhausted in 'loop'
+            print(client.evaluate('f(f(2))\n', session)['value'])               # 26, the session is intact
+            client.close_session(session)
+
+    async def demo():
+        server = Server(workers=2)
+        ready = asyncio.Event()
+        task = asyncio.create_task(serve(path, server, ready))
+        await ready.wait()
+        try:
+            await asyncio.to_thread(talk)  # The client blocks, so it gets a thread of its own
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            server.stop()
+
+    asyncio.run(demo())
+
+
+if __name__ == "__main__":
+    main()
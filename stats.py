@@ -0,0 +1,165 @@
+import tracemalloc
+from contextlib import contextmanager
+
+from ast_nodes import *
+from env import Env
+from sequence import numpy
+
+
+def describe(expr: ASTNode):
+    # Short label for a top-level expression in the report
+    if isinstance(expr, Binding):
+        return f"{expr.name} := ..."
+    if isinstance(expr, FunctionCall):
+        func = expr.func
+        while isinstance(func, FunctionCall):
+            func = func.func
+        if isinstance(func, Var):
+            return f"{func.name}(...)"
+    return type(expr).__name__
+
+
+class ExpressionStats:
+    def __init__(self, label: str):
+        self.label = label
+        self.envs = 0          # Environments (call frames) created
+        self.env_entries = 0   # Values stored in environments: arguments and global bindings
+        self.closures = 0      # Closures made
+        self.max_depth = 0     # Deepest nesting of MathFP calls; tail calls replace frames
+        self.peak_kb = 0.0     # Peak traced memory above what was in use before
+        self.retained_kb = 0.0  # Traced memory still in use afterwards
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class RuntimeStats:
+    """Counts the allocations made while running each top-level expression.
+
+    Pass it to an interpreter in place of a Profiler (`VM(stats)` or
+    `ProfilingEvaluator(stats)`) and run each expression inside
+    `expression()`:
+
+        stats = RuntimeStats()
+        with stats.expression('fib(20)', env):
+            env, result = VM(stats).execute(program, env)
+        print(stats.report())
+
+    Memory is measured with tracemalloc, started on first use; `stop` stops
+    it again if it was not already tracing. NumPy, if installed, is imported
+    before tracing starts, so that its import is not counted against the
+    first expression to use a sequence or vector.
+    """
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.started_tracing = False
+        self.expressions: list[ExpressionStats] = []
+        self.current = ExpressionStats('<outside expressions>')
+        self.keys: list = []  # Frame keys of the active calls, innermost last
+
+    # Profiler interface, called by the interpreter
+
+    def enter(self, name: str, key=None):
+        keys = self.keys
+        if key is not None and keys and keys[-1] == key:
+            keys.pop()  # Replaced by a tail call
+        keys.append(key)
+        current = self.current
+        current.envs += 1
+        current.env_entries += 1  # Every call frame holds just its argument
+        if len(keys) > current.max_depth:
+            current.max_depth = len(keys)
+
+    def exit(self):
+        self.keys.pop()
+
+    def closure_created(self):
+        self.current.closures += 1
+
+    @contextmanager
+    def expression(self, label: str, env: Env | None = None):
+        """Attributes everything counted inside the block to one expression.
+        With the global `env`, bindings it gains are counted as entries."""
+        stats = self.current = ExpressionStats(label)
+        self.expressions.append(stats)
+        globals_before = len(env.values) if env is not None else 0
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            numpy()
+            tracemalloc.start()
+            self.started_tracing = True
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        try:
+            yield stats
+        finally:
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                stats.peak_kb = (peak - memory_before) / 1024
+                stats.retained_kb = (current - memory_before) / 1024
+            if env is not None:
+                stats.env_entries += len(env.values) - globals_before
+            self.keys.clear()  # In case the expression raised mid-call
+            self.current = ExpressionStats('<outside expressions>')
+
+    def stop(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def totals(self):
+        totals = ExpressionStats('total')
+        for stats in self.expressions:
+            totals.envs += stats.envs
+            totals.env_entries += stats.env_entries
+            totals.closures += stats.closures
+            totals.max_depth = max(totals.max_depth, stats.max_depth)
+            totals.peak_kb = max(totals.peak_kb, stats.peak_kb)
+            totals.retained_kb += stats.retained_kb
+        return totals
+
+    def report(self):
+        lines = [f"{'envs':>10} {'entries':>10} {'closures':>9} {'depth':>7} "
+                 f"{'peak KB':>10} {'kept KB':>9}  expression"]
+        for stats in self.expressions + [self.totals()]:
+            lines.append(f"{stats.envs:>10,} {stats.env_entries:>10,} {stats.closures:>9,} "
+                         f"{stats.max_depth:>7,} {stats.peak_kb:>10,.1f} {stats.retained_kb:>9,.1f}  "
+                         f"{stats.label}")
+        return '\n'.join(lines)
+
+
+def main():
+    from tokeniser import Tokeniser
+    from parser import Parser
+    from resolver import Resolver
+    from vm import VM
+
+    source = (
+        'fact := n |-> if n > 0 then n*fact(n-1) else 1\n'
+        'add := x |-> y |-> x + y\n'
+        'print(fact(200) > 0)\n'
+        'add(9)(10)\n'
+    )
+
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+
+    stats = RuntimeStats()
+    vm = VM(stats)
+    env = Env()
+    for expr in parser.ast.exprs:
+        program = Program()
+        program.add_expression(expr)
+        with stats.expression(describe(expr), env):
+            env, _ = vm.execute(program, env)
+    stats.stop()
+    print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
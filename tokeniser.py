@@ -1,7 +1,13 @@
+import re
 import sys
+from collections.abc import Iterable, Iterator
+
+from preprocessor import SourceMap
 
 
 class Token:
+    __slots__ = ('token_type', 'lexeme', 'line', 'column')
+
     # Token Types
 
     IDENTIFIER = 0
@@ -23,150 +29,116 @@ class Token:
     THEN = 13
     ELSE = 14
 
-    def __init__(self, lexeme: str, token_type: int) -> None:
+    LOAD = 15  # Only in the preprocessor's output, see Preprocessor.load
+
+    def __init__(self, lexeme: str, token_type: int, line: int = 0, column: int = 0) -> None:
         self.token_type = token_type
         self.lexeme = lexeme
+        self.line = line
+        self.column = column
+
+    def position(self):
+        return f"{self.line}:{self.column}"
 
 
 class Tokeniser:
-    def __init__(self, source: str):
-        self.index: int = 0
+    # Skips whitespace and comments, then matches one lexeme. Every character
+    # is matched by some alternative, so scanning is a single linear pass with
+    # slicing only at lexeme boundaries. A final empty match consumes
+    # trailing whitespace.
+    PATTERN = re.compile(r'''
+        (?:[ \t\r]+|\#[^\n]*)*
+        (?:
+              (?P<newline>\n)
+            | (?P<number>\d+(?:\.\d*)?)
+            | (?P<word>[^\W\d_]\w*)
+            | (?P<symbol>:=|\|->|!load|[()+\-*/>])
+            | (?P<error>.)
+            | $
+        )
+    ''', re.VERBOSE)
+
+    KEYWORDS = {
+        'if': Token.IF,
+        'then': Token.THEN,
+        'else': Token.ELSE,
+    }
+
+    SYMBOLS = {
+        ':=': Token.BINDING,
+        '|->': Token.MAPS_TO,
+        '(': Token.LEFT_PAREN,
+        ')': Token.RIGHT_PAREN,
+        '+': Token.PLUS,
+        '-': Token.MINUS,
+        '*': Token.STAR,
+        '/': Token.SLASH,
+        '>': Token.GREATER_THAN,
+        '!load': Token.LOAD,
+    }
+
+    # Prefixes of multi-character symbols, with the symbol they must start
+    INCOMPLETE_SYMBOLS = {
+        ':': ':=',
+        '|': '|->',
+    }
+
+    def __init__(self, source: str | Iterable[str], source_map: SourceMap | None = None):
         self.tokens: list[Token] = []
-        self.source: str = source
+        self.source = source
+        self.source_map = source_map  # Reports positions in the original files
         self.had_error: bool = False
 
-    def current_char(self) -> str:
-        return self.source[self.index]
-
-    def advance_char(self):
-        self.index += 1
-
-    def next_char(self):
-        return self.source[self.index + 1]
-
-    def advance_chars(self, count: int):
-        self.index += count
-
-    def expect(self, char: str):
-        if self.index + 1 >= len(self.source):
-            raise RuntimeError(f"Unexpected EOF after character '{self.current_char()}'")
-        
-        if self.source[self.index + 1] != char:
-            raise RuntimeError(f"Expected character '{char}' but found '{self.current_char()}'")
-    
-    def expect_str(self, lexeme: str):
-        if self.index + len(lexeme) >= len(self.source):
-            raise RuntimeError(f"Unexpected EOF after '{lexeme}'")
-        
-        i = 0
-        while i < len(lexeme):
-            if self.source[self.index + i] != lexeme[i]:
-                wrong_lexeme = self.source[self.index:self.index+len(lexeme)]
-                raise RuntimeError(f"Expected sequence '{lexeme}' but found '{wrong_lexeme}'")
-            i += 1
-
-    def is_within_bounds(self):
-        return self.index < len(self.source)
-
-    def scan_number(self):
-        number = ''
-        while self.is_within_bounds() and self.current_char().isdigit():
-            number += self.current_char()
-            self.advance_char()
-            if self.is_within_bounds() and self.current_char() == '.':
-                number += self.current_char()
-                self.advance_char()
-                while self.is_within_bounds() and self.current_char().isdigit():
-                    number += self.current_char()
-                    self.advance_char()
-        return number
-
-    def scan_identifier(self):
-        identifier = ''
-        while self.is_within_bounds() and (
-                self.current_char().isalpha()
-                or self.current_char().isdigit()
-                or self.current_char() == '_'):
-            identifier += self.current_char()
-            self.advance_char()
-        return identifier
-    
-    def current_starts_with(self, needle: str):
-        haystack: str = self.source[self.index:]
-        if len(haystack) < len(needle):
-            return False
-        for i, ch in enumerate(needle):
-            if haystack[i] != ch:
-                return False
-        return True
+    def position(self, line: int, column: int):
+        if self.source_map is not None:
+            return self.source_map.describe(line, column)
+        return f"{line}:{column}"
 
     def tokenise(self):
-        while self.is_within_bounds():
-            if self.current_char() == '\n':
-                self.tokens.append(Token('\n', Token.END_LINE))
-                self.advance_char()
-            elif self.current_char() == ':':
-                self.expect('=')
-                self.tokens.append(Token(':=', Token.BINDING))
-                self.advance_chars(2)
-            elif self.current_char() == '|':
-                self.expect_str('|->')
-                self.tokens.append(Token('|->', Token.MAPS_TO))
-                self.advance_chars(3)
-            elif self.current_char() == '(':
-                self.tokens.append(Token('(', Token.LEFT_PAREN))
-                self.advance_char()
-            elif self.current_char() == ')':
-                self.tokens.append(Token(')', Token.RIGHT_PAREN))
-                self.advance_char()
-            
-            elif self.current_char() == '+':
-                self.tokens.append(Token('+', Token.PLUS))
-                self.advance_char()
-            elif self.current_char() == '-':
-                self.tokens.append(Token('-', Token.MINUS))
-                self.advance_char()
-            elif self.current_char() == '*':
-                self.tokens.append(Token('*', Token.STAR))
-                self.advance_char()
-            elif self.current_char() == '/':
-                self.tokens.append(Token('/', Token.SLASH))
-                self.advance_char()
-            elif self.current_char() == '>':
-                self.tokens.append(Token('>', Token.GREATER_THAN))
-                self.advance_char()
-
-            elif self.current_starts_with('if'):
-                self.tokens.append(Token('if', Token.IF))
-                self.advance_chars(2)
-            elif self.current_starts_with('then'):
-                self.tokens.append(Token('then', Token.THEN))
-                self.advance_chars(4)
-            elif self.current_starts_with('else'):
-                self.tokens.append(Token('else', Token.ELSE))
-                self.advance_chars(4)
-
-            elif self.current_char().isalpha():
-                identifier = self.scan_identifier()
-                self.tokens.append(Token(identifier, Token.IDENTIFIER))
-            
-            elif self.current_char().isdigit():
-                number = self.scan_number()
-                self.tokens.append(Token(number, Token.NUMBER))
-            
-            elif self.current_char() in (' ', '\t'):
-                self.advance_char()
-
-            # Skip '#' comments
-            elif self.current_char() == '#':
-                while self.is_within_bounds() and self.current_char() != '\n':
-                    self.advance_char()
-
-            else:
-                self.had_error = True
-                print(f"Unexpected character '{self.current_char()}' in source", file=sys.stderr)
-                self.advance_char()
-
+        self.tokens.extend(self.iter_tokens())
+
+    def iter_tokens(self) -> Iterator[Token]:
+        """Yields tokens one at a time. The source is either a string or an
+        iterable of whole lines (an open file, the Preprocessor's output),
+        which is then consumed lazily.
+        """
+        keywords, symbols = self.KEYWORDS, self.SYMBOLS
+        intern = sys.intern
+        chunks = (self.source,) if isinstance(self.source, str) else self.source
+        line = 1
+
+        # No token spans a newline, so each chunk can be scanned on its own
+        for chunk in chunks:
+            line_start = 0
+            for match in self.PATTERN.finditer(chunk):
+                kind = match.lastgroup
+                if kind is None:
+                    continue
+                lexeme = match.group(kind)
+                start = match.start(kind)
+                column = start - line_start + 1
+
+                if kind == 'word':
+                    # Interned, so every occurrence of a name shares one string
+                    yield Token(intern(lexeme), keywords.get(lexeme, Token.IDENTIFIER), line, column)
+                elif kind == 'symbol':
+                    yield Token(intern(lexeme), symbols[lexeme], line, column)
+                elif kind == 'number':
+                    yield Token(lexeme, Token.NUMBER, line, column)
+                elif kind == 'newline':
+                    yield Token('\n', Token.END_LINE, line, column)
+                    line, line_start = line + 1, start + 1
+                elif kind == 'error':
+                    if lexeme in self.INCOMPLETE_SYMBOLS:
+                        expected = self.INCOMPLETE_SYMBOLS[lexeme]
+                        found = chunk[start:start + len(expected)]
+                        raise RuntimeError(f"Expected sequence '{expected}' but found '{found}' at {self.position(line, column)}")
+                    self.had_error = True
+                    self.report(f"Unexpected character '{lexeme}' in source at {self.position(line, column)}")
+
+    def report(self, message: str):
+        # Overridden to collect errors instead of printing them (see embed.py)
+        print(message, file=sys.stderr)
 
 def main():
     source = 'fact := n |-> if n > 0 then n*fact(n-1) else 1\n'
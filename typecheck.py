@@ -0,0 +1,308 @@
+import functools
+import sys
+
+from ast_nodes import *
+from env import Env
+
+
+# A type is the set of kinds of value an expression may have
+INT, FLOAT, BOOL, VECTOR = 'int', 'float', 'bool', 'vector'
+FUNCTION, NONE, SEQUENCE = 'function', 'none', 'sequence'
+NUMBER = frozenset({INT, FLOAT, BOOL})
+NUMERIC = NUMBER | {VECTOR}  # What arithmetic accepts: vectors broadcast
+ANY = NUMERIC | {FUNCTION, NONE, SEQUENCE}
+EMPTY: frozenset[str] = frozenset()  # No value yet: a recursive function's result while it is inferred
+NUMBER_TYPES = {int: frozenset({INT}), float: frozenset({FLOAT}), bool: frozenset({BOOL})}
+
+# Result types of calls to builtins, and the arguments they need
+BUILTIN_RETURNS = {
+    'print': frozenset({NONE}),
+    'memo': frozenset({FUNCTION}),
+    'memo_lru': frozenset({FUNCTION}),
+    'range': frozenset({FUNCTION}),
+    'map': frozenset({FUNCTION}),
+    'filter': frozenset({FUNCTION}),
+    'fold': frozenset({FUNCTION}),
+    'take': frozenset({FUNCTION}),
+    'iterate': frozenset({FUNCTION}),
+    'sum': NUMERIC,
+    'max': NUMERIC,
+    'linspace': frozenset({FUNCTION}),
+    'zeros': frozenset({VECTOR}),
+    'vector': frozenset({VECTOR}),
+    'where': frozenset({FUNCTION}),
+    'exp': frozenset({FLOAT, VECTOR}),
+    'ln': frozenset({FLOAT, VECTOR}),
+    'sin': frozenset({FLOAT, VECTOR}),
+    'cos': frozenset({FLOAT, VECTOR}),
+}
+BUILTIN_PARAMS = {
+    'memo': frozenset({FUNCTION}),
+    'memo_lru': NUMBER,
+    'range': NUMBER,
+    'map': frozenset({FUNCTION}),
+    'filter': frozenset({FUNCTION}),
+    'fold': frozenset({FUNCTION}),
+    'take': NUMBER,
+    'iterate': frozenset({FUNCTION}),
+    'sum': frozenset({SEQUENCE, VECTOR}),
+    'max': frozenset({SEQUENCE, VECTOR}),
+    'linspace': NUMBER,
+    'zeros': NUMBER,
+    'vector': frozenset({SEQUENCE}),
+    'where': NUMERIC,
+    'exp': NUMERIC,
+    'ln': NUMERIC,
+    'sin': NUMERIC,
+    'cos': NUMERIC,
+}
+
+
+def describe(kinds: frozenset[str]):
+    if kinds & NUMBER:
+        kinds = kinds - {VECTOR}  # Vectors go wherever numbers do, so are only named alone
+    if NUMBER <= kinds:
+        kinds = kinds - NUMBER | {'number'}
+    return ' or '.join(sorted(kinds)) if kinds else 'nothing'
+
+
+@functools.cache
+def arithmetic(op: str, left: frozenset[str], right: frozenset[str]):
+    # Result type of a BinaryOp on numeric operands of these types: a vector
+    # if either operand may be one, and a number if both may be numbers
+    left, right = left & NUMERIC, right & NUMERIC
+    if not left or not right:
+        return EMPTY
+    vector = frozenset({VECTOR}) if VECTOR in left | right else EMPTY
+    left, right = left & NUMBER, right & NUMBER
+    if not left or not right:
+        return vector
+    if op == '>':
+        return frozenset({BOOL}) | vector
+    if op == '/':
+        return frozenset({FLOAT}) | vector
+    return frozenset(FLOAT if FLOAT in (l, r) else INT for l in left for r in right) | vector
+
+
+def function_of(expr: ASTNode):
+    # The function a binding defines: a lambda, or one passed to memo or memo_lru(size)
+    if isinstance(expr, FunctionDef_):
+        return expr
+    if isinstance(expr, FunctionCall) and isinstance(expr.arg, FunctionDef_):
+        func = expr.func.func if isinstance(expr.func, FunctionCall) else expr.func
+        if isinstance(func, Var) and func.depth is None and func.name in ('memo', 'memo_lru'):
+            return expr.arg
+    return None
+
+
+class Scope:
+    def __init__(self, param: str):
+        self.param = param
+        self.type = ANY  # Narrowed by how the body uses the parameter
+
+
+class TypeChecker(ASTVisitor):
+    """Infers the type of every expression of a resolved AST and reports
+    expressions that cannot work, such as adding a function to a number or
+    calling a number, before the program runs.
+
+    Parameters start out as any value and are narrowed by their uses: `x`
+    in `x |-> x*x + 1` must be a number, `f` in `f |-> f(1)` a function.
+    The result type of a top-level function is inferred by iterating to a
+    fixed point, so recursive functions have one too.
+
+    Every BinaryOp and UnaryOp whose operands are all numbers (or vectors,
+    whose operators broadcast) is marked `numeric`, which lets the
+    Specialiser compile it. As with the Resolver, the types of global
+    bindings persist between calls to `check`; each call prints its errors
+    and sets `had_error`. Visitor methods return types.
+    """
+
+    def __init__(self):
+        self.globals: dict[int, frozenset[str]] = {}      # Global slot -> type
+        self.returns: dict[int, frozenset[str]] = {}      # Global slot -> result type of its function
+        self.params: dict[int, frozenset[str]] = {}       # Global slot -> parameter type of its function
+        self.bodies: dict[int, frozenset[str]] = {}       # id(FunctionDef_) -> body type, per expression
+        self.function_params: dict[int, frozenset[str]] = {}  # id(FunctionDef_) -> parameter type
+        self.scopes: list[Scope] = []
+        self.inferring: int | None = None  # Slot of the function whose result type is being inferred
+        self.recursive = False             # Did its body use that result type?
+        self.context = '<program>'
+        self.errors: list[str] = []
+        self.had_error = False
+
+    def check(self, node: ASTNode):
+        start = len(self.errors)
+        node.accept(None, self)
+        for error in self.errors[start:]:
+            self.report(error)
+        self.had_error = len(self.errors) > start
+        return node
+
+    def report(self, error: str):
+        # Overridden to leave the errors in `errors` unprinted (see embed.py)
+        print(f"[mfp] Type error {error}", file=sys.stderr)
+
+    def error(self, message: str):
+        self.errors.append(f"in {self.context}: {message}")
+
+    def param_scope(self, node: ASTNode):
+        if isinstance(node, Var) and node.depth is not None and node.depth < len(self.scopes):
+            return self.scopes[-1 - node.depth]
+        return None
+
+    def operand(self, env: Env, node: ASTNode, kinds: frozenset[str], message: str):
+        # Types a subexpression that must be one of `kinds`, narrowing a
+        # parameter used there; errors read "<message> <actual type>"
+        scope = self.param_scope(node)
+        if scope is not None:
+            if not scope.type & kinds:
+                self.error(f"'{scope.param}' is used as {describe(scope.type)} and as {describe(kinds)}")
+                return kinds
+            scope.type &= kinds
+            return scope.type
+        kind = node.accept(env, self)
+        if kind and not kind & kinds:
+            self.error(f"{message} {describe(kind)}")
+        return kind
+
+    def visit_program(self, env: Env, node: Program):
+        for expr in node.exprs:
+            if isinstance(expr, Binding) and expr.slot is not None:
+                self.check_global_binding(expr)
+            else:
+                self.context = expr.name if isinstance(expr, Binding) else '<program>'
+                self.check_expression(expr)
+        return EMPTY
+
+    def check_expression(self, expr: ASTNode):
+        start = len(self.errors)
+        self.bodies.clear()
+        self.function_params.clear()
+        kind = expr.accept(None, self)
+        return kind, start
+
+    def check_global_binding(self, node: Binding):
+        self.context = node.name
+        slot = node.slot
+        function = function_of(node.expr)
+        if function is None:
+            self.globals[slot], _ = self.check_expression(node.expr)
+            return
+
+        # Recursive calls see the result type found so far, until it stops growing
+        self.globals[slot] = frozenset({FUNCTION})
+        self.returns[slot] = EMPTY
+        self.inferring = slot
+        while True:
+            self.recursive = False
+            self.globals[slot], start = self.check_expression(node.expr)
+            body = self.bodies[id(function)]
+            if body <= self.returns[slot]:
+                break
+            self.returns[slot] |= body
+            if not self.recursive:
+                break
+            del self.errors[start:]
+        self.inferring = None
+        self.params[slot] = self.function_params.get(id(function), ANY)
+
+    def visit_number(self, env: Env, node: Number):
+        return NUMBER_TYPES[type(node.value)]
+
+    def visit_var(self, env: Env, node: Var):
+        scope = self.param_scope(node)
+        if scope is not None:
+            return scope.type
+        if node.depth is None:
+            return frozenset({FUNCTION}) if node.name in BUILTIN_RETURNS else ANY
+        return self.globals.get(node.slot, ANY)
+
+    def visit_binding(self, env: Env, node: Binding):
+        # Bindings nested inside other expressions evaluate to None
+        node.expr.accept(env, self)
+        return frozenset({NONE})
+
+    def visit_functiondef(self, env: Env, node: FunctionDef_):
+        scope = Scope(node.param)
+        self.scopes.append(scope)
+        self.bodies[id(node)] = node.body.accept(env, self)
+        self.scopes.pop()
+        self.function_params[id(node)] = scope.type
+        return frozenset({FUNCTION})
+
+    def visit_functioncall(self, env: Env, node: FunctionCall):
+        func = node.func
+        self.operand(env, func, frozenset({FUNCTION}), "cannot call")
+
+        if isinstance(func, Var) and func.depth is None and func.name in BUILTIN_RETURNS:
+            if func.name in BUILTIN_PARAMS:
+                param = BUILTIN_PARAMS[func.name]
+                self.operand(env, node.arg, param, f"{func.name} expects {describe(param)}, got")
+            else:
+                node.arg.accept(env, self)
+            return BUILTIN_RETURNS[func.name]
+        if isinstance(func, Var) and func.depth is not None and self.param_scope(func) is None \
+                and func.slot in self.returns:
+            param = self.params.get(func.slot)
+            if param is None:  # A recursive call, while its function is inferred
+                self.recursive = True
+                node.arg.accept(env, self)
+            else:
+                self.operand(env, node.arg, param, f"'{func.name}' expects {describe(param)}, got")
+            return self.returns[func.slot]
+        node.arg.accept(env, self)
+        if isinstance(func, FunctionDef_):
+            return self.bodies[id(func)]
+        return ANY
+
+    def visit_binaryop(self, env: Env, node: BinaryOp):
+        message = f"cannot apply '{node.op}' to"
+        left = self.operand(env, node.left, NUMERIC, message)
+        right = self.operand(env, node.right, NUMERIC, message)
+        node.numeric = bool(left) and bool(right) and left <= NUMERIC and right <= NUMERIC
+        return arithmetic(node.op, left, right)
+
+    def visit_unaryop(self, env: Env, node: UnaryOp):
+        right = self.operand(env, node.right, NUMERIC, "cannot negate")
+        node.numeric = bool(right) and right <= NUMERIC
+        return frozenset(kind if kind in (FLOAT, VECTOR) else INT for kind in right & NUMERIC)
+
+    def visit_ifexpr(self, env: Env, node: IfExpr):
+        node.cond.accept(env, self)
+        return node.then_expr.accept(env, self) | node.else_expr.accept(env, self)
+
+    def visit_load(self, env: Env, node: Load):
+        return frozenset({VECTOR})
+
+
+def main():
+    from tokeniser import Tokeniser
+    from parser import Parser
+    from resolver import Resolver
+
+    source = (
+        'f := x |-> x*x + 2*x - 4\n'
+        'fib := n |-> if 2 > n then n else fib(n-1) + fib(n-2)\n'
+        'half := x |-> x / 2\n'
+        'print(f + 1)\n'
+        'fib(half)\n'
+    )
+
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+
+    checker = TypeChecker()
+    checker.check(parser.ast)  # Reports both errors in the last two lines
+    for slot, name in enumerate(['f', 'fib', 'half']):
+        print(f"{name}: {describe(checker.params[slot])} -> {describe(checker.returns[slot])}")
+    # f: number -> float or int
+    # fib: number -> number
+    # half: number -> float
+
+
+if __name__ == "__main__":
+    main()
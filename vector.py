@@ -0,0 +1,228 @@
+import os
+
+from sequence import Block, Sequence, numpy, builtin_sum as sequence_sum
+
+
+def require_numpy(name: str):
+    np = numpy()
+    if np is None:
+        raise RuntimeError(f"{name}: NumPy is required for vectors")
+    return np
+
+
+def floats(values):
+    # Arithmetic on vectors of booleans counts them, as on Python's bools
+    return values.astype(numpy().float64) if values.dtype == bool else values
+
+
+class Vector:
+    """An immutable vector of floats (or of booleans, made by '>'), backed by
+    a NumPy array.
+
+    Arithmetic and '>' with a number or a vector of the same length work
+    elementwise, as do exp, ln, sin and cos, so one evaluation of a formula
+    computes it for every element. Following IEEE 754 rather than Python's
+    scalar arithmetic, dividing by zero gives inf or NaN instead of raising.
+    A vector is neither true nor false: `if` needs a number, and
+    where(cond)(a)(b) chooses elementwise.
+    """
+
+    __slots__ = ('values',)
+    __hash__ = None  # Never a memo key: vectors are large and compared elementwise
+
+    def __init__(self, values):
+        self.values = values
+
+    def operand(self, other):
+        # The other operand as an array or a float, or None if unsupported
+        if type(other) is Vector:
+            if len(other.values) != len(self.values):
+                raise ValueError(f"vectors of different lengths: {len(self.values)} and {len(other.values)}")
+            return floats(other.values)
+        if type(other) in (int, float, bool):
+            return float(other)
+        return None
+
+    def apply(self, ufunc, left, right):
+        np = numpy()
+        if left is None or right is None:
+            return NotImplemented
+        with np.errstate(all='ignore'):
+            return Vector(ufunc(left, right))
+
+    def __add__(self, other):
+        return self.apply(numpy().add, floats(self.values), self.operand(other))
+
+    def __radd__(self, other):
+        return self.apply(numpy().add, self.operand(other), floats(self.values))
+
+    def __sub__(self, other):
+        return self.apply(numpy().subtract, floats(self.values), self.operand(other))
+
+    def __rsub__(self, other):
+        return self.apply(numpy().subtract, self.operand(other), floats(self.values))
+
+    def __mul__(self, other):
+        return self.apply(numpy().multiply, floats(self.values), self.operand(other))
+
+    def __rmul__(self, other):
+        return self.apply(numpy().multiply, self.operand(other), floats(self.values))
+
+    def __truediv__(self, other):
+        return self.apply(numpy().true_divide, floats(self.values), self.operand(other))
+
+    def __rtruediv__(self, other):
+        return self.apply(numpy().true_divide, self.operand(other), floats(self.values))
+
+    def __gt__(self, other):
+        return self.apply(numpy().greater, floats(self.values), self.operand(other))
+
+    def __lt__(self, other):
+        # `number > vector`, reflected
+        return self.apply(numpy().less, floats(self.values), self.operand(other))
+
+    def __neg__(self):
+        return Vector(numpy().negative(floats(self.values)))
+
+    def __bool__(self):
+        raise TypeError("a vector is neither true nor false: use where(cond)(a)(b) to choose elementwise")
+
+    def __repr__(self):
+        values = self.values.tolist()
+        shown = [repr(value) for value in values] if len(values) <= 8 else \
+            [*map(repr, values[:3]), '...', *map(repr, values[-3:])]
+        return f"<vector [{', '.join(shown)}] ({len(values)} elements)>"
+
+
+class Elementwise:
+    """A math builtin taking a number, which also applies to each element of
+    a vector. Shows as the math function it wraps."""
+
+    def __init__(self, func, ufunc_name: str):
+        self.func = func
+        self.ufunc_name = ufunc_name
+
+    def __call__(self, x):
+        if type(x) is not Vector:
+            return self.func(x)
+        np = numpy()
+        with np.errstate(all='ignore'):
+            return Vector(getattr(np, self.ufunc_name)(floats(x.values)))
+
+    def __repr__(self):
+        return repr(self.func)
+
+
+def check_count(value, name: str):
+    if type(value) is not int or value < 0:
+        raise ValueError(f"{name}: expected a whole number of elements, got {value!r}")
+    return value
+
+
+def check_number(value, name: str):
+    if type(value) not in (int, float, bool):
+        raise TypeError(f"{name}: expected a number, got {value!r}")
+    return value
+
+
+def load_array(path: str):
+    """A .npy file, or else raw little-endian float64 values."""
+    np = require_numpy('load')
+    if path.endswith('.npy'):
+        values = np.load(path, allow_pickle=False)
+        if values.ndim != 1:
+            raise ValueError(f"load: '{path}' holds an array of shape {values.shape}, not a vector")
+        return values.astype(np.float64)
+    size = os.path.getsize(path)
+    if size % 8:
+        raise ValueError(f"load: '{path}' is {size} bytes, not a whole number of float64 values")
+    return np.fromfile(path, dtype='<f8').astype(np.float64)
+
+
+EMPTY = object()  # max's default, which no element can be
+
+
+# Built-in functions, curried like MathFP functions
+def builtin_linspace(start):
+    check_number(start, 'linspace')
+    return lambda stop: lambda count: Vector(
+        require_numpy('linspace').linspace(start, check_number(stop, 'linspace'), check_count(count, 'linspace')))
+
+
+def builtin_zeros(count):
+    return Vector(require_numpy('zeros').zeros(check_count(count, 'zeros')))
+
+
+def load_vector(path: str):
+    # The value of a Load node (see !load in preprocessor.py)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"load: no such file '{path}'")
+    return Vector(load_array(path))
+
+
+def builtin_vector(seq):
+    np = require_numpy('vector')
+    if not isinstance(seq, Sequence):
+        raise TypeError(f"vector: expected a sequence, got {seq!r}")
+    parts = [floats(chunk.values) if type(chunk) is Block else np.fromiter(chunk, dtype=np.float64)
+             for chunk in seq.chunks()]
+    return Vector(np.concatenate(parts) if parts else np.zeros(0))
+
+
+def builtin_where(cond):
+    def choose(a, b):
+        if type(cond) is not Vector:
+            return a if cond else b
+        a = floats(a.values) if type(a) is Vector else a
+        b = floats(b.values) if type(b) is Vector else b
+        return Vector(numpy().where(cond.values != 0, a, b).astype(numpy().float64))  # NaN is true, as in Python
+    return lambda a: lambda b: choose(a, b)
+
+
+def builtin_sum(value):
+    if type(value) is Vector:
+        return value.values.sum().item()
+    if isinstance(value, Sequence):
+        return sequence_sum(value)
+    raise TypeError(f"sum: expected a sequence or a vector, got {value!r}")
+
+
+def builtin_max(value):
+    if type(value) is Vector:
+        if not len(value.values):
+            raise ValueError("max: the vector is empty")
+        return value.values.max().item()
+    if isinstance(value, Sequence):
+        result = max(value, default=EMPTY)  # Compares with '>', as MathFP does
+        if result is EMPTY:
+            raise ValueError("max: the sequence is empty")
+        return result
+    raise TypeError(f"max: expected a sequence or a vector, got {value!r}")
+
+
+def main():
+    from env import Env
+    from tokeniser import Tokeniser
+    from parser import Parser
+    from resolver import Resolver
+    from vm import VM
+
+    source = (
+        'f := x |-> 2*x*x + 3*x - 1\n'
+        'xs := linspace(0)(1)(5)\n'
+        'print(f(xs))\n'
+        'print(where(xs > 0.5)(1)(0))\n'
+        'print(sum(exp(-xs)))\n'
+        'print(max(sin(xs)))\n'
+    )
+
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+    VM().execute(parser.ast, Env())
+
+
+if __name__ == "__main__":
+    main()
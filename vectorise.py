@@ -0,0 +1,337 @@
+import functools
+from types import FunctionType
+
+from ast_nodes import *
+from closure import Closure
+from env import Env, UNBOUND
+from memo import Memo
+
+
+EXACT_LIMIT = 2**53  # Integers below this in magnitude are exact as float64
+
+
+@functools.cache
+def numpy():
+    # Imported on first use: NumPy takes longer to import than all of MathFP,
+    # and most programs never need it
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class Unvectorisable(Exception):
+    pass
+
+
+# Raised while computing over an array whose results would not be exactly
+# what calling the function on each element gives: an integer too large for
+# a float64, or a division by zero (which the per-element path raises)
+class Inexact(Exception):
+    pass
+
+
+def array_builtins():
+    np = numpy()
+
+    def floats(ufunc):
+        # Always float64, as Python gives floats: NumPy gives float16 for booleans
+        return lambda x: ufunc(x, dtype=np.float64)
+    return {
+        'exp': floats(np.exp),
+        'ln': floats(np.log),
+        'sin': floats(np.sin),
+        'cos': floats(np.cos),
+    }
+
+
+def is_integer(value):
+    return numpy().asarray(value).dtype.kind in 'biu'
+
+
+def exact(ufunc: str):
+    # Integer arithmetic done in float64 and checked to be exact: int64 would
+    # silently wrap around where Python integers grow
+    def apply(left, right):
+        np = numpy()
+        if not (is_integer(left) and is_integer(right)):
+            return getattr(np, ufunc)(left, right)
+        result = getattr(np, ufunc)(left, right, dtype=np.float64)
+        if not np.all(np.abs(result) < EXACT_LIMIT):
+            raise Inexact()
+        return result.astype(np.int64)
+    return apply
+
+
+def divide(left, right):
+    # Dividing by zero raises, as it does for Python numbers
+    np = numpy()
+    if np.any(right == 0):
+        raise Inexact()
+    return np.true_divide(left, right)
+
+
+def exact_input(values) -> bool:
+    # Can the compiled body take these values? Integers must be exact as float64
+    np = numpy()
+    kind = values.dtype.kind
+    return kind in 'fc' or kind in 'biu' and bool(np.all(np.abs(values) < EXACT_LIMIT))
+
+
+def definition(func):
+    # The FunctionDef_ of a MathFP function and the environment it was
+    # defined in, or None for builtins and memoized functions
+    if type(func) is Closure:
+        # Evaluator closures hold the FunctionDef_ itself, VM closures a CodeObject
+        function = func.function
+        return (function if isinstance(function, FunctionDef_) else function.node), func.env
+    if type(func) is FunctionType and hasattr(func, 'node'):
+        return func.node, func.env  # Made by the 'py' backend
+    return None
+
+
+class ArrayCompiler(ASTVisitor):
+    """Compiles the body of a one-parameter MathFP function into a Python
+    function computing it over a whole NumPy array at once.
+
+    BinaryOp/UnaryOp become ufuncs, math builtins their NumPy equivalents and
+    IfExpr evaluates each branch only on the elements selected by the
+    condition. The `env` argument of the visitor methods is the environment
+    the function was defined in. Raises Unvectorisable for anything else
+    (nested lambdas, recursion, print, ...). The compiled function raises
+    Inexact if integer arithmetic leaves the range float64 holds exactly or
+    a divisor is zero, and is run under np.errstate(all='raise'), so an
+    overflow or a value outside a math function's domain raises
+    FloatingPointError; the caller then computes element by element, where
+    Python raises or not as it would for one number.
+
+    Results are arrays of the NumPy dtype matching the Python type each
+    element would have: int64, float64 or bool. With `same_types`, an `if`
+    whose branches give different types raises Inexact, as NumPy would
+    convert one to the other; sequences need this, as each of their
+    elements keeps its own type.
+    """
+
+    BINARY = {
+        '+': exact('add'),
+        '-': exact('subtract'),
+        '*': exact('multiply'),
+        '/': divide,
+        '>': lambda left, right: numpy().greater(left, right),
+    }
+
+    def __init__(self, same_types: bool = False):
+        self.same_types = same_types
+        self.compiling: dict[int, None] = {}  # ids of functions being compiled, to detect recursion
+        self.builtins = array_builtins()
+
+    def compile(self, func):
+        defined = definition(func)
+        if defined is None:
+            raise Unvectorisable(f"{func!r} is not a MathFP function")
+        node, env = defined
+        if id(func) in self.compiling:
+            raise Unvectorisable(f"'{node.name}' is recursive")
+        self.compiling[id(func)] = None
+        try:
+            return node.body.accept(env, self)
+        finally:
+            del self.compiling[id(func)]
+
+    def visit_program(self, env: Env, node: Program):
+        raise Unvectorisable("not a function")
+
+    def visit_number(self, env: Env, node: Number):
+        value = self.constant(node.value)
+        return lambda x: value
+
+    def constant(self, value):
+        if type(value) is int and abs(value) >= EXACT_LIMIT:
+            raise Unvectorisable(f"{value} is too large for a float64")
+        return value
+
+    def visit_var(self, env: Env, node: Var):
+        if node.depth == 0:
+            return lambda x: x
+        value = self.captured_value(env, node)
+        if isinstance(value, (int, float)):
+            value = self.constant(value)
+            return lambda x: value
+        raise Unvectorisable(f"'{node.name}' is not a number")
+
+    def captured_value(self, env: Env, node: Var):
+        if node.depth is None:
+            raise Unvectorisable(f"'{node.name}' is not a captured variable")
+        value = env.lookup(node.depth - 1, node.slot)
+        if value is UNBOUND:
+            value = env.force(node.depth - 1, node.slot)
+        if value is UNBOUND:
+            raise Unvectorisable(f"'{node.name}' is unbound")
+        return value
+
+    def visit_binding(self, env: Env, node: Binding):
+        raise Unvectorisable("bindings are not supported")
+
+    def visit_functiondef(self, env: Env, node: FunctionDef_):
+        raise Unvectorisable("nested functions are not supported")
+
+    def visit_functioncall(self, env: Env, node: FunctionCall):
+        if not isinstance(node.func, Var):
+            raise Unvectorisable("only calls to named functions are supported")
+        arg = node.arg.accept(env, self)
+
+        if node.func.depth is None and node.func.name in self.builtins:
+            func = self.builtins[node.func.name]
+            return lambda x: func(arg(x))
+
+        callee = self.captured_value(env, node.func)
+        if type(callee) is Memo:
+            callee = callee.func  # Pure, so the cache makes no difference
+        if definition(callee) is None:
+            raise Unvectorisable(f"'{node.func.name}' is not a MathFP function")
+        func = self.compile(callee)
+        return lambda x: func(arg(x))
+
+    def visit_binaryop(self, env: Env, node: BinaryOp):
+        left = node.left.accept(env, self)
+        right = node.right.accept(env, self)
+        op_func = self.BINARY[node.op]
+        return lambda x: op_func(left(x), right(x))
+
+    def visit_unaryop(self, env: Env, node: UnaryOp):
+        right = node.right.accept(env, self)
+
+        def negate(x):
+            np = numpy()
+            value = right(x)
+            if np.asarray(value).dtype.kind == 'b':
+                value = np.asarray(value, dtype=np.int64)  # -True is -1
+            return np.negative(value)
+        return negate
+
+    def visit_ifexpr(self, env: Env, node: IfExpr):
+        cond = node.cond.accept(env, self)
+        then_expr = node.then_expr.accept(env, self)
+        else_expr = node.else_expr.accept(env, self)
+
+        def masked_if(x):
+            np = numpy()
+            mask = cond(x) != 0  # NaN is true, as in Python
+            if np.ndim(mask) == 0:
+                return then_expr(x) if mask else else_expr(x)
+            mask = np.broadcast_to(mask, np.shape(x))
+            then_values = then_expr(x[mask])
+            else_values = else_expr(x[~mask])
+            if self.same_types and np.asarray(then_values).dtype != np.asarray(else_values).dtype:
+                raise Inexact()
+            result = np.empty(np.shape(x), dtype=np.result_type(then_values, else_values))
+            result[mask] = then_values
+            result[~mask] = else_values
+            return result
+        return masked_if
+
+    def visit_load(self, env: Env, node: Load):
+        raise Unvectorisable("!load is not supported")
+
+
+class VectorisedFunction:
+    """Applies a MathFP function elementwise to a NumPy array.
+
+    Uses the array-compiled body when possible and otherwise falls back to
+    calling the function once per element (`vectorised` tells which). Calls
+    whose integers would not stay exact in the compiled body, such as
+    results past 2**53, fall back too, so the results are always those of
+    calling the function on each element.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = definition(func)[0].name
+        try:
+            self.array_func = ArrayCompiler().compile(func)
+            self.vectorised = True
+        except Unvectorisable as e:
+            self.array_func = None
+            self.vectorised = False
+            self.reason = str(e)
+
+    def __call__(self, values):
+        np = numpy()
+        values = np.asarray(values)
+        if self.array_func is not None and exact_input(values):
+            try:
+                with np.errstate(all='raise'):
+                    result = self.array_func(values)
+            except (Inexact, FloatingPointError):
+                pass
+            else:
+                return np.broadcast_to(result, values.shape) if np.ndim(result) == 0 else result
+        # .tolist() hands the function Python numbers, as in a scalar call
+        results = [self.func(value) for value in values.ravel().tolist()]
+        return np.array(results).reshape(values.shape)
+
+    def __repr__(self):
+        mode = 'vectorised' if self.vectorised else f'scalar fallback: {self.reason}'
+        return f"<vectorised {self.name} ({mode})>"
+
+
+def vectorise(func) -> VectorisedFunction:
+    if numpy() is None:
+        raise RuntimeError("vectorise: NumPy is required for batch evaluation")
+    if type(func) is Memo:
+        func = func.func
+    if definition(func) is None:
+        raise TypeError(f"vectorise: expected a MathFP function, got {func!r}")
+    return VectorisedFunction(func)
+
+
+def main():
+    from tokeniser import Tokeniser
+    from parser import Parser
+    from resolver import Resolver
+    from vm import VM
+
+    source = (
+        'f := x |-> 2*x*x + 3*x - 1\n'
+        'abs := x |-> if x > 0 then x else -x\n'
+        'fact := n |-> if n > 0 then n*fact(n-1) else 1\n'
+        'recip := x |-> 1/x\n'
+        'log := x |-> ln(x)\n'
+        'grow := x |-> exp(x)\n'
+        'sign := x |-> -(x > 0)\n'
+        'big := x |-> x*x*x*x*x*x*x*x\n'
+    )
+
+    np = numpy()
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+    env, _ = VM().execute(parser.ast, Env())
+
+    points = np.linspace(-2, 2, 5)
+    for slot in range(3):
+        func = vectorise(env.values[slot])
+        print(func, func(points))
+
+    def outcome(call, values):
+        try:
+            return call(values)
+        except Exception as e:
+            return type(e).__name__
+
+    # Where NumPy and Python disagree the results are still Python's:
+    # ZeroDivisionError, ValueError, OverflowError, [-1 0], [10**24 ...]
+    cases = ((3, [0, 1]), (4, [0.0, 1.0]), (5, [1000.0]), (6, [1, -1]), (7, [1000, 2]))
+    for slot, values in cases:
+        func = vectorise(env.values[slot])
+        expected = outcome(lambda xs: np.array([env.values[slot](x) for x in xs]), values)
+        result = outcome(func, np.array(values))
+        same = np.array_equal(result, expected) if isinstance(expected, np.ndarray) else result == expected
+        print(func.name, values, result, 'same' if same else f'differs from {expected}')
+
+
+if __name__ == "__main__":
+    main()
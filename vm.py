@@ -0,0 +1,229 @@
+import sys
+
+from ast_nodes import Program
+from closure import Closure
+from compiler import CodeObject, Compiler, Op
+from env import Env, UNBOUND
+from memo import Memo, MISSING
+from profiler import Profiler
+from eval import BUILTINS
+
+
+class VM:
+    """Stack-based virtual machine executing CodeObjects from the Compiler.
+
+    MathFP calls push a frame onto the VM's own frame stack instead of
+    recursing in Python, so recursion depth is bounded by memory rather than
+    the Python stack. Tail calls replace the current frame.
+
+    With a `profiler` (a Profiler, RuntimeStats or anything else with their
+    methods), programs are compiled with profiling instructions that report
+    every call and closure to it; without one they run exactly as before.
+    """
+
+    def __init__(self, profiler: Profiler | None = None):
+        self.profiler = profiler
+
+    def execute(self, program: Program, env: Env):
+        return self.run(Compiler(profile=self.profiler is not None).compile(program), env)
+
+    def call(self, closure: Closure, arg):
+        return self.run(closure.function, Env([arg], closure.env))[1]
+
+    def runs(self, func):
+        # Can `func` be called on this VM's frame stack?
+        return type(func) is Closure and func.interpreter is self
+
+    def run(self, code: CodeObject, env: Env):
+        # Opcodes as locals, avoids global lookups in the dispatch loop
+        LOAD_CONST, LOAD_LOCAL, LOAD_OUTER, LOAD_NAME = Op.LOAD_CONST, Op.LOAD_LOCAL, Op.LOAD_OUTER, Op.LOAD_NAME
+        CALL, TAIL_CALL, RETURN = Op.CALL, Op.TAIL_CALL, Op.RETURN
+        JUMP, JUMP_IF_FALSE, POP = Op.JUMP, Op.JUMP_IF_FALSE, Op.POP
+        ADD, SUB, MUL, DIV, GREATER_THAN, NEGATE = Op.ADD, Op.SUB, Op.MUL, Op.DIV, Op.GREATER_THAN, Op.NEGATE
+        ADD_CONST, SUB_CONST, MUL_CONST = Op.ADD_CONST, Op.SUB_CONST, Op.MUL_CONST
+        DIV_CONST, GREATER_THAN_CONST = Op.DIV_CONST, Op.GREATER_THAN_CONST
+        BIND, REDECLARE, MAKE_FUNCTION = Op.BIND, Op.REDECLARE, Op.MAKE_FUNCTION
+        PROFILE_ENTER, PROFILE_EXIT, PROFILE_CLOSURE = Op.PROFILE_ENTER, Op.PROFILE_EXIT, Op.PROFILE_CLOSURE
+        KERNEL = Op.KERNEL
+
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        frames = []
+
+        instructions, constants = code.code, code.constants
+        pc = 0
+
+        # Branches are ordered roughly by how often they run
+        while True:
+            op, arg = instructions[pc]
+            pc += 1
+
+            if op == LOAD_LOCAL:
+                push(env.values[arg])
+            elif op == LOAD_CONST:
+                push(constants[arg])
+            elif op == CALL:
+                arg_value = pop()
+                func = pop()
+                if type(func) is Closure and func.interpreter is self:
+                    frames.append((code, pc, env))
+                    code = func.function
+                    instructions, constants = code.code, code.constants
+                    env = Env([arg_value], func.env)
+                    pc = 0
+                elif type(func) is Memo and self.runs(func.func):
+                    key = func.key(arg_value)
+                    value = func.get(key)
+                    if value is MISSING:
+                        # The memo frame stores the result once the call returns
+                        frames.append((code, pc, env))
+                        frames.append((None, func, key))
+                        func = func.func
+                        code = func.function
+                        instructions, constants = code.code, code.constants
+                        env = Env([arg_value], func.env)
+                        pc = 0
+                    else:
+                        push(value)
+                else:
+                    push(func(arg_value))
+            elif op == TAIL_CALL:
+                arg_value = pop()
+                func = pop()
+                if type(func) is Closure and func.interpreter is self:
+                    code = func.function
+                    instructions, constants = code.code, code.constants
+                    env = Env([arg_value], func.env)
+                    pc = 0
+                elif type(func) is Memo and self.runs(func.func):
+                    key = func.key(arg_value)
+                    value = func.get(key)
+                    if value is MISSING:
+                        if self.profiler is not None:
+                            # Profiled as a call, as the Evaluator makes it: the memo
+                            # frame would give the callee a different profiler key, so
+                            # this frame would never exit
+                            frames.append((code, pc, env))
+                        frames.append((None, func, key))
+                        func = func.func
+                        code = func.function
+                        instructions, constants = code.code, code.constants
+                        env = Env([arg_value], func.env)
+                        pc = 0
+                    else:
+                        push(value)
+                else:
+                    push(func(arg_value))
+            elif op == RETURN:
+                if not frames:
+                    return env, pop()
+                code, pc, env = frames.pop()
+                while code is None:  # Memo frame: pc is the Memo, env the cache key
+                    stack[-1] = pc.store(env, stack[-1])
+                    if not frames:
+                        return None, pop()  # Only reached when running a function via call()
+                    code, pc, env = frames.pop()
+                instructions, constants = code.code, code.constants
+            elif op == LOAD_OUTER:
+                depth, slot, name = code.addresses[arg]
+                frame = env
+                while depth:
+                    frame = frame.parent
+                    depth -= 1
+                values = frame.values
+                value = values[slot] if slot < len(values) else UNBOUND
+                if value is UNBOUND:
+                    value = frame.unbound(slot)
+                    if value is UNBOUND:
+                        print(f"[mfp] Unknown variable: {name}", file=sys.stderr)
+                        value = None
+                push(value)
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == KERNEL:
+                push(constants[arg].function(env))
+            elif op == SUB_CONST:
+                stack[-1] = stack[-1] - constants[arg]
+            elif op == ADD:
+                right = pop()
+                stack[-1] = stack[-1] + right
+            elif op == MUL:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif op == GREATER_THAN_CONST:
+                stack[-1] = stack[-1] > constants[arg]
+            elif op == GREATER_THAN:
+                right = pop()
+                stack[-1] = stack[-1] > right
+            elif op == SUB:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif op == ADD_CONST:
+                stack[-1] = stack[-1] + constants[arg]
+            elif op == MUL_CONST:
+                stack[-1] = stack[-1] * constants[arg]
+            elif op == JUMP:
+                pc = arg
+            elif op == DIV:
+                right = pop()
+                stack[-1] = stack[-1] / right
+            elif op == DIV_CONST:
+                stack[-1] = stack[-1] / constants[arg]
+            elif op == NEGATE:
+                stack[-1] = -stack[-1]
+            elif op == POP:
+                pop()
+            elif op == LOAD_NAME:
+                name = code.names[arg]
+                if name in BUILTINS:
+                    push(BUILTINS[name])
+                else:
+                    print(f"[mfp] Unknown variable: {name}", file=sys.stderr)
+                    push(None)
+            elif op == MAKE_FUNCTION:
+                push(Closure(constants[arg], env, self))
+            elif op == BIND:
+                env.define(arg, pop())
+                push(None)
+            elif op == REDECLARE:
+                pop()
+                print(f"[mfp] Redeclaration of variable: {code.names[arg]}", file=sys.stderr)
+                push(None)
+            elif op == PROFILE_ENTER:
+                # A frame entered at the same position as the profiler's current
+                # one has replaced it through a tail call
+                self.profiler.enter(code.name, (id(frames), len(frames)))
+            elif op == PROFILE_EXIT:
+                self.profiler.exit()
+            elif op == PROFILE_CLOSURE:
+                self.profiler.closure_created()
+            else:
+                raise RuntimeError(f"Unknown opcode {op} at {pc - 1}")
+
+
+def main():
+    from tokeniser import Tokeniser
+    from parser import Parser
+    from resolver import Resolver
+
+    source = (
+        'fact := n |-> if n > 0 then n*fact(n-1) else 1\n'
+        'add := x |-> y |-> x + y\n'
+        'print(fact(10))\n'
+        'add(9)(10)\n'
+    )
+
+    tokeniser = Tokeniser(source)
+    tokeniser.tokenise()
+    parser = Parser(tokeniser.tokens)
+    parser.parse()
+    Resolver().resolve(parser.ast)
+
+    env, result = VM().execute(parser.ast, Env())
+    print(result)  # Should print 19
+
+
+if __name__ == "__main__":
+    main()
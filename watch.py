@@ -0,0 +1,331 @@
+import os
+import sys
+import time
+from contextlib import redirect_stderr, redirect_stdout
+
+from ast_nodes import *
+from env import Env, UNBOUND
+from parser import Parser
+from preprocessor import Preprocessor, SourceMap
+from resolver import Resolver
+from specialise import Specialiser
+from tokeniser import Tokeniser
+from typecheck import TypeChecker
+from util import try_read_file
+
+
+POLL_INTERVAL = 0.05  # Seconds between looks at the watched files
+
+
+def file_version(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def global_names(node: ASTNode, bound: frozenset[str] = frozenset()) -> set[str]:
+    # The names whose global bindings can change what `node` means: its free
+    # variables, and the names it binds (which may be redeclarations)
+    if isinstance(node, Var):
+        return set() if node.name in bound else {node.name}
+    if isinstance(node, FunctionDef_):
+        return global_names(node.body, bound | {node.param})
+    names = {node.name} if isinstance(node, Binding) else set()
+    for child in node.children():
+        names |= global_names(child, bound)
+    return names
+
+
+class Unit:
+    """One line of the preprocessed program, and what the last update found
+    out about it. No expression spans a newline, so lines are the unit of
+    change: a line whose text is unchanged is never parsed again.
+    """
+
+    __slots__ = ('text', 'filename', 'line', 'program', 'names', 'slots', 'signature', 'resolved',
+                 'evaluated', 'events')
+
+    def __init__(self, text: str, filename: str | None, line: int):
+        self.text = text
+        self.filename = filename  # Where it was first seen, for syntax errors
+        self.line = line
+        self.program: Program | None = None
+        self.names: tuple[str, ...] = ()          # From global_names, sorted
+        self.slots: dict[str, int] = {}           # Global slots of the bindings it makes
+        self.signature: tuple | None = None       # The global slot each name resolved to, or None
+        self.resolved = False                     # Annotated by the resolver and later passes?
+        self.evaluated = False
+        self.events: list[tuple[str, str]] = []   # What evaluating it wrote, as in parallel.Outcome
+
+    def parse(self, loads: list[str]):
+        # Raises on a syntax error; a bad character is reported by the tokeniser
+        source_map = SourceMap()
+        source_map.begin_run(self.filename, self.line)
+        source_map.end_run(1)
+        source_map.loads = loads
+        lexer = Tokeniser(self.text + '\n', source_map)
+        lexer.tokenise()
+        parser = Parser(lexer.tokens, source_map)
+        parser.parse()
+        if lexer.had_error:
+            return False
+        self.program = parser.ast
+        self.names = tuple(sorted(set().union(*map(global_names, self.program.exprs))))
+        self.resolved = False
+        return True
+
+
+class Tee:
+    # Writes through to sys.stdout or sys.stderr, keeping a copy to replay
+    def __init__(self, events: list, stream: str):
+        self.events = events
+        self.stream = stream
+        self.target = getattr(sys, stream)
+
+    def write(self, text: str):
+        self.events.append((self.stream, text))
+        return self.target.write(text)
+
+    def flush(self):
+        self.target.flush()
+
+
+class UnitResolver(Resolver):
+    # Gives a line's bindings the slots they had before, so that no other
+    # line's values have to move
+    def __init__(self, watcher: 'Watcher'):
+        super().__init__()
+        self.watcher = watcher
+        self.unit: Unit | None = None
+
+    def new_slot(self, name: str) -> int:
+        slot = self.unit.slots.get(name)
+        if slot is None:
+            slot = self.watcher.next_slot
+            self.watcher.next_slot += 1
+        return slot
+
+
+class Watcher:
+    """Keeps a program's output up to date with its files.
+
+    Each update preprocesses the entry file again (included files come from
+    the include cache) and matches the output's lines against the last
+    update's by text, so only new or edited lines are parsed. A line is
+    evaluated again if it is new, if one of its names now resolves to a
+    different binding, or if it reads a binding made by a line being
+    evaluated again; the rest keep their values in the global environment,
+    and the output they wrote last time is replayed in its place. Each
+    update therefore writes what running the program afresh would.
+    """
+
+    def __init__(self, filepath: str, interpreter):
+        self.filepath = filepath
+        self.interpreter = interpreter
+        self.env = Env()
+        self.checker = TypeChecker()  # Keeps the types of the lines not checked again
+        self.units: list[Unit] = []
+        self.lines: list[str] = []                # The preprocessed program, split into lines
+        self.line_units: list[Unit | None] = []   # The Unit for each line
+        self.source_map = SourceMap()
+        self.files: dict[str, tuple[int, int] | None] = {}  # Watched file -> version when last read
+        self.loads: list[str] = []  # Files named by !load, never reordered so a line's text keeps its meaning
+        self.next_slot = 0
+
+    def changed_files(self):
+        return [path for path, version in self.files.items() if file_version(path) != version]
+
+    def update(self):
+        start = time.perf_counter()
+        versions = {path: file_version(path) for path in self.files}
+        preprocessor = Preprocessor()
+        preprocessor.source_map.loads = self.loads
+        try:
+            source = preprocessor.preprocess(try_read_file(self.filepath), self.filepath)
+        except OSError as e:
+            print(f"[mfp] {e}", file=sys.stderr)
+            self.files = versions
+            return
+        for path in preprocessor.included_files | preprocessor.loaded_files:
+            if path not in versions:
+                versions[path] = file_version(path)
+        for path in preprocessor.loaded_files:
+            if versions[path] != self.files.get(path, versions[path]):
+                self.reload(path)
+        self.files = versions
+        if preprocessor.had_error:
+            return
+
+        lines, line_units, parsed = self.match_lines(source, preprocessor.source_map)
+        try:
+            if not all(unit.parse(self.loads) for unit in parsed):
+                return
+        except Exception as e:  # The parser reports syntax errors by raising
+            print(f"[mfp] {e}", file=sys.stderr)
+            return
+        units = [unit for unit in line_units if unit is not None]
+        if len(units) < len(self.units) + len(parsed):
+            kept = set(map(id, units))
+            for unit in self.units:
+                if id(unit) not in kept:
+                    self.forget(unit.slots.values())
+        self.units, self.lines, self.line_units = units, lines, line_units
+        self.source_map = preprocessor.source_map
+
+        dirty = self.resolve()
+        failed = False
+        for unit in dirty:
+            self.checker.check(unit.program)
+            failed |= self.checker.had_error
+        if failed:
+            return  # As in a fresh run nothing is evaluated, and the lines stay dirty until fixed
+        specialiser = Specialiser()
+        for unit in dirty:
+            specialiser.specialise(unit.program)
+
+        evaluated = self.evaluate()
+        elapsed = time.perf_counter() - start
+        print(f"[mfp] Parsed {len(parsed)} and evaluated {evaluated} of {len(units)} lines "
+              f"in {elapsed * 1000:.1f} ms", file=sys.stderr)
+
+    def reload(self, path: str):
+        # A !load file changed: its binding reads it again
+        call = f'!load({self.loads.index(path)})'
+        for unit in self.units:
+            if call in unit.text:
+                unit.evaluated = False
+
+    def forget(self, slots):
+        values = self.env.values
+        for slot in slots:
+            if slot < len(values):
+                values[slot] = UNBOUND
+
+    def match_lines(self, source: str, source_map: SourceMap):
+        # Units for the preprocessed lines (None for blank lines and
+        # comments). Lines before and after the edited ones keep their
+        # Units, and within them a line reuses a Unit with the same text.
+        # Returns them and the new Units, which need parsing.
+        lines, previous_lines = source.split('\n'), self.lines
+        length = min(len(lines), len(previous_lines))
+        start = 0
+        while start < length and lines[start] == previous_lines[start]:
+            start += 1
+        end = 0
+        while end < length - start and lines[-1 - end] == previous_lines[-1 - end]:
+            end += 1
+
+        previous: dict[str, list[Unit]] = {}
+        for unit in reversed(self.line_units[start:len(previous_lines) - end]):
+            if unit is not None:
+                previous.setdefault(unit.text, []).append(unit)
+        middle, parsed = [], []
+        for number in range(start + 1, len(lines) - end + 1):
+            text = lines[number - 1]
+            stripped = text.strip()
+            if not stripped or stripped.startswith('#'):
+                middle.append(None)
+                continue
+            same = previous.get(text)
+            if same:
+                unit = same.pop()
+            else:
+                unit = Unit(text, *source_map.lookup(number))
+                parsed.append(unit)
+            middle.append(unit)
+        line_units = self.line_units[:start] + middle + self.line_units[len(previous_lines) - end:]
+        return lines, line_units, parsed
+
+    def position(self, unit: Unit):
+        filename, line = self.source_map.lookup(self.line_units.index(unit) + 1)
+        return f"{filename}:{line}"
+
+    def resolve(self):
+        # Resolves the lines that must be evaluated again, in order, and
+        # returns them. Bindings always come before the lines that read
+        # them, so one pass finds everything an edit reaches.
+        resolver = UnitResolver(self)
+        defined = resolver.globals
+        changed: set[int] = set()  # Slots being evaluated again
+        dirty = []
+        for unit in self.units:
+            signature = tuple(map(defined.get, unit.names))
+            if unit.evaluated and signature == unit.signature and changed.isdisjoint(signature):
+                defined.update(unit.slots)
+            else:
+                if unit.resolved:
+                    unit.parse(self.loads)  # The last update's passes annotated the tree; start again from the text
+                resolver.unit = unit
+                resolver.resolve(unit.program)
+                unit.resolved = True
+                slots = {expr.name: expr.slot for expr in unit.program.exprs
+                         if isinstance(expr, Binding) and expr.slot is not None}
+                self.forget(slot for slot in unit.slots.values() if slot not in slots.values())
+                unit.slots = slots
+                unit.evaluated = False
+                changed.update(slots.values())
+                dirty.append(unit)
+            unit.signature = signature
+        return dirty
+
+    def evaluate(self):
+        # Evaluates the dirty lines and replays the others, in order. As in
+        # a fresh run, nothing after a line that raises is evaluated.
+        count = 0
+        for unit in self.units:
+            if unit.evaluated:
+                for stream, text in unit.events:
+                    getattr(sys, stream).write(text)
+                continue
+            unit.events = []
+            try:
+                with redirect_stdout(Tee(unit.events, 'stdout')), redirect_stderr(Tee(unit.events, 'stderr')):
+                    self.env, _ = self.interpreter.execute(unit.program, self.env)
+            except Exception as e:
+                print(f"[mfp] {type(e).__name__} at {self.position(unit)}: {e}", file=sys.stderr)
+                break
+            unit.evaluated = True
+            count += 1
+        return count
+
+
+def watch(filepath: str, interpreter, interval: float = POLL_INTERVAL):
+    """Runs a file, then runs it again whenever it or a file it includes or
+    loads changes, until interrupted."""
+    watcher = Watcher(os.path.abspath(filepath), interpreter)
+    watcher.update()
+    count = len(watcher.files)
+    print(f"[mfp] Watching {count} file{'s' * (count != 1)}, Ctrl-C to stop", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(interval)
+            changed = watcher.changed_files()
+            if changed:
+                print(f"[mfp] Changed: {', '.join(sorted(map(os.path.relpath, changed)))}", file=sys.stderr)
+                watcher.update()
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    import tempfile
+    from vm import VM
+
+    with tempfile.TemporaryDirectory() as directory:
+        lib, script = os.path.join(directory, 'lib.mfp'), os.path.join(directory, 'main.mfp')
+        with open(lib, 'w') as f:
+            f.write('square := x |-> x*x\ncube := x |-> x*x*x\n')
+        with open(script, 'w') as f:
+            f.write('!include(lib.mfp)\nprint(square(3))\nprint(cube(3))\n')
+        watcher = Watcher(script, VM())
+        watcher.update()  # 9, 27: evaluated 4 of 4 lines
+
+        with open(lib, 'w') as f:
+            f.write('square := x |-> x*x + 1\ncube := x |-> x*x*x\n')
+        watcher.update()  # 10, 27: evaluated 2 of 4 lines, replaying the second print
+
+
+if __name__ == "__main__":
+    main()